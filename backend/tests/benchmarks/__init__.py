@@ -0,0 +1,73 @@
+"""
+The implementations the optimized code paths replaced, kept as references, with the checks that both give the
+same output and best-of-N timings of both.
+
+The tests run the checks on the small frames and pages in tests/fixtures. The same checks and timings run on
+the local databases from the repository root with:
+
+    python backend/tests/benchmarks <name> [arguments]
+"""
+import os
+import time
+
+import pandas as pd
+
+fixtures_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+
+
+def best_time(run, repeat=3):
+    """
+    Time a callable, keeping the fastest run.
+
+    Parameters:
+    - run (callable): The code to time, called without arguments.
+    - repeat (int): Number of runs.
+
+    Returns:
+    float: The best time in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def load_pages(folder='frames'):
+    """
+    Load the saved HTML pages of a fixture folder.
+
+    Parameters:
+    - folder (str): The folder inside tests/fixtures.
+
+    Returns:
+    dict: The HTML sources keyed by file name, in name order.
+    """
+    path = os.path.join(fixtures_folder, folder)
+    pages = {}
+    for name in sorted(os.listdir(path)):
+        if name.endswith('.html'):
+            with open(os.path.join(path, name), encoding='utf-8') as file:
+                pages[name] = file.read()
+    return pages
+
+
+def load_frame(name, folder='statements'):
+    """
+    Load a saved statements frame of a fixture folder with the types the stages read from SQLite:
+    text columns as strings, quarters as datetimes and values as floats.
+
+    Parameters:
+    - name (str): The CSV file name without extension.
+    - folder (str): The folder inside tests/fixtures.
+
+    Returns:
+    DataFrame: The frame.
+    """
+    df = pd.read_csv(os.path.join(fixtures_folder, folder, f"{name}.csv"), dtype=str, keep_default_na=False)
+    if 'quarter' in df.columns:
+        df['quarter'] = pd.to_datetime(df['quarter'])
+    if 'value' in df.columns:
+        df['value'] = pd.to_numeric(df['value'], errors='coerce').astype(float)
+    return df
@@ -0,0 +1,210 @@
+import os
+import sys
+
+# Run as 'python backend/tests/benchmarks <name>' from the repository root, where the database paths start
+tests_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[0] = tests_folder
+sys.path.insert(0, os.path.dirname(tests_folder))
+
+from utils import system
+from utils import settings
+
+import benchmarks
+from benchmarks import table_parser
+from benchmarks import decumulation
+from benchmarks import criteria_engine
+from benchmarks import formula_compiler
+from benchmarks import ratios_engine
+from benchmarks import share_counts
+from benchmarks import rolling_indicators
+
+
+def load_sector(files, arguments, loader=None):
+    """
+    Load one sector of a stage database, the largest unless one is named.
+
+    Parameters:
+    - files (str): The name part of the database file, for example settings.statements_file.
+    - arguments (list): The sector name, if given, first.
+    - loader (object): The stage whose load_data reads the database. Defaults to MathTransformation.
+
+    Returns:
+    tuple: (sector, DataFrame), or (None, None) if the stage has no data.
+    """
+    if loader is None:
+        from utils import math_transformation
+        loader = math_transformation.MathTransformation()
+
+    dict_frames = loader.load_data(files)
+    if not dict_frames:
+        print(f"No {files} data to benchmark on.")
+        return None, None
+    sector = arguments[0] if arguments else max(dict_frames, key=lambda s: len(dict_frames[s]))
+    return sector, dict_frames[sector]
+
+
+def run_table_parser(arguments):
+    """
+    Benchmark the frame parsers on the fixture pages, on the given HTML files, or on the page cache with 'cache'.
+
+    Parameters:
+    - arguments (list): HTML file paths, or 'cache'.
+
+    Returns:
+    dict: The benchmark report.
+    """
+    if arguments == ['cache']:
+        pages = table_parser.load_cached_pages()
+    elif arguments:
+        pages = {}
+        for path in arguments:
+            with open(path, encoding='utf-8') as file:
+                pages[path] = file.read()
+    else:
+        pages = benchmarks.load_pages('frames')
+
+    if not pages:
+        print('No financial statement frames to benchmark on.')
+        return None
+    return table_parser.benchmark(pages)
+
+
+def run_decumulation(arguments):
+    """
+    Benchmark the decumulation engine on a sector of the statements database.
+
+    Parameters:
+    - arguments (list): The sector name, if given.
+
+    Returns:
+    dict: The benchmark report.
+    """
+    sector, df = load_sector(settings.statements_file, arguments)
+    if df is None:
+        return None
+    return decumulation.benchmark(decumulation.with_year_and_month(df))
+
+
+def run_criteria_engine(arguments):
+    """
+    Benchmark the criteria engine on a sector of the math database.
+
+    Parameters:
+    - arguments (list): The sector name, if given.
+
+    Returns:
+    dict: The benchmark report.
+    """
+    from utils import statements_standardize
+
+    sector, df = load_sector(settings.statements_file_math, arguments, statements_standardize.StandardizedReport())
+    if df is None:
+        return None
+    return criteria_engine.benchmark(df)
+
+
+def load_standard(arguments):
+    """
+    Load a sector of the standard database as the financial ratios read it, share counts broadcast.
+
+    Parameters:
+    - arguments (list): The sector name, if given.
+
+    Returns:
+    tuple: (FinancialRatios, DataFrame), or (FinancialRatios, None) if there is no data.
+    """
+    from utils import financial_ratios
+
+    ratios = financial_ratios.FinancialRatios()
+    sector, df = load_sector(settings.statements_standard, arguments, ratios)
+    return ratios, df
+
+
+def run_formula_compiler(arguments):
+    """
+    Benchmark the compiled indicators on a sector of the standard database.
+
+    Parameters:
+    - arguments (list): The sector name, if given.
+
+    Returns:
+    dict: The benchmark report.
+    """
+    ratios, df = load_standard(arguments)
+    if df is None:
+        return None
+    return formula_compiler.benchmark(ratios.adjust_dfs_types(df))
+
+
+def run_ratios_engine(arguments):
+    """
+    Benchmark the account matrix on a sector of the standard database.
+
+    Parameters:
+    - arguments (list): The sector name, if given.
+
+    Returns:
+    dict: The benchmark report.
+    """
+    ratios, df = load_standard(arguments)
+    if df is None:
+        return None
+    return ratios_engine.benchmark(ratios.adjust_dfs_types(df))
+
+
+def run_share_counts(arguments):
+    """
+    Benchmark the share count broadcast on a sector of the standard database.
+
+    Parameters:
+    - arguments (list): The sector name, if given.
+
+    Returns:
+    dict: The benchmark report.
+    """
+    ratios, df = load_standard(arguments)
+    if df is None:
+        return None
+    return share_counts.benchmark(df)
+
+
+def run_rolling_indicators(arguments):
+    """
+    Benchmark the quarter windows on a sector of the standard database and check them on the net revenue.
+
+    Parameters:
+    - arguments (list): The sector name, if given.
+
+    Returns:
+    dict: The benchmark report.
+    """
+    from utils import rolling_indicators as windows
+
+    ratios, df = load_standard(arguments)
+    if df is None:
+        return None
+    df = ratios.adjust_dfs_types(df)
+    result = rolling_indicators.benchmark(df)
+    for function in windows.window_functions:
+        print(function, rolling_indicators.compare(df, '03.01', function))
+    return result
+
+
+runners = {
+    'table_parser': run_table_parser,
+    'decumulation': run_decumulation,
+    'criteria_engine': run_criteria_engine,
+    'formula_compiler': run_formula_compiler,
+    'ratios_engine': run_ratios_engine,
+    'share_counts': run_share_counts,
+    'rolling_indicators': run_rolling_indicators,
+}
+
+if __name__ == "__main__":
+    try:
+        if len(sys.argv) < 2 or sys.argv[1] not in runners:
+            print(f"Usage: python backend/tests/benchmarks <{'|'.join(runners)}> [arguments]")
+        else:
+            runners[sys.argv[1]](sys.argv[2:])
+    except Exception as e:
+        system.log_error(e)
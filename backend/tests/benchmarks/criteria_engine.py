@@ -0,0 +1,154 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils import criteria_engine
+from utils import statements_standardize
+
+from benchmarks import best_time
+
+
+def legacy_apply_criteria(df, criteria, parent_mask=None):
+    """
+    The recursive implementation replaced by criteria_engine.CriteriaEngine: filter the whole frame for a criterion,
+    write its target and provenance on the matching rows, then recurse into the sub-criteria on the rows whose
+    accounts start with a matched account.
+
+    Parameters:
+    - df (DataFrame): The statements, modified in place.
+    - criteria (dict): A criterion with 'target', 'filter' and optional 'sub_criteria'.
+    - parent_mask (Series): The rows the criterion may match. None for every row.
+
+    Returns:
+    DataFrame: The statements with the standard and provenance columns.
+    """
+    mask = pd.Series([True] * len(df)) if parent_mask is None else parent_mask.copy()
+
+    condition_map = {
+        'equals': lambda col, val: col == val.lower(),
+        'not_equals': lambda col, val: col != val.lower(),
+        'startswith': lambda col, val: col.astype(str).str.startswith(val),
+        'not_startswith': lambda col, val: ~col.str.startswith(tuple(map(str.lower, val))),
+        'endswith': lambda col, val: col.str.endswith(tuple(map(str.lower, val))),
+        'not_endswith': lambda col, val: ~col.str.endswith(tuple(map(str.lower, val))),
+        'contains_all': lambda col, val: col.apply(lambda x: all(term in x.lower() for term in val) if pd.notna(x) else False),
+        'contains_any': lambda col, val: col.str.contains('|'.join(map(re.escape, val)), case=False, na=False),
+        'contains_none': lambda col, val: ~col.str.contains('|'.join(map(re.escape, val)), case=False, na=False),
+        'not_contains': lambda col, val: col.apply(lambda x: not all(term in x.lower() for term in val) if pd.notna(x) else True),
+        'not_contains_any': lambda col, val: col.apply(lambda x: all(term not in x.lower() for term in val) if pd.notna(x) else True),
+        'level': lambda col, val: (col.str.count(r'\.') + 1) == int(val),
+    }
+
+    crits = []
+    for filter_column, filter_condition, filter_value in criteria['filter']:
+        crits.append([filter_column, filter_condition, filter_value])
+        if filter_condition in ['contains_any', 'contains_none', 'contains_all', 'not_contains_all'] and not isinstance(filter_value, list):
+            filter_value = [filter_value]
+
+        column = df[filter_column].str.lower().str.strip() if df[filter_column].dtype == 'O' else df[filter_column]
+        if filter_condition not in condition_map:
+            raise ValueError(f"Unknown filter condition: {filter_condition}")
+        mask &= condition_map[filter_condition](column, filter_value)
+
+    for column in criteria_engine.output_columns + criteria_engine.audit_columns:
+        if column not in df.columns:
+            df[column] = ''
+
+    account, description = criteria['target'].split(' - ')
+    df.loc[mask, 'account_standard'] = account
+    df.loc[mask, 'description_standard'] = description
+    df.loc[mask, 'standard_criteria'] = ' | '.join([f"{c[0]} {c[1]} {c[2]}" for c in crits])
+
+    items_example = df.loc[mask, ['account', 'description']].drop_duplicates().apply(lambda row: f"{row['account']} - {row['description']}", axis=1).tolist()
+    df.loc[mask, 'items_match'] = ', '.join(items_example)
+
+    for sub in criteria.get('sub_criteria', []):
+        sub_accounts = df.loc[mask, 'account'].unique()
+        sub_mask = df['account'].apply(lambda x: any(x.startswith(acct) for acct in sub_accounts))
+        legacy_apply_criteria(df, sub, parent_mask=sub_mask)
+
+    return df
+
+
+def legacy_apply_criteria_tree(df, criteria_tree):
+    """
+    Apply every criterion of a tree with the recursive implementation, in order.
+
+    Parameters:
+    - df (DataFrame): The statements, modified in place.
+    - criteria_tree (list): The criteria.
+
+    Returns:
+    DataFrame: The statements with the standard and provenance columns.
+    """
+    for criteria in criteria_tree:
+        df = legacy_apply_criteria(df, criteria)
+    return df
+
+
+def compare(df, sections=None):
+    """
+    Check the engine against the recursive implementation on the same statements.
+
+    Parameters:
+    - df (DataFrame): One sector's statements.
+    - sections (dict): Criteria trees keyed by section name. Defaults to every standardization section.
+
+    Returns:
+    dict: Number of rows and of mismatches per standard and provenance column.
+    """
+    sections = sections or statements_standardize.StandardizedReport().get_standardization_sections()
+
+    legacy = df.reset_index(drop=True).copy()
+    engine_df = df.reset_index(drop=True).copy()
+    engine = criteria_engine.CriteriaEngine(engine_df, audit=True)
+    for section_name, criteria_tree in sections.items():
+        legacy_apply_criteria_tree(legacy, criteria_tree)
+        engine.apply_tree(criteria_tree, '', section_name)
+    engine_df = pd.concat([engine_df, engine.provenance()], axis=1)
+
+    result = {'rows': len(df)}
+    for column in criteria_engine.output_columns + criteria_engine.audit_columns:
+        old = legacy[column].fillna('').astype(str).to_numpy() if column in legacy.columns else np.full(len(df), '')
+        new = engine_df[column].fillna('').astype(str).to_numpy() if column in engine_df.columns else np.full(len(df), '')
+        result[column] = int(np.sum(old != new))
+    return result
+
+
+def benchmark(df, sections=None, repeat=1):
+    """
+    Time the engine against the recursive implementation.
+
+    Parameters:
+    - df (DataFrame): One sector's statements.
+    - sections (dict): Criteria trees keyed by section name. Defaults to every standardization section.
+    - repeat (int): Number of runs; the fastest one is reported.
+
+    Returns:
+    dict: Best seconds for each implementation, the speedup and the comparison report.
+    """
+    sections = sections or statements_standardize.StandardizedReport().get_standardization_sections()
+
+    def run_legacy():
+        legacy = df.reset_index(drop=True).copy()
+        for criteria_tree in sections.values():
+            legacy_apply_criteria_tree(legacy, criteria_tree)
+
+    def run_engine():
+        engine = criteria_engine.CriteriaEngine(df.reset_index(drop=True).copy())
+        for section_name, criteria_tree in sections.items():
+            engine.apply_tree(criteria_tree, '', section_name)
+
+    timings = {name: best_time(run, repeat) for name, run in (('legacy', run_legacy), ('engine', run_engine))}
+
+    result = {
+        'rows': len(df),
+        'legacy': timings['legacy'],
+        'engine': timings['engine'],
+        'speedup': timings['legacy'] / timings['engine'] if timings['engine'] else 0.0,
+        'comparison': compare(df, sections),
+    }
+    print(f"{result['rows']} rows: legacy {result['legacy']:.3f}s, engine {result['engine']:.3f}s "
+          f"({result['speedup']:.1f}x), {result['comparison']}")
+    return result
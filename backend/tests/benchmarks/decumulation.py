@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+
+from utils import decumulation
+from utils import math_transformation
+
+from benchmarks import best_time
+
+key_columns = ['company_name', 'type', 'frame', 'account', 'year']
+
+
+def legacy_create_pivot(df):
+    """
+    The pivot the year-end and cumulative adjustments used before the decumulation engine: the 'value' column
+    with one column per quarter month, merged back with the other columns of the original frame.
+
+    Parameters:
+    - df (DataFrame): Statements with 'year' and 'month' columns.
+
+    Returns:
+    DataFrame: One row per (company, type, frame, account, year) with the quarters as columns 3, 6, 9 and 12.
+    """
+    value_pivot = df.pivot_table(
+        index=key_columns,
+        columns='month',
+        values='value',
+        aggfunc='first',
+        observed=True
+    ).reset_index()
+    value_pivot.columns.name = None
+
+    # Find the closest available month for each target quarter
+    available_months = set(value_pivot.columns) - set(key_columns)
+    closest_months = {}
+    for target in [3, 6, 9, 12]:
+        closest_month = min(available_months, key=lambda x: abs(x - target), default=None)
+        if closest_month:
+            closest_months[target] = closest_month
+
+    value_pivot = value_pivot[key_columns + list(closest_months.values())]
+    value_pivot = value_pivot.rename(columns={month: target for target, month in closest_months.items()})
+
+    final_df = pd.merge(
+        df.drop(columns=['nsd', 'version', 'value', 'quarter', 'month']),
+        value_pivot,
+        on=key_columns,
+        how='left'
+    )
+    return final_df.drop_duplicates(subset=key_columns)
+
+
+def legacy_unpivot(df_pivot, df):
+    """
+    Turn the quarter columns of the pivot back into rows and merge them onto the original rows by quarter date.
+
+    Parameters:
+    - df_pivot (DataFrame): The pivot, with the adjusted quarters.
+    - df (DataFrame): The original statements.
+
+    Returns:
+    DataFrame: The original rows with the adjusted 'value' column.
+    """
+    unpivoted_df = df_pivot.melt(
+        id_vars=key_columns,
+        value_vars=[3, 6, 9, 12],
+        var_name='month',
+        value_name='value'
+    )
+    unpivoted_df['quarter'] = pd.to_datetime(unpivoted_df['year'].astype(str) + '-' + unpivoted_df['month'].astype(str) + '-01') + pd.offsets.MonthEnd(0)
+    unpivoted_df = unpivoted_df.sort_values(by=['company_name', 'quarter']).reset_index(drop=True)
+
+    return pd.merge(
+        unpivoted_df,
+        df[['nsd', 'sector', 'subsector', 'segment', 'company_name', 'quarter', 'version', 'type', 'frame', 'account', 'description']],
+        on=['company_name', 'type', 'frame', 'account', 'quarter'],
+        how='right'
+    )[df.columns]
+
+
+def legacy_adjust_year_end_balance(df):
+    """
+    The pivot/unpivot year-end adjustment replaced by decumulation.decumulate_year_end: Q4 = 12M - (9M + 6M + 3M).
+
+    Parameters:
+    - df (DataFrame): Statements of the year-end accounts.
+
+    Returns:
+    DataFrame: The rows with the adjusted values.
+    """
+    df_pivot = legacy_create_pivot(df.copy())
+    df_pivot[12] = df_pivot[12] - (df_pivot[9] + df_pivot[6] + df_pivot[3])
+    return legacy_unpivot(df_pivot, df)
+
+
+def legacy_adjust_cumulative_quarter_balances(df):
+    """
+    The pivot/unpivot cumulative adjustment replaced by decumulation.decumulate_cumulative.
+
+    Parameters:
+    - df (DataFrame): Statements of the cumulative accounts.
+
+    Returns:
+    DataFrame: The rows with the adjusted values.
+    """
+    df_pivot = legacy_create_pivot(df.copy())
+    df_pivot[6] = df_pivot[6] - df_pivot[3]
+    df_pivot[9] = df_pivot[9] - (df_pivot[6] + df_pivot[3])
+    df_pivot[12] = df_pivot[12] - (df_pivot[9] + df_pivot[6] + df_pivot[3])
+    return legacy_unpivot(df_pivot, df)
+
+
+def with_year_and_month(df):
+    """
+    Add the 'year' and 'month' columns the math stage derives from the quarter.
+
+    Parameters:
+    - df (DataFrame): Statements with a datetime 'quarter' column.
+
+    Returns:
+    DataFrame: A copy with 'year' and 'month'.
+    """
+    df = df.copy()
+    df['year'] = df['quarter'].dt.year
+    df['month'] = df['quarter'].dt.month
+    return df
+
+
+def groups(df):
+    """
+    Split statements into the year-end and cumulative groups the way the math stage does.
+
+    Parameters:
+    - df (DataFrame): Statements with 'year' and 'month' columns.
+
+    Returns:
+    tuple: (year-end statements, cumulative statements)
+    """
+    _, year_end, cumulative = math_transformation.MathTransformation().split_into_groups(df)
+    return year_end, cumulative
+
+
+def compare(df):
+    """
+    Check the decumulation engine against the pivot/unpivot implementation on the same statements.
+
+    Parameters:
+    - df (DataFrame): Statements with 'year' and 'month' columns.
+
+    Returns:
+    dict: Number of rows and of value mismatches for the year-end and cumulative adjustments.
+    """
+    year_end, cumulative = groups(df)
+
+    report = {}
+    for name, group, engine, legacy in (
+        ('year_end', year_end, decumulation.decumulate_year_end, legacy_adjust_year_end_balance),
+        ('cumulative', cumulative, decumulation.decumulate_cumulative, legacy_adjust_cumulative_quarter_balances),
+    ):
+        new = engine(group)['value'].to_numpy(dtype=float)
+        old = legacy(group)['value'].to_numpy(dtype=float)
+        if len(new) != len(old):
+            mismatches = len(group)
+        else:
+            mismatches = int(np.sum(~np.isclose(new, old, equal_nan=True)))
+        report[name] = {'rows': len(group), 'mismatches': mismatches}
+
+    return report
+
+
+def benchmark(df, repeat=3):
+    """
+    Time the decumulation engine against the pivot/unpivot implementation.
+
+    Parameters:
+    - df (DataFrame): Statements with 'year' and 'month' columns.
+    - repeat (int): Number of runs; the fastest one is reported.
+
+    Returns:
+    dict: Best seconds for each implementation, the speedup and the comparison report.
+    """
+    year_end, cumulative = groups(df)
+
+    def run_engine():
+        decumulation.decumulate_year_end(year_end)
+        decumulation.decumulate_cumulative(cumulative)
+
+    def run_legacy():
+        legacy_adjust_year_end_balance(year_end)
+        legacy_adjust_cumulative_quarter_balances(cumulative)
+
+    timings = {name: best_time(run, repeat) for name, run in (('legacy', run_legacy), ('engine', run_engine))}
+
+    result = {
+        'rows': len(year_end) + len(cumulative),
+        'legacy': timings['legacy'],
+        'engine': timings['engine'],
+        'speedup': timings['legacy'] / timings['engine'] if timings['engine'] else 0.0,
+        'comparison': compare(df),
+    }
+    print(f"{result['rows']} rows: legacy {result['legacy']:.3f}s, engine {result['engine']:.3f}s "
+          f"({result['speedup']:.1f}x), {result['comparison']}")
+    return result
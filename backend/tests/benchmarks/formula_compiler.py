@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from utils import categories
+from utils import formula_compiler
+from utils import financial_ratios
+
+from benchmarks import best_time
+
+
+def legacy_add_indicators(df, frame_name, indicator_list):
+    """
+    The per-list implementation replaced by FinancialRatios.add_indicators: pivot the accounts, apply each
+    recursive Formula to the pivot, and merge the metadata of each company, type and quarter onto the new rows.
+
+    Parameters:
+    - df (DataFrame): One sector's standard statements, after FinancialRatios.adjust_dfs_types.
+    - frame_name (str): The 'frame' of the new rows.
+    - indicator_list (list): The indicator definitions.
+
+    Returns:
+    DataFrame: The statements followed by the indicator rows, one block per indicator.
+    """
+    pivot_df = df.pivot_table(index=['company_name', 'type', 'quarter'], columns='account', values='value',
+                              aggfunc='sum', fill_value=0, observed=True)
+    pivot_df.columns = pivot_df.columns.astype(object)
+    pivot_df = pivot_df.reset_index()
+
+    for indicator in indicator_list:
+        try:
+            pivot_df[indicator['description']] = indicator['formula'](pivot_df)
+        except Exception:
+            pivot_df[indicator['description']] = np.nan  # Missing accounts give an empty indicator
+
+    metadata = df[['company_name', 'type', 'quarter', 'nsd', 'sector', 'subsector', 'segment', 'version']].drop_duplicates(
+        subset=['company_name', 'type', 'quarter'], keep='first')
+
+    new_rows = []
+    for indicator in indicator_list:
+        description = indicator['description']
+        indicator_values = pivot_df[['company_name', 'type', 'quarter', description]].rename(columns={description: 'value'})
+        indicator_values['account'] = indicator['account']
+        indicator_values['description'] = description
+        indicator_values['frame'] = frame_name
+        indicator_row = indicator_values.merge(metadata, on=['company_name', 'type', 'quarter'], how='left')
+        new_rows.append(indicator_row[['nsd', 'sector', 'subsector', 'segment', 'company_name', 'quarter',
+                                       'version', 'type', 'frame', 'account', 'description', 'value']])
+
+    new_rows_df = pd.concat(new_rows, ignore_index=True) if new_rows else pd.DataFrame(columns=df.columns)
+    return categories.registry.concat([df, new_rows_df], ignore_index=True)
+
+
+def add_legacy_indicators(df, sections):
+    """
+    Add every indicator list with the per-list implementation, in order.
+
+    Parameters:
+    - df (DataFrame): One sector's standard statements, after FinancialRatios.adjust_dfs_types.
+    - sections (dict): Indicator lists keyed by frame name.
+
+    Returns:
+    DataFrame: The statements and the indicator rows of every list.
+    """
+    for frame, indicators in sections.items():
+        df = legacy_add_indicators(df, frame, indicators)
+    return df
+
+
+def compare(df, sections=None):
+    """
+    Check the one-pass indicators against adding each list with the recursive Formula classes.
+
+    Parameters:
+    - df (DataFrame): One sector's standard statements, after FinancialRatios.adjust_dfs_types.
+    - sections (dict): Indicator lists keyed by frame name. Defaults to every indicator list.
+
+    Returns:
+    dict: Number of rows, of value mismatches and of rows whose keys differ.
+    """
+    ratios = financial_ratios.FinancialRatios()
+    sections = sections or ratios.get_indicator_sections()
+
+    legacy = add_legacy_indicators(df, sections)
+    new = ratios.add_indicators(df, sections)
+
+    if len(legacy) != len(new):
+        return {'rows': len(new), 'mismatches': len(new), 'key_mismatches': abs(len(new) - len(legacy))}
+
+    # Both add the same rows in the same order: the statements, then each list's indicators
+    keys = ['company_name', 'type', 'quarter', 'frame', 'account']
+    legacy_keys = categories.registry.decode(legacy[keys].copy()).astype(str).to_numpy()
+    new_keys = categories.registry.decode(new[keys].copy()).astype(str).to_numpy()
+    values = ~np.isclose(new['value'].to_numpy(dtype=float), legacy['value'].to_numpy(dtype=float), equal_nan=True)
+    return {
+        'rows': len(new),
+        'mismatches': int(values.sum()),
+        'key_mismatches': int((legacy_keys != new_keys).any(axis=1).sum()),
+    }
+
+
+def benchmark(df, sections=None, repeat=3):
+    """
+    Time the one-pass indicators against adding each list with the recursive Formula classes.
+
+    Parameters:
+    - df (DataFrame): One sector's standard statements, after FinancialRatios.adjust_dfs_types.
+    - sections (dict): Indicator lists keyed by frame name. Defaults to every indicator list.
+    - repeat (int): Number of runs; the fastest one is reported.
+
+    Returns:
+    dict: Best seconds for each implementation, the speedup, the graph size and the comparison report.
+    """
+    ratios = financial_ratios.FinancialRatios()
+    sections = sections or ratios.get_indicator_sections()
+
+    timings = {name: best_time(run, repeat) for name, run in (
+        ('legacy', lambda: add_legacy_indicators(df, sections)),
+        ('dag', lambda: ratios.add_indicators(df, sections)),
+    )}
+
+    result = {
+        'rows': len(df),
+        'legacy': timings['legacy'],
+        'dag': timings['dag'],
+        'speedup': timings['legacy'] / timings['dag'] if timings['dag'] else 0.0,
+        'graph': formula_compiler.compile_indicators(sections).stats(),
+        'comparison': compare(df, sections),
+    }
+    print(f"{result['rows']} rows: legacy {result['legacy']:.3f}s, dag {result['dag']:.3f}s "
+          f"({result['speedup']:.1f}x), {result['graph']}, {result['comparison']}")
+    return result
@@ -0,0 +1,84 @@
+import numpy as np
+
+from utils import ratios_engine
+from utils import financial_ratios
+
+from benchmarks import best_time
+
+
+def pivot_accounts(df):
+    """
+    The pivot_table the account matrix replaces: one row per company, type and quarter, one column per account.
+
+    Parameters:
+    - df (DataFrame): One sector's statements, after FinancialRatios.adjust_dfs_types.
+
+    Returns:
+    DataFrame: The summed values, 0 where an account is missing.
+    """
+    pivot_df = df.pivot_table(index=ratios_engine.RatiosEngine.keys, columns='account', values='value',
+                              aggfunc='sum', fill_value=0, observed=True)
+    pivot_df.columns = pivot_df.columns.astype(object)
+    return pivot_df
+
+
+def compare(df, sections=None):
+    """
+    Check the account matrix against pivot_table, the reshaping it replaces.
+
+    Parameters:
+    - df (DataFrame): One sector's statements, after FinancialRatios.adjust_dfs_types.
+    - sections (dict): Indicator lists keyed by frame name. Defaults to every indicator list.
+
+    Returns:
+    dict: Number of entities and accounts, entities in another order and differing cells.
+    """
+    sections = sections or financial_ratios.FinancialRatios().get_indicator_sections()
+    engine = ratios_engine.RatiosEngine(df, sections)
+
+    pivot_df = pivot_accounts(df)
+    pivot_keys = pivot_df.index.to_frame(index=False).astype(str).to_numpy()
+    engine_keys = engine.entities()[ratios_engine.RatiosEngine.keys].astype(str).to_numpy()
+    expected = pivot_df.reindex(columns=engine.accounts).to_numpy(dtype=float)
+
+    same_shape = expected.shape == engine.matrix.shape
+    return {
+        'entities': engine.rows,
+        'accounts': len(engine.accounts),
+        'key_mismatches': int((pivot_keys != engine_keys).any(axis=1).sum()) if same_shape else abs(len(pivot_keys) - len(engine_keys)),
+        'mismatches': int((~np.isclose(expected, engine.matrix)).sum()) if same_shape else expected.size,
+    }
+
+
+def benchmark(df, sections=None, repeat=3):
+    """
+    Time building the account matrix against the pivot_table it replaces.
+
+    Parameters:
+    - df (DataFrame): One sector's statements, after FinancialRatios.adjust_dfs_types.
+    - sections (dict): Indicator lists keyed by frame name. Defaults to every indicator list.
+    - repeat (int): Number of runs; the fastest one is reported.
+
+    Returns:
+    dict: Best seconds for each reshaping, the speedup, the evaluation time and the comparison report.
+    """
+    sections = sections or financial_ratios.FinancialRatios().get_indicator_sections()
+    engine = ratios_engine.RatiosEngine(df, sections)
+
+    timings = {name: best_time(run, repeat) for name, run in (
+        ('pivot', lambda: pivot_accounts(df).reset_index()),
+        ('matrix', lambda: ratios_engine.RatiosEngine(df, sections)),
+        ('evaluate', engine.evaluate),
+    )}
+
+    result = {
+        'rows': len(df),
+        'pivot': timings['pivot'],
+        'matrix': timings['matrix'],
+        'evaluate': timings['evaluate'],
+        'speedup': timings['pivot'] / timings['matrix'] if timings['matrix'] else 0.0,
+        'comparison': compare(df, sections),
+    }
+    print(f"{result['rows']} rows: pivot {result['pivot']:.3f}s, matrix {result['matrix']:.3f}s "
+          f"({result['speedup']:.1f}x), evaluate {result['evaluate']:.3f}s, {result['comparison']}")
+    return result
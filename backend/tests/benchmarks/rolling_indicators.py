@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from utils import settings
+from utils import rolling_indicators
+
+from benchmarks import best_time
+
+
+def compare(df, account, function='sum', periods=4):
+    """
+    Check a window of one account against pandas rolling over each series, reindexed to every quarter.
+
+    Parameters:
+    - df (DataFrame): Statements with 'company_name', 'type', 'quarter', 'account' and 'value' columns.
+    - account (str): The account.
+    - function (str): 'sum', 'mean' or 'growth'.
+    - periods (int): The window length in quarters.
+
+    Returns:
+    dict: Number of rows, of them with a window, and of mismatches.
+    """
+    keys = ['company_name', 'type']
+    rows = df[df['account'] == account].groupby(keys + ['quarter'], observed=True)['value'].sum().reset_index()
+    windows = rolling_indicators.QuarterWindows.from_frame(rows, keys)
+    new = windows.apply(function, periods, rows['value'].to_numpy(dtype=float))
+
+    # Reference: every series on a full quarterly calendar, so missing quarters break the windows
+    rows['number'] = rolling_indicators.quarter_number(rows['quarter'])
+    expected = np.full(len(rows), np.nan)
+    for _, series in rows.groupby(keys, observed=True):
+        calendar = pd.Series(np.nan, index=np.arange(series['number'].min(), series['number'].max() + 1))
+        calendar.loc[series['number'].to_numpy()] = series['value'].to_numpy(dtype=float)
+        if function == 'sum':
+            result = calendar.rolling(periods, min_periods=periods).sum()
+        elif function == 'mean':
+            result = calendar.rolling(periods, min_periods=periods).mean()
+        else:
+            earlier = calendar.shift(periods)
+            result = ((calendar - earlier) / earlier.abs()).where(earlier != 0)
+        expected[rows.index.get_indexer(series.index)] = result.loc[series['number'].to_numpy()].to_numpy()
+
+    return {
+        'rows': len(rows),
+        'windows': int((~np.isnan(new)).sum()),
+        'mismatches': int((~np.isclose(new, expected, equal_nan=True)).sum()),
+    }
+
+
+def benchmark(df, accounts=None, periods=4, repeat=3):
+    """
+    Time the trailing twelve months of every account against pandas grouped rolling sums.
+
+    Parameters:
+    - df (DataFrame): Statements with 'company_name', 'type', 'quarter', 'account' and 'value' columns.
+    - accounts (list): The accounts. Defaults to the income statement, cash flow and value added accounts.
+    - periods (int): The window length in quarters.
+    - repeat (int): Number of runs; the fastest one is reported.
+
+    Returns:
+    dict: Best seconds for each implementation and the speedup.
+    """
+    prefixes = tuple(settings.year_end_accounts + settings.cumulative_quarter_accounts)
+    accounts = accounts or sorted(a for a in pd.unique(df['account'].astype(str)) if a.lstrip('0').startswith(prefixes))
+    keys = ['company_name', 'type', 'quarter']
+    pivot_df = df[df['account'].isin(accounts)].pivot_table(index=keys, columns='account', values='value',
+                                                            aggfunc='sum', fill_value=0, observed=True).reset_index()
+    matrix = pivot_df[[column for column in pivot_df.columns if column not in keys]].to_numpy(dtype=float)
+
+    def run_windows():
+        rolling_indicators.QuarterWindows.from_frame(pivot_df).apply('sum', periods, matrix)
+
+    def run_pandas():
+        # Consecutive rows only; pandas has no notion of a missing quarter here
+        pivot_df.groupby(['company_name', 'type'], observed=True)[list(pivot_df.columns[len(keys):])].rolling(periods, min_periods=periods).sum()
+
+    timings = {name: best_time(run, repeat) for name, run in (('pandas', run_pandas), ('windows', run_windows))}
+
+    result = {
+        'rows': len(pivot_df),
+        'accounts': matrix.shape[1],
+        'pandas': timings['pandas'],
+        'windows': timings['windows'],
+        'speedup': timings['pandas'] / timings['windows'] if timings['windows'] else 0.0,
+    }
+    print(f"{result['rows']} quarters x {result['accounts']} accounts: pandas {result['pandas']:.3f}s, "
+          f"windows {result['windows']:.3f}s ({result['speedup']:.1f}x)")
+    return result
@@ -0,0 +1,95 @@
+import pandas as pd
+
+from utils import categories
+from utils import share_counts
+
+from benchmarks import best_time
+
+
+def legacy_adjust_dfs_types(df, source_types=['Dados da Empresa'], target_types=['DFs Consolidadas', 'DFs Individuais']):
+    """
+    The merge-and-sort implementation replaced by share_counts.ShareCounts.broadcast: copy the rows of the source
+    types to every target type the same company and quarter has, drop the source rows and sort the result.
+
+    Parameters:
+    - df (DataFrame): One sector's standard statements.
+    - source_types (list): Types of the rows to copy.
+    - target_types (list): Types the rows are copied to.
+
+    Returns:
+    DataFrame: The statements without the source rows, plus the copies.
+    """
+    existing_combinations = {}
+    for target in target_types:
+        existing_combinations[target] = df[df['type'] == target][['company_name', 'quarter']].drop_duplicates()
+
+    all_duplicated_dfs = []
+    for source_type in source_types:
+        source_df = df[df['type'] == source_type].copy()
+        for target in target_types:
+            to_duplicate = source_df.merge(existing_combinations[target], on=['company_name', 'quarter'], how='inner', suffixes=('', '_target'))
+            if not to_duplicate.empty:
+                duplicated = to_duplicate.copy()
+                duplicated['type'] = target
+                all_duplicated_dfs.append(duplicated)
+
+    duplicated_df = pd.concat(all_duplicated_dfs, ignore_index=True) if all_duplicated_dfs else pd.DataFrame(columns=df.columns)
+    df_filtered = df[~df['type'].isin(source_types)].copy()
+    if not duplicated_df.empty:
+        df_updated = categories.registry.concat([df_filtered, duplicated_df], ignore_index=True)
+    else:
+        df_updated = df_filtered.copy()
+
+    return df_updated.reset_index(drop=True).sort_values(
+        by=['sector', 'subsector', 'segment', 'company_name', 'quarter', 'version', 'type', 'account', 'description']
+    ).reset_index(drop=True)
+
+
+def compare(df):
+    """
+    Check the broadcast against the merge-and-sort implementation, ignoring row order.
+
+    Parameters:
+    - df (DataFrame): One sector's standard statements.
+
+    Returns:
+    dict: Number of rows of each implementation and of rows found in only one of them.
+    """
+    legacy = legacy_adjust_dfs_types(df)
+    new = share_counts.ShareCounts(df).broadcast()
+
+    # Same rows in any order: compare them sorted, as text
+    columns = list(legacy.columns)
+    legacy = categories.registry.decode(legacy.copy()).astype(str).sort_values(columns).reset_index(drop=True)
+    new = categories.registry.decode(new[columns].copy()).astype(str).sort_values(columns).reset_index(drop=True)
+    if len(legacy) != len(new):
+        return {'legacy': len(legacy), 'broadcast': len(new), 'mismatches': abs(len(legacy) - len(new))}
+    return {'legacy': len(legacy), 'broadcast': len(new), 'mismatches': int((legacy != new).any(axis=1).sum())}
+
+
+def benchmark(df, repeat=3):
+    """
+    Time the broadcast against the merge-and-sort implementation.
+
+    Parameters:
+    - df (DataFrame): One sector's standard statements.
+    - repeat (int): Number of runs; the fastest one is reported.
+
+    Returns:
+    dict: Best seconds for each implementation, the speedup and the comparison report.
+    """
+    timings = {name: best_time(run, repeat) for name, run in (
+        ('legacy', lambda: legacy_adjust_dfs_types(df)),
+        ('broadcast', lambda: share_counts.ShareCounts(df).broadcast()),
+    )}
+
+    result = {
+        'rows': len(df),
+        'legacy': timings['legacy'],
+        'broadcast': timings['broadcast'],
+        'speedup': timings['legacy'] / timings['broadcast'] if timings['broadcast'] else 0.0,
+        'comparison': compare(df),
+    }
+    print(f"{result['rows']} rows: legacy {result['legacy']:.3f}s, broadcast {result['broadcast']:.3f}s "
+          f"({result['speedup']:.1f}x), {result['comparison']}")
+    return result
@@ -0,0 +1,137 @@
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+from lxml import html as lxml_html
+
+from utils import settings
+from utils import table_parser
+
+from benchmarks import best_time
+
+
+def legacy_parse_financial_table(html_content, thousand_word='Mil', drop_items='3.99'):
+    """
+    The parser replaced by table_parser.parse_financial_table, reading the table twice with pd.read_html.
+
+    Parameters:
+    - html_content (str): The HTML source of the frame.
+    - thousand_word (str): Word in the table title that marks values in thousands.
+    - drop_items (str): Account prefix of the rows to drop.
+
+    Returns:
+    DataFrame: The account, description and value columns, or None if the frame has no title.
+    """
+    title = lxml_html.fromstring(html_content).xpath(settings.financial_title_xpath)
+    if not title:
+        return None
+    thousand = 1000 if thousand_word in title[0].text_content() else 1
+
+    df1 = pd.read_html(StringIO(html_content), header=0)[0]
+    df2 = pd.read_html(StringIO(html_content), header=0, thousands='.')[0].fillna(0)
+
+    df1 = df1.iloc[:,0:3]
+    df2 = df2.iloc[:,0:3]
+    df1.columns = settings.financial_statements_columns
+    df2.columns = settings.financial_statements_columns
+    df = pd.concat([df1.iloc[:, :2], df2.iloc[:, 2:3]], axis=1)
+
+    col = df.iloc[:, 2].astype(str)
+    col = col.str.replace('.', '', regex=False)
+    col = col.str.replace(',', '.', regex=False)
+    col = pd.to_numeric(col, errors='coerce')
+    col = col * thousand
+    df.iloc[:, 2] = col
+
+    try:
+        df = df[~df[settings.financial_statements_columns[0]].str.startswith(drop_items)]
+    except Exception as e:
+        pass
+
+    return df
+
+
+def compare(pages):
+    """
+    Check the single-pass parser against the legacy one on the same pages.
+
+    Parameters:
+    - pages (dict): HTML sources of financial statement frames, keyed by name.
+
+    Returns:
+    list: Names of the pages where both parsers disagree.
+    """
+    account, description, value = settings.financial_statements_columns
+    mismatches = []
+    for name, html_content in pages.items():
+        new = table_parser.parse_financial_table(html_content)
+        old = legacy_parse_financial_table(html_content)
+        if new is None or old is None:
+            if new is not old:
+                mismatches.append(name)
+            continue
+
+        # The legacy parser may leave the drop rows in or read short accounts as floats, so compare on the new rows
+        old = old.astype({account: str})
+        old = old[old[account].isin(new[account])].reset_index(drop=True)
+        same_rows = len(new) == len(old) and (new[description] == old[description].astype(str)).all()
+        same_values = same_rows and np.allclose(new[value].to_numpy(), old[value].to_numpy(dtype=float), equal_nan=True)
+        if not same_values:
+            mismatches.append(name)
+
+    return mismatches
+
+
+def benchmark(pages, repeat=3):
+    """
+    Time the single-pass parser against the legacy double read_html parser.
+
+    Parameters:
+    - pages (dict): HTML sources of financial statement frames, keyed by name.
+    - repeat (int): Number of passes over the pages; the fastest pass is reported.
+
+    Returns:
+    dict: Best seconds per pass for each parser, the speedup and the pages that disagree.
+    """
+    timings = {}
+    for name, parser in (('legacy', legacy_parse_financial_table), ('single_pass', table_parser.parse_financial_table)):
+        timings[name] = best_time(lambda: [parser(html_content) for html_content in pages.values()], repeat)
+
+    result = {
+        'pages': len(pages),
+        'legacy': timings['legacy'],
+        'single_pass': timings['single_pass'],
+        'speedup': timings['legacy'] / timings['single_pass'] if timings['single_pass'] else 0.0,
+        'mismatches': compare(pages),
+    }
+    print(f"{result['pages']} pages: legacy {result['legacy']:.3f}s, single pass {result['single_pass']:.3f}s "
+          f"({result['speedup']:.1f}x), mismatches {result['mismatches']}")
+    return result
+
+
+def load_cached_pages(limit=500):
+    """
+    Load the financial statement frames saved in the page cache.
+
+    Parameters:
+    - limit (int): Maximum number of pages to load.
+
+    Returns:
+    dict: HTML sources keyed by cache key.
+    """
+    from utils import page_cache
+
+    cache = page_cache.PageCache()
+    try:
+        frames = {f":{cmbGrupo}:{cmbQuadro}" for cmbGrupo, cmbQuadro in settings.financial_data_statements}
+        pages = {}
+        for key in cache.keys('frame:'):
+            if key[key.index(':', len('frame:')):] in frames:
+                html_content = cache.get(key)
+                if html_content:
+                    pages[key] = html_content
+            if len(pages) >= limit:
+                break
+        return pages
+    finally:
+        cache.close()
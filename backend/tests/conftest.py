@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+
+import pytest
+from aiohttp import web
+
+# The application imports its modules as 'from utils import ...' from the backend folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import settings
+
+
+class StandInServer:
+    """
+    A local HTTP stand-in for the CVM pages, served by aiohttp from a background thread so both the asyncio
+    fetcher and the blocking requests calls can reach it.
+
+    Pages are produced by a callable taking the request, and every request is recorded with its start time,
+    so tests can check the order, the concurrency and the pacing the clients kept.
+    """
+
+    def __init__(self, page, delay=0.0):
+        """
+        Initialize the server.
+
+        Parameters:
+        - page (callable): Returns (status, html) for an aiohttp request.
+        - delay (float or callable): Seconds to hold each response, or a callable returning them for a request.
+        """
+        self.page = page
+        self.delay = delay
+        self.requests = []  # (start time, host, query) of every request, in arrival order
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.runner = None
+        self.port = None
+
+    async def handle(self, request):
+        """
+        Serve one request, holding it for the configured delay.
+
+        Parameters:
+        - request (aiohttp.web.Request): The request.
+
+        Returns:
+        aiohttp.web.Response: The page.
+        """
+        self.requests.append((time.monotonic(), request.host, dict(request.query)))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay = self.delay(request) if callable(self.delay) else self.delay
+            if delay:
+                await asyncio.sleep(delay)
+            status, html = self.page(request)
+            return web.Response(text=html, status=status, content_type='text/html')
+        finally:
+            self.in_flight -= 1
+
+    async def start_site(self):
+        """
+        Bind the server to a free local port.
+
+        Returns:
+        int: The port.
+        """
+        app = web.Application()
+        app.router.add_route('GET', '/{tail:.*}', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        return self.runner.addresses[0][1]
+
+    def start(self):
+        """
+        Start the server thread.
+
+        Returns:
+        StandInServer: The running server.
+        """
+        self.thread.start()
+        self.port = asyncio.run_coroutine_threadsafe(self.start_site(), self.loop).result(timeout=10)
+        return self
+
+    def stop(self):
+        """
+        Stop the server and its thread.
+
+        Returns:
+        bool: True once stopped.
+        """
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=10)
+        self.loop.close()
+        return True
+
+    def url(self, path='/'):
+        """
+        Build a URL on the server.
+
+        Parameters:
+        - path (str): The path and query.
+
+        Returns:
+        str: The URL.
+        """
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def queried(self, name):
+        """
+        List a query parameter of every request, in arrival order.
+
+        Parameters:
+        - name (str): The query parameter.
+
+        Returns:
+        list: The values as integers.
+        """
+        return [int(query[name]) for _, _, query in self.requests if name in query]
+
+
+@pytest.fixture
+def stand_in():
+    """
+    Start stand-in servers on demand and stop them after the test.
+
+    Returns:
+    callable: Takes the StandInServer arguments and returns a running server.
+    """
+    servers = []
+
+    def start(page, delay=0.0):
+        server = StandInServer(page, delay).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def data_folder(tmp_path, monkeypatch):
+    """
+    Point the databases, the page cache and the Parquet copy at a temporary folder, and run the test from it.
+
+    Returns:
+    pathlib.Path: The folder.
+    """
+    monkeypatch.setattr(settings, 'db_folder', str(tmp_path))
+    monkeypatch.setattr(settings, 'db_path', os.path.join(str(tmp_path), settings.db_name))
+    monkeypatch.setattr(settings, 'storage_folder', os.path.join(str(tmp_path), 'parquet'))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,143 @@
+import time
+import asyncio
+
+import pytest
+
+from utils import settings
+from utils import async_fetcher
+
+
+def item_page(request):
+    """
+    Serve a page naming the item it was asked for.
+    """
+    return 200, f"<html><body>item {request.query['item']}</body></html>"
+
+
+def collect(fetcher, items, url_builder, cached_page=None, stop_after=None):
+    """
+    Run fetch_ordered to completion, or until stop_after items were consumed.
+
+    Returns:
+    list: The (item, html) pairs in the order they were yielded.
+    """
+    async def run():
+        results = []
+        stream = fetcher.fetch_ordered(items, url_builder, cached_page=cached_page)
+        try:
+            async for item, html in stream:
+                results.append((item, html))
+                if stop_after is not None and len(results) >= stop_after:
+                    break
+        finally:
+            await stream.aclose()
+        return results
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    """
+    Retry failed requests without waiting.
+    """
+    monkeypatch.setattr(settings, 'wait_time', 0)
+
+
+def test_results_follow_input_order(stand_in):
+    # Later items answer first, so the stream has to hold them back
+    server = stand_in(item_page, delay=lambda request: 0.2 - int(request.query['item']) * 0.01)
+    fetcher = async_fetcher.AsyncPageFetcher(max_concurrency=8, requests_per_second=0)
+
+    items = list(range(20))
+    results = collect(fetcher, items, lambda item: server.url(f"/page?item={item}"))
+
+    assert [item for item, _ in results] == items
+    assert all(f"item {item}<" in html for item, html in results)
+
+
+def test_requests_in_flight_stay_bounded(stand_in):
+    server = stand_in(item_page, delay=0.05)
+    fetcher = async_fetcher.AsyncPageFetcher(max_concurrency=3, requests_per_second=0)
+
+    results = collect(fetcher, list(range(24)), lambda item: server.url(f"/page?item={item}"))
+
+    assert len(results) == 24
+    assert 2 <= server.max_in_flight <= 3
+
+
+def test_request_starts_are_paced_per_host(stand_in):
+    server = stand_in(item_page)
+    fetcher = async_fetcher.AsyncPageFetcher(max_concurrency=8, requests_per_second=40)
+
+    collect(fetcher, list(range(12)), lambda item: server.url(f"/page?item={item}"))
+
+    # 12 starts at 40 per second span at least 11 intervals of 25ms
+    starts = sorted(start for start, _, _ in server.requests)
+    assert len(starts) == 12
+    assert starts[-1] - starts[0] >= 11 / 40 * 0.9
+
+
+def test_rate_limiter_paces_each_host_separately():
+    limiter_hosts = ['cvm.example', 'b3.example']
+
+    async def run():
+        limiter = async_fetcher.HostRateLimiter(20)
+        starts = {host: [] for host in limiter_hosts}
+
+        async def start(host):
+            await limiter.wait(host)
+            starts[host].append(time.monotonic())
+
+        await asyncio.gather(*(start(host) for host in limiter_hosts for _ in range(5)))
+        return starts
+
+    starts = asyncio.run(run())
+
+    # Each host gets its own 50ms slots, so both finish in the time of one
+    for host in limiter_hosts:
+        assert max(starts[host]) - min(starts[host]) >= 4 / 20 * 0.9
+    every_start = starts['cvm.example'] + starts['b3.example']
+    assert max(every_start) - min(every_start) < 8 / 20
+
+
+def test_cached_pages_are_not_requested(stand_in):
+    server = stand_in(item_page)
+    fetcher = async_fetcher.AsyncPageFetcher(max_concurrency=4, requests_per_second=0)
+
+    cached = {item: f"<html>cached {item}</html>" for item in range(0, 10, 2)}
+    results = collect(fetcher, list(range(10)), lambda item: server.url(f"/page?item={item}"), cached_page=cached.get)
+
+    assert sorted(server.queried('item')) == [1, 3, 5, 7, 9]
+    assert [html for item, html in results if item in cached] == list(cached.values())
+
+
+def test_failed_requests_are_retried(stand_in):
+    failures = {3: 2, 5: 5}  # Item 3 fails twice then answers, item 5 never answers
+
+    def flaky_page(request):
+        item = int(request.query['item'])
+        if failures.get(item, 0) > 0:
+            failures[item] -= 1
+            return 500, 'error'
+        return item_page(request)
+
+    server = stand_in(flaky_page)
+    fetcher = async_fetcher.AsyncPageFetcher(max_concurrency=4, requests_per_second=0, retries=2)
+
+    results = dict(collect(fetcher, list(range(8)), lambda item: server.url(f"/page?item={item}")))
+
+    assert 'item 3<' in results[3]
+    assert results[5] is None
+    assert server.queried('item').count(5) == 3
+
+
+def test_stopping_early_cancels_the_window(stand_in):
+    server = stand_in(item_page, delay=0.02)
+    fetcher = async_fetcher.AsyncPageFetcher(max_concurrency=2, requests_per_second=0)
+
+    results = collect(fetcher, list(range(200)), lambda item: server.url(f"/page?item={item}"), stop_after=5)
+
+    # Only the window of 2 x max_concurrency ahead of the consumer was ever scheduled
+    assert [item for item, _ in results] == [0, 1, 2, 3, 4]
+    assert len(server.requests) <= 5 + 2 * 2
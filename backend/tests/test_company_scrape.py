@@ -0,0 +1,81 @@
+import pytest
+
+from utils import selenium_driver
+from utils import company_scrape
+
+
+def scraped_company(**changes):
+    """
+    A company as get_company_info hands it over: the ticker card fields, the detail page fields
+    and the ticker and ISIN codes as lists.
+    """
+    info = {
+        'ticker': 'ALFA',
+        'trading_name': 'ALFA',
+        'listing': 'Novo Mercado',
+        'company_name': 'ALFA S.A.',
+        'cvm_code': '12345',
+        'activity': 'Holding',
+        'sector': 'Financeiro',
+        'subsector': 'Bancos',
+        'segment': 'Bancos',
+        'cnpj': '12345678000199',
+        'website': 'www.alfa.com.br',
+        'sector_classification': 'Financeiro / Bancos / Bancos',
+        'ticker_codes': ['ALFA3', 'ALFA4'],
+        'isin_codes': ['BRALFAACNOR1', 'BRALFAACNPR8'],
+        'registrar': 'BANCO ESCRITURADOR',
+    }
+    info.update(changes)
+    return info
+
+
+@pytest.fixture
+def scraper(data_folder, monkeypatch):
+    """
+    A company scraper without a browser, recording the companies each batch saves.
+    """
+    monkeypatch.setattr(selenium_driver, 'initialize_driver', lambda *args, **kwargs: (None, None))
+    scraper = company_scrape.CompanyScraper()
+    scraper.saved = []
+    save_to_db = scraper.save_to_db
+
+    def record(data):
+        scraper.saved.append([info['company_name'] for info in data])
+        return save_to_db(data)
+
+    monkeypatch.setattr(scraper, 'save_to_db', record)
+    return scraper
+
+
+def test_unchanged_company_is_not_saved_again(scraper):
+    scraper.update_and_save_batch({}, [scraped_company()])
+    stored = scraper.load_existing_data()
+
+    assert stored['ALFA S.A.']['ticker_codes'] == 'ALFA3,ALFA4'
+
+    scraper.update_and_save_batch(stored, [scraped_company()])
+    assert scraper.saved == [['ALFA S.A.'], []]
+
+
+def test_changed_codes_and_new_companies_are_saved(scraper):
+    scraper.update_and_save_batch({}, [scraped_company()])
+    stored = scraper.load_existing_data()
+
+    batch = [
+        scraped_company(ticker_codes=['ALFA3', 'ALFA4', 'ALFA11'], isin_codes=['BRALFAACNOR1', 'BRALFAACNPR8', 'BRALFACDAM13']),
+        scraped_company(company_name='BETA S.A.', ticker='BETA', ticker_codes=['BETA3'], isin_codes=['BRBETAACNOR4']),
+    ]
+    scraper.update_and_save_batch(stored, batch)
+
+    assert scraper.saved[-1] == ['ALFA S.A.', 'BETA S.A.']
+    assert scraper.load_existing_data()['ALFA S.A.']['ticker_codes'] == 'ALFA3,ALFA4,ALFA11'
+
+
+def test_company_without_detail_page_matches_its_stored_row(scraper):
+    # A company whose detail page was not found only has its ticker card fields
+    card = {'ticker': 'GAMA', 'trading_name': 'GAMA', 'listing': '', 'company_name': 'GAMA S.A.'}
+    scraper.update_and_save_batch({}, [card])
+
+    scraper.update_and_save_batch(scraper.load_existing_data(), [dict(card)])
+    assert scraper.saved == [['GAMA S.A.'], []]
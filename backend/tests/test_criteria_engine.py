@@ -0,0 +1,36 @@
+import pytest
+
+from utils import categories
+from utils import criteria_engine
+from utils import statements_standardize
+
+import benchmarks
+from benchmarks import criteria_engine as criteria_benchmark
+
+
+@pytest.fixture(scope='module')
+def statements():
+    """
+    Two companies' math statements over two quarters: the accounts the criteria target, some with other descriptions.
+    """
+    return benchmarks.load_frame('math')
+
+
+@pytest.mark.parametrize('encode', [False, True])
+def test_engine_matches_the_recursive_implementation(statements, encode):
+    df = categories.registry.encode(statements.copy()) if encode else statements
+    report = criteria_benchmark.compare(df)
+
+    assert report == {'rows': len(statements), 'account_standard': 0, 'description_standard': 0,
+                      'standard_criteria': 0, 'items_match': 0}
+
+
+def test_engine_standardizes_the_raw_accounts(statements):
+    df = statements.copy()
+    sections = statements_standardize.StandardizedReport().get_standardization_sections()
+    criteria_engine.CriteriaEngine(df).apply_tree(sections['Demonstração do Resultado'])
+
+    revenue = df[(df['account'] == '3.01') & (df['description'] == 'Receita de Venda de Bens e/ou Serviços')]
+    assert len(revenue) > 0
+    assert set(revenue['account_standard']) == {'03.01'}
+    assert df.loc[df['account'].str.startswith('1'), 'account_standard'].eq('').all()
@@ -0,0 +1,48 @@
+import pandas as pd
+
+from utils import db_writer
+
+
+class Worker:
+    """
+    A stand-in for a scraper worker that saves through the shared writer.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def write_batch(self, conn, df, table):
+        self.calls.append(len(df))
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (value INTEGER)")
+        conn.executemany(f"INSERT INTO {table} VALUES (?)", [(int(value),) for value in df['value']])
+
+
+def test_batches_from_different_workers_coalesce(data_folder):
+    db_path = str(data_folder / 'writer.db')
+    writer = db_writer.DatabaseWriter(coalesce_rows=1000, flush_interval=5)
+    workers = [Worker() for _ in range(4)]
+
+    for number, worker in enumerate(workers):
+        writer.submit(db_path, 'sector', pd.DataFrame({'value': [number] * 10}), worker.write_batch)
+    stats = writer.close()
+
+    assert stats['submitted'] == 4
+    assert stats['transactions'] == 1
+    assert stats['rows_written'] == 40
+    assert sum(len(worker.calls) for worker in workers) == 1
+
+
+def test_different_writer_functions_stay_apart(data_folder):
+    db_path = str(data_folder / 'writer.db')
+    writer = db_writer.DatabaseWriter(coalesce_rows=1000, flush_interval=5)
+    worker = Worker()
+
+    def other_write(conn, df, table):
+        worker.write_batch(conn, df, table)
+
+    writer.submit(db_path, 'sector', pd.DataFrame({'value': [1, 2]}), worker.write_batch)
+    writer.submit(db_path, 'sector', pd.DataFrame({'value': [3]}), other_write)
+    stats = writer.close()
+
+    assert stats['transactions'] == 2
+    assert worker.calls == [2, 1]
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import decumulation
+from utils import math_transformation
+
+import benchmarks
+from benchmarks import decumulation as decumulation_benchmark
+
+
+@pytest.fixture(scope='module')
+def statements():
+    """
+    The saved statements: full years, a missing quarter, a second version of a quarter and a year-end-only filing.
+    """
+    return decumulation_benchmark.with_year_and_month(benchmarks.load_frame('decumulation'))
+
+
+def values(df, company_name, account, version='1'):
+    """
+    The adjusted values of one statement line, keyed by quarter month.
+    """
+    rows = df[(df['company_name'] == company_name) & (df['account'] == account) & (df['version'] == version)]
+    return dict(zip(rows['quarter'].dt.month, rows['value']))
+
+
+def test_engine_matches_the_pivot_implementation(statements):
+    report = decumulation_benchmark.compare(statements)
+
+    assert report['year_end'] == {'rows': 13, 'mismatches': 0}
+    assert report['cumulative'] == {'rows': 10, 'mismatches': 0}
+
+
+@pytest.mark.parametrize('engine, legacy', [
+    (decumulation.decumulate_year_end, decumulation_benchmark.legacy_adjust_year_end_balance),
+    (decumulation.decumulate_cumulative, decumulation_benchmark.legacy_adjust_cumulative_quarter_balances),
+])
+def test_engine_keeps_the_rows_and_columns_of_the_pivot_implementation(statements, engine, legacy):
+    new, old = engine(statements), legacy(statements)
+
+    # The pivot hands the helper 'year' and 'month' columns back with other dtypes; the math stage drops both
+    columns = [column for column in statements.columns if column not in ('value', 'year', 'month')]
+    assert list(new.columns) == list(old.columns)
+    pd.testing.assert_frame_equal(new[columns].reset_index(drop=True), old[columns].reset_index(drop=True))
+    np.testing.assert_allclose(new['value'].to_numpy(dtype=float), old['value'].to_numpy(dtype=float), equal_nan=True)
+
+
+def test_year_end_quarter_is_decumulated(statements):
+    year_end, _ = decumulation_benchmark.groups(statements)
+    df = decumulation.decumulate_year_end(year_end)
+
+    # The first version of each quarter is the one the pivot kept
+    assert values(df, 'ALFA S.A.', '3.01') == {3: 100.0, 6: 210.0, 9: 330.0, 12: 460.0 - (330.0 + 210.0 + 100.0)}
+    assert values(df, 'ALFA S.A.', '3.01', version='2') == {6: 210.0}
+    assert values(df, 'ALFA S.A.', '3.02')[12] == -270.0 - (-190.0 - 125.0 - 60.0)
+
+
+def test_cumulative_quarters_are_decumulated(statements):
+    _, cumulative = decumulation_benchmark.groups(statements)
+    df = decumulation.decumulate_cumulative(cumulative)
+
+    assert values(df, 'ALFA S.A.', '6.01') == {3: 50.0, 6: 70.0, 9: 50.0, 12: 90.0}
+
+
+def test_missing_quarter_leaves_the_later_quarters_unknown(statements):
+    year_end, cumulative = decumulation_benchmark.groups(statements)
+
+    cash_flow = values(decumulation.decumulate_cumulative(cumulative), 'BETA S.A.', '6.01')
+    assert cash_flow[3] == 20.0
+    assert np.isnan(cash_flow[9]) and np.isnan(cash_flow[12])
+
+    revenue = values(decumulation.decumulate_year_end(year_end), 'BETA S.A.', '3.01')
+    assert revenue[9] == 130.0
+    assert np.isnan(revenue[12])
+
+    # A company filing only at year end has no quarters to subtract
+    assert np.isnan(values(decumulation.decumulate_year_end(year_end), 'GAMA S.A.', '3.01')[12])
+
+
+def test_math_stage_leaves_other_accounts_alone(statements, data_folder):
+    df = math_transformation.MathTransformation().mathmagic({'Financeiro': benchmarks.load_frame('decumulation')})['Financeiro']
+
+    assert values(df, 'ALFA S.A.', '1.01') == {3: 10.0, 6: 11.0, 9: 12.0, 12: 13.0}
+    assert len(df) == len(statements)
+    assert list(data_folder.glob('*.csv')) == []  # No dump of what may be only the changed company-years
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from utils import financial_ratios
+
+import benchmarks
+from benchmarks import formula_compiler as formula_benchmark
+
+
+@pytest.fixture(scope='module')
+def statements():
+    """
+    Standard statements of three companies over two years, share counts broadcast as the ratios stage reads them.
+    """
+    return financial_ratios.FinancialRatios().adjust_dfs_types(benchmarks.load_frame('standard'))
+
+
+def indicator(df, company_name, kind, account):
+    """
+    The values of one indicator, keyed by quarter.
+    """
+    rows = df[(df['company_name'] == company_name) & (df['type'] == kind) & (df['account'] == account)]
+    return dict(zip(rows['quarter'].dt.strftime('%Y-%m-%d'), rows['value']))
+
+
+def test_compiled_indicators_match_the_formula_classes(statements):
+    report = formula_benchmark.compare(statements)
+
+    assert report == {'rows': 3720, 'mismatches': 0, 'key_mismatches': 0}
+
+
+def test_trailing_twelve_months_need_four_consecutive_quarters(statements):
+    ratios = financial_ratios.FinancialRatios()
+    df = ratios.add_indicators(statements, ratios.get_indicator_sections())
+
+    revenue = indicator(df, 'ALFA S.A.', 'DFs Consolidadas', '19.01')
+    assert np.isnan(revenue['2022-09-30'])
+    assert revenue['2022-12-31'] == 300.0 + 315.0 + 330.0 + 345.0
+    assert revenue['2023-12-31'] == 360.0 + 375.0 + 390.0 + 405.0
+
+    # BETA filed nothing at 2022-09-30, so no window covering it is complete
+    revenue = indicator(df, 'BETA S.A.', 'DFs Consolidadas', '19.01')
+    assert all(np.isnan(revenue[quarter]) for quarter in ['2022-12-31', '2023-03-31', '2023-06-30'])
+    assert not np.isnan(revenue['2023-09-30'])
@@ -0,0 +1,161 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from utils import settings
+from utils import nsd_scrape
+
+
+def nsd_page(nsd):
+    """
+    Build an NSD page as the CVM serves it, with an empty page for unused numbers.
+
+    Parameters:
+    - nsd (int): The NSD, or None for an unused number.
+
+    Returns:
+    str: The HTML content.
+    """
+    labels = ['lblNomeCompanhia', 'lblNomeDRI', 'lblDescricaoCategoria', 'lblAuditor', 'lblResponsavelTecnico',
+              'lblProtocolo', 'lblDataDocumento', 'lblDataEnvio', 'lblMotivoCancelamentoReapresentacao']
+    texts = [f"EMPRESA {nsd} S.A.", f"DIRETOR {nsd} - DRI", 'ITR - INFORMACOES TRIMESTRAIS - V1',
+             'AUDITORES INDEPENDENTES - 123', 'RESPONSAVEL', f"0100-{nsd}", '31/03/2024', '15/05/2024 10:00:00', '']
+    if nsd is None:
+        texts = [''] * len(labels)
+    spans = ''.join(f'<span id="{label}">{text}</span>' for label, text in zip(labels, texts))
+    return f"<html><body>{spans}</body></html>"
+
+
+@pytest.fixture
+def cvm(stand_in, data_folder, monkeypatch):
+    """
+    Serve the published NSDs from a stand-in server and point the scraper at it.
+
+    Returns:
+    callable: Takes the set of published NSDs and returns the running server.
+    """
+    monkeypatch.setattr(settings, 'wait_time', 0)
+    monkeypatch.setattr(settings, 'nsd_max_concurrency', 4)
+    monkeypatch.setattr(settings, 'nsd_requests_per_second', 0)
+    nsd_scrape.NSDScraper.cache.clear()  # Pages fetched by scrapers of earlier tests
+
+    def start(published):
+        def page(request):
+            nsd = int(request.query['NumeroSequencialDocumento'])
+            return 200, nsd_page(nsd if nsd in published else None)
+
+        server = stand_in(page)
+        monkeypatch.setattr(settings, 'nsd_url', server.url('/ENET/frmGerenciaPaginaFRE.aspx?NumeroSequencialDocumento={nsd}&CodigoTipoInstituicao=1'))
+        return server
+
+    return start
+
+
+def saved_nsds(scraper):
+    """
+    Read the NSDs saved by a scraper.
+    """
+    with sqlite3.connect(scraper.db_full_path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT nsd FROM nsd"))
+
+
+def test_frontier_probe_finds_the_last_published_nsd(cvm):
+    # Unused numbers shorter than the probe window do not end the sequence
+    published = set(range(1, 138)) - {40, 41, 90}
+    server = cvm(published)
+    scraper = nsd_scrape.NSDScraper()
+
+    frontier, probe_requests = scraper.find_nsd_frontier(0)
+
+    assert frontier == 137
+    assert probe_requests == len(set(server.queried('NumeroSequencialDocumento')))
+    assert probe_requests < 60
+
+
+def test_scrape_saves_every_published_nsd_in_order(cvm):
+    published = set(range(1, 138)) - {40, 41, 90}
+    server = cvm(published)
+    scraper = nsd_scrape.NSDScraper()
+
+    scraper.scrape_nsd(concurrent=True)
+
+    assert scraper.frontier_report['frontier'] == 137
+    assert saved_nsds(scraper) == sorted(published)
+
+    # Pages found while probing are served from the page cache, not requested again
+    requested = server.queried('NumeroSequencialDocumento')
+    assert len(requested) == len(set(requested))
+
+
+def test_scrape_stops_after_two_empty_batches(cvm, monkeypatch):
+    monkeypatch.setattr(settings, 'batch_size', 20)
+    published = set(range(1, 51))
+    server = cvm(published)
+    scraper = nsd_scrape.NSDScraper()
+
+    nsd_range = list(range(1, 1001))
+    asyncio.run(scraper.scrape_nsd_async(nsd_range))
+
+    assert saved_nsds(scraper) == sorted(published)
+
+    # The stream stops within two empty batches and the window in flight past the last published NSD
+    requested = server.queried('NumeroSequencialDocumento')
+    assert max(requested) <= 50 + 3 * 20 + 2 * settings.nsd_max_concurrency
+
+
+def test_sequential_and_concurrent_scrapes_agree(cvm, tmp_path, monkeypatch):
+    published = set(range(1, 31)) | {33}
+    cvm(published)
+
+    concurrent = nsd_scrape.NSDScraper()
+    concurrent.scrape_nsd(concurrent=True)
+    concurrent_rows = saved_nsds(concurrent)
+
+    # Start over in a fresh folder for the sequential run
+    folder = tmp_path / 'sequential'
+    folder.mkdir()
+    monkeypatch.setattr(settings, 'db_folder', str(folder))
+    monkeypatch.chdir(folder)
+    sequential = nsd_scrape.NSDScraper()
+    sequential.scrape_nsd(concurrent=False)
+
+    assert concurrent_rows == saved_nsds(sequential) == sorted(published)
+
+
+def test_defaults_follow_the_settings_at_call_time(cvm, monkeypatch):
+    cvm(set(range(1, 11)))
+    scraper = nsd_scrape.NSDScraper()
+    engines = []
+    monkeypatch.setattr(scraper, 'scrape_nsd_sequential', lambda nsd_range: engines.append('sequential') or nsd_range)
+    monkeypatch.setattr(settings, 'nsd_concurrent', False)
+
+    scraper.scrape_nsd()
+
+    assert engines == ['sequential']
+
+
+def test_frontier_past_the_largest_step_is_probed_and_logged(cvm, monkeypatch):
+    monkeypatch.setattr(settings, 'nsd_frontier_max_step', 8)
+    cvm(set(range(1, 101)))
+    errors = []
+    monkeypatch.setattr(nsd_scrape.system, 'log_error', errors.append)
+    scraper = nsd_scrape.NSDScraper()
+
+    frontier, probe_requests = scraper.find_nsd_frontier(0)
+
+    assert frontier == 16
+    assert len(errors) == 1 and 'capped at 16' in errors[0]
+
+
+def test_report_keeps_the_sign_of_the_requests_saved(cvm, capsys, monkeypatch):
+    cvm(set(range(1, 11)))
+    scraper = nsd_scrape.NSDScraper()
+    monkeypatch.setattr(scraper, 'estimate_new_nsds', lambda max_nsd, last_sent_date: 5)  # Fewer than the probes cost
+
+    scraper.generate_nsd_range(mode='frontier')
+
+    report = scraper.frontier_report
+    assert report['saved_requests'] == 5 - report['probe_requests'] - 10
+    assert report['saved_requests'] < 0
+    assert f"({report['saved_requests']:+d} saved)" in capsys.readouterr().out
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from utils import page_cache
+
+
+class Clock:
+    """
+    A settable stand-in for time.time, so created_at and accessed_at are told apart.
+    """
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(page_cache.time, 'time', clock)
+    return clock
+
+
+def page(name):
+    return f"<html><body><table><tr><td>{name}</td></tr></table></body></html>"
+
+
+def test_page_expires_after_the_ttl(data_folder, clock):
+    cache = page_cache.PageCache(ttl=60)
+    cache.put('nsd:1', page('1'))
+
+    clock.now += 60
+    assert cache.get('nsd:1') == page('1')
+
+    clock.now += 1
+    assert cache.get('nsd:1') is None
+    assert cache.count_present(['nsd:1']) == 0  # The expired entry is dropped, not just hidden
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_evict_drops_expired_then_least_recently_used_pages(data_folder, clock):
+    cache = page_cache.PageCache(ttl=100)
+    for key in ('nsd:1', 'nsd:2', 'nsd:3', 'nsd:4'):
+        cache.put(key, page(key))
+        clock.now += 10
+
+    # Reading the oldest page makes the second one the least recently used
+    clock.now += 65
+    assert cache.get('nsd:2') == page('nsd:2')
+    clock.now += 1
+    assert cache.get('nsd:1') is None  # Expired
+
+    # Room for two of the three remaining pages
+    sizes = cache.stats()['bytes']
+    cache.max_bytes = sizes * 2 // 3
+    assert cache.evict() == 1
+
+    keys = ['nsd:1', 'nsd:2', 'nsd:3', 'nsd:4']
+    assert [key for key in keys if cache.count_present([key])] == ['nsd:2', 'nsd:4']
+    assert cache.keys('nsd:') == ['nsd:2', 'nsd:4']
+    cache.close()
+
+
+def test_put_replaces_the_page_under_an_existing_key(data_folder, clock):
+    cache = page_cache.PageCache(ttl=60)
+    key = page_cache.PageCache.frame_key(1, 'DFs Consolidadas', 'Balanço Patrimonial Ativo')
+    first_hash = cache.put(key, page('old'))
+
+    # The replacement also restarts the TTL
+    clock.now += 50
+    second_hash = cache.put(key, page('new'))
+    clock.now += 50
+
+    assert second_hash != first_hash
+    assert cache.get(key) == page('new')
+    assert cache.stats()['pages'] == 1
+    cache.close()
+
+
+def test_count_present_ignores_missing_keys(data_folder):
+    cache = page_cache.PageCache()
+    cache.put('nsd:1', page('1'))
+    cache.put('nsd:2', page('2'))
+
+    assert cache.count_present(['nsd:1', 'nsd:2', 'nsd:3']) == 2
+    assert cache.count_present([]) == 0
+    assert (cache.hits, cache.misses) == (0, 0)  # Counting reads no pages
+    cache.close()
+
+
+def test_pages_survive_a_restart(data_folder):
+    cache = page_cache.PageCache()
+    cache.put('nsd:1', page('1'))
+    cache.close()
+
+    cache = page_cache.PageCache()
+    assert cache.get('nsd:1') == page('1')
+    assert os.path.dirname(cache.db_path) == str(data_folder)
+    cache.close()
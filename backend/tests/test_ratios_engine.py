@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from utils import ratios_engine
+from utils import financial_ratios
+
+import benchmarks
+from benchmarks import ratios_engine as ratios_benchmark
+
+
+@pytest.fixture(scope='module')
+def statements():
+    """
+    Standard statements of three companies over two years, share counts broadcast as the ratios stage reads them.
+    """
+    return financial_ratios.FinancialRatios().adjust_dfs_types(benchmarks.load_frame('standard'))
+
+
+def test_account_matrix_matches_the_pivot(statements):
+    report = ratios_benchmark.compare(statements)
+
+    assert report == {'entities': 30, 'accounts': 10, 'key_mismatches': 0, 'mismatches': 0}
+
+
+def test_account_matrix_has_one_row_per_filing(statements):
+    engine = ratios_engine.RatiosEngine(statements, financial_ratios.FinancialRatios().get_indicator_sections())
+    entities = engine.entities()
+
+    assert len(entities) == len(statements[ratios_engine.RatiosEngine.keys].drop_duplicates())
+    row = np.flatnonzero((entities['company_name'] == 'ALFA S.A.') & (entities['type'] == 'DFs Consolidadas')
+                         & (entities['quarter'] == '2022-03-31'))[0]
+    assert engine.matrix[row, engine.accounts.index('03.01')] == 300.0
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import rolling_indicators
+from utils import financial_ratios
+
+import benchmarks
+from benchmarks import rolling_indicators as rolling_benchmark
+
+
+@pytest.fixture(scope='module')
+def statements():
+    """
+    Standard statements of three companies over two years, share counts broadcast as the ratios stage reads them.
+    """
+    return financial_ratios.FinancialRatios().adjust_dfs_types(benchmarks.load_frame('standard'))
+
+
+@pytest.mark.parametrize('function, windows', [('sum', 16), ('mean', 16), ('growth', 14)])
+def test_windows_match_pandas_on_a_quarterly_calendar(statements, function, windows):
+    report = rolling_benchmark.compare(statements, '03.01', function)
+
+    assert report == {'rows': 30, 'windows': windows, 'mismatches': 0}
+
+
+def test_missing_quarter_breaks_the_windows():
+    rows = pd.DataFrame({
+        'company_name': ['BETA'] * 7,
+        'type': ['DFs Consolidadas'] * 7,
+        'quarter': pd.to_datetime(['2022-03-31', '2022-06-30', '2022-12-31', '2023-03-31', '2023-06-30', '2023-09-30', '2023-12-31']),
+    })
+    windows = rolling_indicators.QuarterWindows.from_frame(rows, ['company_name', 'type'])
+    result = windows.apply('sum', 4, np.arange(1.0, 8.0))
+
+    assert np.isnan(result[:5]).all()
+    assert result[5:].tolist() == [3.0 + 4.0 + 5.0 + 6.0, 4.0 + 5.0 + 6.0 + 7.0]
@@ -0,0 +1,48 @@
+import pytest
+
+from utils import categories
+from utils import share_counts
+
+import benchmarks
+from benchmarks import share_counts as share_counts_benchmark
+
+
+@pytest.fixture(scope='module')
+def statements():
+    """
+    Standard statements of three companies over two years, with the share counts filed as 'Dados da Empresa'.
+    BETA has no statements at 2022-09-30 and GAMA none at 2023-12-31, though both filed their share counts.
+    """
+    return benchmarks.load_frame('standard')
+
+
+def share_rows(df, company_name, quarter):
+    """
+    The number of share count rows of each type at one company and quarter.
+    """
+    rows = df[(df['company_name'] == company_name) & (df['quarter'] == quarter) & df['account'].astype(str).str.startswith('00')]
+    return rows.groupby('type', observed=True).size().to_dict()
+
+
+@pytest.mark.parametrize('encode', [False, True])
+def test_broadcast_matches_the_merge_implementation(statements, encode):
+    df = categories.registry.encode(statements.copy()) if encode else statements
+    report = share_counts_benchmark.compare(df)
+
+    assert report == {'legacy': 390, 'broadcast': 390, 'mismatches': 0}
+
+
+def test_broadcast_copies_the_share_counts_to_every_statement_type(statements):
+    df = share_counts.ShareCounts(statements).broadcast()
+
+    assert share_rows(df, 'ALFA S.A.', '2023-06-30') == {'DFs Consolidadas': 2, 'DFs Individuais': 2}
+    assert share_rows(df, 'BETA S.A.', '2023-06-30') == {'DFs Consolidadas': 2}
+    assert 'Dados da Empresa' not in set(df['type'])
+
+
+@pytest.mark.parametrize('company_name, quarter', [('BETA S.A.', '2022-09-30'), ('GAMA S.A.', '2023-12-31')])
+def test_broadcast_skips_quarters_without_statements(statements, company_name, quarter):
+    df = share_counts.ShareCounts(statements).broadcast()
+
+    assert share_rows(statements, company_name, quarter) == {'Dados da Empresa': 2}
+    assert share_rows(df, company_name, quarter) == {}
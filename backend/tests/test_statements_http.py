@@ -0,0 +1,80 @@
+import pytest
+
+from utils import settings
+from utils import statements_http
+from utils import statements_scrape
+
+import benchmarks
+
+xpath_ready = settings.financial_table_xpath
+
+
+@pytest.fixture
+def cvm(stand_in, data_folder, monkeypatch):
+    """
+    Serve a saved ITR page of the consolidated statements and a frame document for each frame it links.
+
+    Returns:
+    StandInServer: The running server.
+    """
+    nsd_html = benchmarks.load_pages('nsd')['itr_consolidado.html']
+    frame_html = benchmarks.load_pages('frames')['dre_consolidado_mil.html']
+
+    def page(request):
+        if request.path.endswith('frmGerenciaPaginaFRE.aspx'):
+            return 200, nsd_html
+        return 200, frame_html
+
+    server = stand_in(page)
+    monkeypatch.setattr(settings, 'nsd_url', server.url('/ENET/frmGerenciaPaginaFRE.aspx?NumeroSequencialDocumento={nsd}&CodigoTipoInstituicao=1'))
+    return server
+
+
+@pytest.fixture
+def extractor(cvm):
+    extractor = statements_http.StatementsHttpExtractor()
+    yield extractor
+    extractor.close()
+
+
+def test_frame_urls_of_a_saved_nsd_page(extractor):
+    frame_urls = extractor.get_frame_urls(130001)
+
+    assert sorted(frame_urls) == sorted(extractor.normalize('DFs Consolidadas', frame) for frame in [
+        'Balanço Patrimonial Ativo', 'Balanço Patrimonial Passivo', 'Demonstração do Resultado',
+        'Demonstração do Resultado Abrangente', 'Demonstração do Fluxo de Caixa', 'Demonstração de Valor Adicionado'])
+    url = frame_urls[extractor.normalize('DFs Consolidadas', 'Demonstração do Resultado')]
+    assert url.startswith(settings.nsd_url.split('frmGerenciaPaginaFRE')[0] + 'frmDemonstracaoFinanceiraITR.aspx?')
+    assert 'Demonstracao=4' in url and '&amp;' not in url
+
+
+def test_listed_frame_is_fetched_directly(extractor, cvm):
+    frame_html = extractor.get_frame_html(130001, 'DFs Consolidadas', 'Demonstração do Resultado', xpath_ready)
+
+    assert 'ctl00_cphPopUp_tbDados' in frame_html
+    assert cvm.requests[-1][2]['Quadro'] == 'Demonstração do Resultado'
+
+
+def test_frame_left_out_of_the_group_list_is_absent(extractor):
+    frame = 'Demonstração das Mutações do Patrimônio Líquido'
+
+    assert extractor.get_frame_html(130001, 'DFs Consolidadas', frame, xpath_ready) is None
+    assert not extractor.frame_exists(130001, 'DFs Consolidadas', frame)
+
+
+def test_frame_of_a_group_the_page_does_not_list_may_exist(extractor):
+    assert extractor.get_frame_html(130001, 'DFs Individuais', 'Demonstração do Resultado', xpath_ready) is None
+    assert extractor.frame_exists(130001, 'DFs Individuais', 'Demonstração do Resultado')
+
+
+def test_scraper_falls_back_to_the_browser_unless_the_frame_is_absent(cvm, monkeypatch):
+    scraper = statements_scrape.StatementsDataScraper(engine='http')
+    opened = []
+    monkeypatch.setattr(scraper, 'open_nsd_page', lambda nsd: opened.append(nsd) or True)
+    monkeypatch.setattr(scraper, 'get_frame_html', lambda group, frame, xpath: f"<html>{group} {frame}</html>")
+
+    assert scraper.get_frame(130001, 'DFs Consolidadas', 'Demonstração das Mutações do Patrimônio Líquido', xpath_ready) is None
+    assert opened == []
+
+    assert scraper.get_frame(130001, 'DFs Individuais', 'Demonstração do Resultado', xpath_ready) == '<html>DFs Individuais Demonstração do Resultado</html>'
+    assert opened == [130001]
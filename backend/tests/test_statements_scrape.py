@@ -0,0 +1,69 @@
+import pandas as pd
+
+from utils import settings
+from utils import page_cache
+from utils import statements_scrape
+
+import benchmarks
+
+
+class EmptyPool:
+    """
+    A driver pool whose Chrome never starts.
+    """
+
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+        return None
+
+    def release(self, driver):
+        return False
+
+
+def target():
+    return pd.Series({'nsd': 130001, 'company_name': 'ALFA S.A.', 'quarter': '2023-06-30', 'sector': 'Financeiro',
+                      'subsector': 'Bancos', 'segment': 'Bancos', 'version': '1'})
+
+
+def test_company_quarter_is_skipped_when_no_driver_starts(data_folder):
+    pool = EmptyPool()
+    scraper = statements_scrape.StatementsDataScraper(engine='selenium', driver_pool=pool)
+
+    # The first frame is cached, the others need the browser: saving the first alone would leave the NSD incomplete
+    group, frame = settings.financial_data_statements[0]
+    scraper.page_cache.put(page_cache.PageCache.frame_key(130001, group, frame), benchmarks.load_pages('frames')['dre_consolidado_mil.html'])
+    assert scraper.scrape_financial_data(130001, group, frame) is not None
+
+    assert scraper.process_company_quarter_data(target()) == []
+    assert pool.acquired == 1
+    assert scraper.driver is None
+
+
+def test_driver_failure_is_not_an_absent_frame(data_folder):
+    scraper = statements_scrape.StatementsDataScraper(engine='selenium', driver_pool=EmptyPool())
+
+    assert not scraper.open_nsd_page(130001)
+    assert scraper.driver_failed
+    assert scraper.loaded_nsd is None
+
+
+def test_engine_follows_the_settings_at_call_time(data_folder, monkeypatch):
+    monkeypatch.setattr(settings, 'statements_engine', 'selenium')
+    scraper = statements_scrape.StatementsDataScraper(driver_pool=EmptyPool())
+
+    assert scraper.engine == 'selenium'
+    assert scraper.http_extractor is None
+
+
+def test_priority_follows_the_settings_at_call_time(data_folder, monkeypatch):
+    scraper = statements_scrape.StatementsDataScraper(engine='selenium', driver_pool=EmptyPool())
+    monkeypatch.setattr(scraper, 'estimate_cost', lambda row: 7)
+
+    monkeypatch.setattr(settings, 'statements_priority', 'cost')
+    assert scraper.target_priority(target()) == -7
+
+    monkeypatch.setattr(settings, 'statements_priority', 'newest')
+    assert scraper.target_priority(target()) == -pd.Timestamp('2023-06-30').value
@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from utils import settings
+from utils import change_detection
+from utils import statements_standardize
+
+import benchmarks
+
+
+@pytest.fixture
+def report(data_folder, monkeypatch):
+    monkeypatch.setattr(settings, 'standard_incremental', True)
+    return statements_standardize.StandardizedReport()
+
+
+@pytest.fixture
+def statements():
+    """
+    Two companies' math statements over two quarters, one sector: four filings.
+    """
+    return benchmarks.load_frame('math')
+
+
+def changed_filings(report, statements):
+    """
+    Standardize the statements once, correct one value of one filing and return the filings picked up again.
+    """
+    detector = change_detection.ChangeDetector(settings.statements_standard, settings.standard_scope, ['fingerprint'])
+    _, dict_filings = report.filter_changed_filings({'Financeiro': statements}, detector)
+    detector.remember(dict_filings['Financeiro'], scope='Financeiro')
+
+    corrected = statements.copy()
+    corrected.loc[(corrected['company_name'] == 'ALFA S.A.') & (corrected['account'] == '3.01'), 'value'] += 1.0
+    return report.filter_changed_filings({'Financeiro': corrected}, detector)
+
+
+def audit_rows(report, df):
+    """
+    The rows each node of the saved audit matched, keyed by section and node.
+    """
+    report.generate_standard_financial_statements(df.copy())
+    with sqlite3.connect(settings.db_path) as conn:
+        return dict(((section, node), rows) for section, node, rows in conn.execute(
+            f"SELECT section, node, rows FROM {settings.standard_audit_table}"))
+
+
+def test_incremental_run_standardizes_the_changed_filings(report, statements, monkeypatch):
+    monkeypatch.setattr(settings, 'standard_audit', False)
+    dict_df, dict_filings = changed_filings(report, statements)
+
+    assert len(dict_filings['Financeiro']) == 2
+    assert set(dict_df['Financeiro']['company_name']) == {'ALFA S.A.'}
+
+
+def test_audited_run_keeps_the_audit_of_the_whole_sector(report, statements, monkeypatch):
+    monkeypatch.setattr(settings, 'standard_audit', True)
+    full = audit_rows(report, statements)
+
+    dict_df, dict_filings = changed_filings(report, statements)
+
+    assert len(dict_filings['Financeiro']) == 4
+    assert len(dict_df['Financeiro']) == len(statements)
+    assert audit_rows(report, dict_df['Financeiro']) == full
+    assert sum(full.values()) > 0
+
+
+def test_incremental_save_leaves_no_partial_dump(report, statements, data_folder, monkeypatch):
+    monkeypatch.setattr(settings, 'standard_audit', False)
+    dict_df, dict_filings = changed_filings(report, statements)
+
+    saved = report.save_to_db(report.sanitize_db(report.standardize_data(dict_df)), dict_filings)
+
+    assert len(saved['Financeiro']) > 0
+    assert list(data_folder.glob('*.csv')) == []
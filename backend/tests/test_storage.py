@@ -0,0 +1,149 @@
+import os
+import sqlite3
+
+import pytest
+
+from utils import settings
+from utils import storage
+
+columns = ['nsd', 'sector', 'subsector', 'segment', 'company_name', 'quarter', 'version', 'type', 'frame', 'account', 'description', 'value']
+
+
+def upsert(db_path, rows):
+    """
+    Upsert statements rows into the 'Financeiro' sector the way the stage writers do.
+    """
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS Financeiro (
+                {', '.join(f"{column} {'REAL' if column == 'value' else 'TEXT'}" for column in columns)},
+                PRIMARY KEY (company_name, quarter, version, type, frame, account, description)
+            )
+        """)
+        conn.executemany(f"""
+            INSERT INTO Financeiro VALUES ({', '.join('?' for _ in columns)})
+            ON CONFLICT(company_name, quarter, version, type, frame, account, description) DO UPDATE SET
+            nsd=excluded.nsd,
+            value=excluded.value
+        """, rows)
+
+
+def line(company_name, value, version='1', quarter='2023-03-31', account='3.01', nsd='1'):
+    return (nsd, 'Financeiro', 'Bancos', 'Bancos', company_name, quarter, version, 'DFs Consolidadas', 'Demonstração do Resultado', account, 'Receita', value)
+
+
+@pytest.fixture
+def db_path(data_folder):
+    return storage.SqliteStore(settings.statements_file).db_path
+
+
+def test_parquet_copy_follows_an_in_place_correction(db_path):
+    pytest.importorskip('pyarrow')
+    upsert(db_path, [line('ALFA', 10.0), line('BETA', 20.0)])
+
+    store = storage.ParquetStore(settings.statements_file)
+    assert store.read('Financeiro').set_index('company_name')['value'].to_dict() == {'ALFA': 10.0, 'BETA': 20.0}
+    assert not store.refresh('Financeiro')
+
+    # Same rowids and row count, new value
+    upsert(db_path, [line('ALFA', 99.0)])
+    assert store.read('Financeiro').set_index('company_name')['value'].to_dict() == {'ALFA': 99.0, 'BETA': 20.0}
+
+    # The refreshed watermark is kept for the next run
+    store.close()
+    store = storage.ParquetStore(settings.statements_file)
+    assert not store.refresh('Financeiro')
+    store.close()
+
+
+def test_rewriting_the_same_values_keeps_the_copy(db_path):
+    pytest.importorskip('pyarrow')
+    upsert(db_path, [line('ALFA', 10.0)])
+
+    store = storage.ParquetStore(settings.statements_file)
+    store.read('Financeiro')
+    upsert(db_path, [line('ALFA', 10.0)])
+    assert not store.refresh('Financeiro')
+    store.close()
+
+
+def test_change_table_is_not_a_sector(db_path):
+    upsert(db_path, [line('ALFA', 10.0)])
+
+    store = storage.SqliteStore(settings.statements_file)
+    store.mark('Financeiro')
+    assert store.sectors() == ['Financeiro']
+    store.close()
+
+
+@pytest.fixture
+def versions(db_path):
+    """
+    A sector with version 10 after version 9, missing versions, and blank accounts tied with the '0' line.
+    """
+    upsert(db_path, [
+        line('ALFA', 1.0, version='9'),
+        line('ALFA', 2.0, version='10'),
+        line('BETA', 3.0, version=None),
+        line('BETA', 4.0, version='1'),
+        line('GAMA', 5.0, version='2', account=None),
+        line('GAMA', 6.0, version='2', account=''),
+        line('GAMA', 7.0, version='1', account='0'),
+        line('DELTA', 8.0, version=None),
+    ])
+    # Same line and version, told apart by the description: the later row wins
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO Financeiro VALUES ('9', 'Financeiro', 'Bancos', 'Bancos', 'EPSILON', '2023-03-31', '3', 'DFs Consolidadas', 'Demonstração do Resultado', '3.01', 'Receita A', 9.0)")
+        conn.execute("INSERT INTO Financeiro VALUES ('9', 'Financeiro', 'Bancos', 'Bancos', 'EPSILON', '2023-03-31', '3', 'DFs Consolidadas', 'Demonstração do Resultado', '3.01', 'Receita B', 10.0)")
+    return db_path
+
+
+def test_current_view_keeps_one_row_per_statement_line(versions):
+    store = storage.SqliteStore(settings.statements_file)
+    current = store.read('Financeiro', versions='current').set_index('company_name')['value']
+    superseded = store.superseded('Financeiro')
+    store.close()
+
+    assert current.to_dict() == {'ALFA': 2.0, 'BETA': 4.0, 'GAMA': 6.0, 'DELTA': 8.0, 'EPSILON': 10.0}
+    assert sorted(superseded['value']) == [1.0, 3.0, 5.0, 7.0, 9.0]
+
+
+def test_in_memory_rule_matches_the_view(versions):
+    store = storage.SqliteStore(settings.statements_file)
+    df = store.read('Financeiro')
+    current = store.read('Financeiro', versions='current')
+    store.close()
+
+    assert sorted(df[storage.is_current(df)]['value']) == sorted(current['value'])
+    assert sorted(storage.latest_versions(df)['value']) == sorted(current['value'])
+
+
+def test_parquet_copy_flags_the_same_current_rows(versions):
+    pytest.importorskip('pyarrow')
+    store = storage.ParquetStore(settings.statements_file)
+    current = store.read('Financeiro', versions='current')
+    store.close()
+
+    assert sorted(current['value']) == [2.0, 4.0, 6.0, 8.0, 10.0]
+
+
+def test_view_made_by_an_older_rule_is_replaced(versions):
+    with sqlite3.connect(versions) as conn:
+        conn.execute(f"CREATE VIEW Financeiro{settings.current_view_suffix} AS SELECT * FROM Financeiro")
+        conn.execute("CREATE INDEX Financeiro_versions ON Financeiro (company_name)")
+
+    store = storage.SqliteStore(settings.statements_file)
+    assert len(store.read('Financeiro', versions='current')) == 5
+    indexes = {row[0] for row in store.conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    store.close()
+
+    assert 'Financeiro_versions' not in indexes
+    assert 'Financeiro_version_lines' in indexes
+
+
+def test_stages_read_the_sqlite_tables_they_just_wrote(db_path):
+    upsert(db_path, [line('ALFA', 10.0)])
+
+    dfs = storage.load_frames(settings.statements_file)
+    assert dfs['Financeiro']['value'].tolist() == [10.0]
+    assert not os.path.isdir(settings.storage_folder)
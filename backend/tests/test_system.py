@@ -0,0 +1,18 @@
+import sqlite3
+
+from utils import settings
+from utils import system
+
+
+def test_backup_interval_follows_the_settings_at_call_time(data_folder, monkeypatch):
+    db_path = str(data_folder / 'stage.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE sector (value REAL)")
+    monkeypatch.setattr(system, 'last_backup', {})
+
+    monkeypatch.setattr(settings, 'backup_interval', 3600)
+    assert system.db_backup(db_path) is not None
+    assert system.db_backup(db_path) is None
+
+    monkeypatch.setattr(settings, 'backup_interval', 0)
+    assert system.db_backup(db_path) is not None
@@ -0,0 +1,73 @@
+import pytest
+
+from utils import settings
+from utils import table_parser
+
+import benchmarks
+from benchmarks import table_parser as table_parser_benchmark
+
+account, description, value = settings.financial_statements_columns
+
+
+@pytest.fixture(scope='module')
+def pages():
+    """
+    The saved financial statement frames, keyed by file name.
+    """
+    return benchmarks.load_pages('frames')
+
+
+def test_single_pass_matches_read_html_on_fixture_pages(pages):
+    assert table_parser_benchmark.compare(pages) == []
+
+
+def test_values_in_thousands_follow_the_title(pages):
+    thousands = table_parser.parse_financial_table(pages['dre_consolidado_mil.html']).set_index(account)[value]
+    units = table_parser.parse_financial_table(pages['bpa_individual_reais.html']).set_index(account)[value]
+
+    assert thousands['3.01'] == 12345678000.0
+    assert thousands['3.02'] == -8765432000.0
+    assert thousands['3.04.03'] == 0.0
+    assert units['1'] == 48912004512.0
+    assert units['1.02.01.07'] == 1998412330.0
+
+
+def test_accounts_stay_text_and_earnings_per_share_are_dropped(pages):
+    df = table_parser.parse_financial_table(pages['dre_consolidado_mil.html'])
+
+    assert list(df.columns) == settings.financial_statements_columns
+    assert df[value].dtype == float
+    assert '3.10' in set(df[account])  # Not read as the number 3.1
+    assert not df[account].str.startswith('3.99').any()
+    assert len(df) == 23
+
+
+def test_descriptions_get_the_read_html_whitespace_cleanup(pages):
+    df = table_parser.parse_financial_table(pages['dfc_consolidado_mil.html']).set_index(account)
+
+    assert df.loc['6.01.01.01', description] == 'Lucro Líquido do Período'
+    assert df.loc['6.01.01.02', description] == 'Depreciação e Amortização'
+    assert '\n' not in df.loc['6.01', description]
+
+
+def test_frame_without_title_is_skipped(pages):
+    assert table_parser.parse_financial_table(pages['dva_sem_titulo.html']) is None
+
+
+def test_frame_without_rows_gives_an_empty_table(pages):
+    df = table_parser.parse_financial_table(pages['bpp_individual_vazio.html'])
+
+    assert df.empty
+    assert list(df.columns) == settings.financial_statements_columns
+
+
+def test_table_xpath_follows_the_settings_at_call_time(pages, monkeypatch):
+    monkeypatch.setattr(settings, 'financial_table_xpath', '//table[@id="missing"]')
+    tree, rows = table_parser.read_table_rows('<html><body><table><tr><td>a</td></tr></table>'
+                                              '<table id="dados"><tr><td>b</td></tr></table></body></html>')
+    assert rows == [['a', '', '']]
+
+    monkeypatch.setattr(settings, 'financial_table_xpath', '//table[@id="dados"]')
+    tree, rows = table_parser.read_table_rows('<html><body><table><tr><td>a</td></tr></table>'
+                                              '<table id="dados"><tr><td>b</td></tr></table></body></html>')
+    assert rows == [['b', '', '']]
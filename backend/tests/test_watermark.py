@@ -0,0 +1,92 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from utils import settings
+from utils import watermark
+from utils import change_detection
+from utils import math_transformation
+
+
+def upsert(conn, rows):
+    """
+    Upsert statements rows the way the stage writers do, updating the value of a known line in place.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sector (
+            company_name TEXT, quarter TEXT, version TEXT, type TEXT, frame TEXT, account TEXT, description TEXT, value REAL,
+            PRIMARY KEY (company_name, quarter, version, type, frame, account, description)
+        )
+    """)
+    conn.executemany("""
+        INSERT INTO sector VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(company_name, quarter, version, type, frame, account, description) DO UPDATE SET value=excluded.value
+    """, rows)
+    conn.commit()
+
+
+def line(company_name, quarter, value):
+    return (company_name, quarter, '1', 'DRE', 'Consolidado', '3.01', 'Receita', value)
+
+
+@pytest.fixture
+def conn(data_folder):
+    conn = sqlite3.connect(str(data_folder / 'stage.db'))
+    upsert(conn, [line('ALFA', '2023-03-31', 10.0), line('BETA', '2023-03-31', 20.0)])
+    yield conn
+    conn.close()
+
+
+def test_rewrites_count_changed_values_only(conn):
+    before = watermark.table_mark(conn, 'sector')
+
+    upsert(conn, [line('ALFA', '2023-03-31', 10.0)])
+    assert watermark.table_mark(conn, 'sector') == before
+
+    upsert(conn, [line('ALFA', '2023-03-31', 99.0)])
+    max_rowid, row_count, rewrites = watermark.table_mark(conn, 'sector')
+    assert (max_rowid, row_count) == before[:2]
+    assert rewrites == before[2] + 1
+
+
+def test_watermarks_round_trip_and_upgrade_old_tables(data_folder):
+    db_path = str(data_folder / 'main.db')
+    with sqlite3.connect(db_path) as old:
+        old.execute(f"CREATE TABLE {settings.watermark_table} (stage TEXT, sector TEXT, row_id INTEGER, row_count INTEGER, updated_at TEXT, PRIMARY KEY (stage, sector))")
+        old.execute(f"INSERT INTO {settings.watermark_table} VALUES ('math', 'old', 5, 5, '')")
+
+    # A watermark saved before the rewrites were counted never matches, so it forces one full read
+    assert watermark.load_watermarks('math', db_path) == {'old': (5, 5, None)}
+
+    watermark.save_watermarks('math', {'new': (7, 6, 2)}, db_path)
+    assert watermark.load_watermarks('math', db_path)['new'] == (7, 6, 2)
+
+
+def test_math_reads_the_whole_sector_after_an_in_place_correction(conn):
+    math = math_transformation.MathTransformation()
+    _, mark = math.read_sector(conn, 'sector')
+
+    df, mark = math.read_sector(conn, 'sector', mark)
+    assert df is None
+
+    upsert(conn, [line('ALFA', '2023-03-31', 99.0)])
+    df, mark = math.read_sector(conn, 'sector', mark)
+    assert len(df) == 2
+    assert df.set_index('company_name').loc['ALFA', 'value'] == 99.0
+
+    df, _ = math.read_sector(conn, 'sector', mark)
+    assert df is None
+
+
+def test_fingerprints_are_rebuilt_after_an_in_place_correction(conn):
+    detector = change_detection.ChangeDetector('test', ['company_name', 'quarter', 'account'], ['value'])
+    assert detector.sync_table(conn, 'sector') == 2
+    assert detector.sync_table(conn, 'sector') == 0
+
+    upsert(conn, [line('ALFA', '2023-03-31', 99.0)])
+    assert detector.sync_table(conn, 'sector') == 2
+
+    corrected = pd.DataFrame({'company_name': ['ALFA'], 'quarter': ['2023-03-31'], 'account': ['3.01'], 'value': [99.0]})
+    new, changed = detector.detect(corrected, 'sector')
+    assert not new.any() and not changed.any()
@@ -0,0 +1,215 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+def prefix_bound(prefix):
+    """
+    Return the smallest string sorting after every string that starts with a prefix.
+
+    Parameters:
+    - prefix (str): The prefix.
+
+    Returns:
+    str: The bound, or None if no string sorts after them all (an empty prefix).
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+class AccountIndex:
+    """
+    The account hierarchy of a loaded frame, built once and queried by prefix and level.
+
+    Distinct accounts are kept sorted, so every account starting with a prefix, like the descendants of '1.01',
+    sits in one contiguous range found by binary search. The rows are laid out twice, by account and by level
+    then account, so the rows of such a range, or of one level inside it, are a single slice. The depth of an
+    account is its number of dot-separated parts and its parent is the account without its last part, when the
+    frame has it. Rows with a missing account are never matched.
+    """
+
+    def __init__(self, accounts, codes=None):
+        """
+        Build the index.
+
+        Parameters:
+        - accounts (Series or array): The account of every row, or the distinct accounts if codes is given.
+        - codes (ndarray): The position in accounts of every row's account, as returned by pd.factorize.
+        """
+        # Step 1: Distinct accounts and the account of each row
+        if codes is None:
+            codes, accounts = pd.factorize(pd.Series(accounts), use_na_sentinel=False)
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.accounts = np.asarray(accounts, dtype=object)
+
+        # Step 2: Sort the distinct accounts and measure their depth and parent
+        is_text = np.array([isinstance(account, str) for account in self.accounts], dtype=bool)
+        order = np.flatnonzero(is_text)
+        order = order[np.argsort(self.accounts[order].astype(str), kind='stable')]
+        self.order = order  # Distinct account of each sorted position
+        self.keys = self.accounts[order].astype(str)  # Sorted accounts, for binary search
+        self.rank = np.full(len(self.accounts), -1, dtype=np.int64)
+        self.rank[order] = np.arange(len(order))
+
+        self.depth = np.full(len(self.accounts), -1, dtype=np.int64)
+        self.depth[is_text] = [account.count('.') + 1 for account in self.accounts[is_text]]
+
+        position = {}
+        for i in order:
+            position.setdefault(self.accounts[i], i)
+        self.parent = np.array([position.get(account.rpartition('.')[0], -1) if isinstance(account, str) and '.' in account else -1
+                                for account in self.accounts], dtype=np.int64)
+
+        # Step 3: Lay the rows out by account, and by level then account, keeping row order within an account
+        row_rank = self.rank[self.codes] if len(self.codes) else np.array([], dtype=np.int64)
+        row_depth = self.depth[self.codes] if len(self.codes) else np.array([], dtype=np.int64)
+        valid = np.flatnonzero(row_rank >= 0)
+
+        self.by_rank = valid[np.argsort(row_rank[valid], kind='stable')]
+        self.rank_offsets = np.searchsorted(row_rank[self.by_rank], np.arange(len(order) + 1), side='left')
+
+        self.by_level = valid[np.lexsort((row_rank[valid], row_depth[valid]))]
+        self.level_depth = row_depth[self.by_level]
+        self.level_rank = row_rank[self.by_level]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def prefix_range(self, prefix):
+        """
+        Find the sorted positions of the accounts starting with a prefix.
+
+        Parameters:
+        - prefix (str): The prefix; '' matches every account.
+
+        Returns:
+        tuple: (start, end) of the range in self.keys.
+        """
+        bound = prefix_bound(prefix)
+        start = int(np.searchsorted(self.keys, prefix, side='left'))
+        end = len(self.keys) if bound is None else int(np.searchsorted(self.keys, bound, side='left'))
+        return start, max(start, end)
+
+    def accounts_with_prefix(self, prefix, level=None):
+        """
+        List the distinct accounts starting with a prefix.
+
+        Parameters:
+        - prefix (str): The prefix.
+        - level (int): Only accounts of this depth. None keeps every depth.
+
+        Returns:
+        list: The accounts, sorted.
+        """
+        start, end = self.prefix_range(prefix)
+        accounts = self.order[start:end]
+        if level is not None:
+            accounts = accounts[self.depth[accounts] == int(level)]
+        return self.accounts[accounts].tolist()
+
+    def descendants(self, account, include_self=True):
+        """
+        List the accounts below an account in the hierarchy, such as '1.01.02' and '1.01.02.03' below '1.01'.
+
+        Parameters:
+        - account (str): The account.
+        - include_self (bool): Whether to include the account itself when the frame has it.
+
+        Returns:
+        list: The accounts, sorted.
+        """
+        accounts = self.accounts_with_prefix(f"{account}.")
+        start, end = self.prefix_range(account)
+        if include_self and start < end and self.keys[start] == account:
+            accounts = [account] + accounts
+        return accounts
+
+    def children(self, account):
+        """
+        List the accounts directly below an account.
+
+        Parameters:
+        - account (str): The account.
+
+        Returns:
+        list: The accounts, sorted.
+        """
+        return self.accounts_with_prefix(f"{account}.", level=account.count('.') + 2)
+
+    def rows(self, prefix='', level=None):
+        """
+        Return the rows whose account starts with a prefix, optionally only at one level.
+
+        Parameters:
+        - prefix (str): The prefix; '' matches every account.
+        - level (int): Only accounts of this depth. None keeps every depth.
+
+        Returns:
+        ndarray: The row positions, ascending.
+        """
+        start, end = self.prefix_range(prefix)
+        if level is None:
+            rows = self.by_rank[self.rank_offsets[start]:self.rank_offsets[end]]
+        else:
+            level = int(level)
+            first = np.searchsorted(self.level_depth, level, side='left')
+            last = np.searchsorted(self.level_depth, level, side='right')
+            ranks = self.level_rank[first:last]
+            rows = self.by_level[first + np.searchsorted(ranks, start, side='left'):first + np.searchsorted(ranks, end, side='left')]
+        return np.sort(rows)
+
+    def prefix_flags(self, prefixes):
+        """
+        Flag the distinct accounts starting with any of several prefixes.
+
+        Parameters:
+        - prefixes (iterable): The prefixes; missing values are ignored.
+
+        Returns:
+        ndarray: One flag per distinct account, aligned with self.accounts.
+        """
+        prefixes = [prefix for prefix in prefixes if isinstance(prefix, str)]
+        flags = np.zeros(len(self.accounts), dtype=bool)
+        if not prefixes:
+            return flags
+
+        # Mark each prefix range, then keep the sorted positions covered by at least one
+        ranges = np.array([self.prefix_range(prefix) for prefix in prefixes], dtype=np.int64)
+        depth = np.zeros(len(self.keys) + 1, dtype=np.int64)
+        np.add.at(depth, ranges[:, 0], 1)
+        np.add.at(depth, ranges[:, 1], -1)
+        flags[self.order] = np.cumsum(depth[:-1]) > 0
+        return flags
+
+    def prefix_mask(self, prefixes):
+        """
+        Flag the rows whose account starts with any of several prefixes, like str.startswith(tuple(prefixes)).
+
+        Parameters:
+        - prefixes (iterable): The prefixes.
+
+        Returns:
+        ndarray: One flag per row.
+        """
+        return self.prefix_flags(prefixes)[self.codes]
+
+    def prefix_rows(self, prefixes):
+        """
+        Return the rows whose account starts with any of several prefixes.
+
+        Parameters:
+        - prefixes (iterable): The prefixes.
+
+        Returns:
+        ndarray: The row positions, ascending.
+        """
+        covered = self.prefix_flags(prefixes)[self.order]
+        if not covered.any():
+            return np.array([], dtype=np.int64)
+
+        # Runs of covered sorted positions are contiguous slices of the rows laid out by account
+        edges = np.diff(np.concatenate(([0], covered.astype(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        return np.sort(np.concatenate([self.by_rank[self.rank_offsets[start]:self.rank_offsets[end]] for start, end in zip(starts, ends)]))
@@ -0,0 +1,157 @@
+import asyncio
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+from utils import system
+from utils import settings
+
+
+class HostRateLimiter:
+    """
+    Spaces out request starts so that each host receives at most a fixed number of requests per second.
+    """
+
+    def __init__(self, requests_per_second):
+        """
+        Initialize the limiter.
+
+        Parameters:
+        - requests_per_second (float): Maximum request starts per second for each host. 0 disables the limit.
+        """
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.next_slot = {}
+        self.lock = asyncio.Lock()
+
+    async def wait(self, host):
+        """
+        Wait until the next free request slot for the given host.
+
+        Parameters:
+        - host (str): The host name the request is going to.
+
+        Returns:
+        bool: True once the caller may start its request.
+        """
+        if not self.interval:
+            return True
+
+        # Reserve the next slot for this host under the lock, then sleep outside of it
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+
+        delay = slot - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return True
+
+
+class AsyncPageFetcher:
+    """
+    A concurrent HTTP fetcher with a bounded number of in-flight requests, per-host rate limiting
+    and keep-alive connection reuse. Results are yielded in the same order as the input items.
+    """
+
+    def __init__(self, max_concurrency=None, requests_per_second=None, timeout=None, retries=None):
+        """
+        Initialize the fetcher with settings, allowing each value to be overridden.
+
+        Parameters:
+        - max_concurrency (int): Maximum number of requests in flight at once.
+        - requests_per_second (float): Maximum request starts per second for each host.
+        - timeout (float): Total timeout in seconds for a single request.
+        - retries (int): Number of extra attempts for a failed request.
+        """
+        self.max_concurrency = max_concurrency or settings.nsd_max_concurrency
+        self.requests_per_second = requests_per_second if requests_per_second is not None else settings.nsd_requests_per_second
+        self.timeout = timeout or settings.nsd_request_timeout
+        self.retries = retries if retries is not None else settings.nsd_request_retries
+
+    async def fetch(self, session, url, semaphore, limiter):
+        """
+        Fetch a single URL, retrying with a growing backoff on failure.
+
+        Parameters:
+        - session (aiohttp.ClientSession): The shared session holding the keep-alive connections.
+        - url (str): The URL to fetch.
+        - semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
+        - limiter (HostRateLimiter): Spaces out request starts per host.
+
+        Returns:
+        str: The response body, or None if every attempt failed.
+        """
+        host = urlparse(url).netloc
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    await limiter.wait(host)
+                    async with session.get(url, headers=system.header_random()) as response:
+                        response.raise_for_status()
+                        html = await response.text()
+                        return html
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    system.log_error(f"Error fetching {url}: {e}")
+                    return None
+                await asyncio.sleep(settings.wait_time * (attempt + 1))
+
+        return None
+
+    async def fetch_ordered(self, items, url_builder, cached_page=None):
+        """
+        Fetch the pages for all items concurrently and yield them in input order.
+
+        Only a window of 2 x max_concurrency requests is scheduled ahead of the consumer,
+        so memory stays bounded and stopping early cancels the outstanding requests.
+
+        Parameters:
+        - items (list): The items to fetch, for example NSD numbers.
+        - url_builder (callable): Builds the URL for one item.
+        - cached_page (callable): Optional lookup returning a stored page for one item, or None.
+
+        Yields:
+        tuple: (item, html) where html is None if the page could not be fetched.
+        """
+        items = list(items)
+        window = self.max_concurrency * 2
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = HostRateLimiter(self.requests_per_second)
+
+        # One connector for the whole run keeps connections alive between requests
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.max_concurrency)
+        client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+            pending = {}
+            next_to_schedule = 0
+            try:
+                for next_to_yield in range(len(items)):
+                    # Keep the scheduling window full ahead of the consumer
+                    while next_to_schedule < len(items) and next_to_schedule - next_to_yield < window:
+                        item = items[next_to_schedule]
+                        html = cached_page(item) if cached_page else None
+
+                        # Stored pages are served without a request
+                        if html:
+                            task = asyncio.get_running_loop().create_future()
+                            task.set_result(html)
+                        else:
+                            task = asyncio.create_task(self.fetch(session, url_builder(item), semaphore, limiter))
+
+                        pending[next_to_schedule] = task
+                        next_to_schedule += 1
+
+                    html = await pending.pop(next_to_yield)
+                    yield items[next_to_yield], html
+
+            finally:
+                # Cancel whatever is still in flight when the consumer stops early
+                for task in pending.values():
+                    task.cancel()
+                await asyncio.gather(*pending.values(), return_exceptions=True)
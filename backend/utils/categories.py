@@ -0,0 +1,181 @@
+import threading
+
+import pandas as pd
+
+from utils import settings
+
+
+class CategoryRegistry:
+    """
+    Shared dictionaries for the repeated text columns of the statements, such as company names and accounts.
+
+    Each column has one dictionary for every sector, and values are only ever appended to it, so a value keeps
+    the same integer code for the whole run. Frames encoded with the registry hold these columns as pandas
+    categoricals of the same dtype, which keeps concatenations and merges across sectors on integer codes
+    instead of falling back to Python strings.
+    """
+
+    def __init__(self, columns=None):
+        """
+        Initialize empty dictionaries.
+
+        Parameters:
+        - columns (list): The columns to encode. Defaults to settings.category_columns.
+        """
+        self.columns = list(columns or settings.category_columns)
+        self.categories = {column: [] for column in self.columns}
+        self.codes = {column: {} for column in self.columns}
+        self.dtypes = {}
+        self.lock = threading.Lock()
+
+    def register(self, df, columns=None):
+        """
+        Add the values of a frame that are not in the dictionaries yet.
+
+        Parameters:
+        - df (DataFrame): The frame.
+        - columns (list): The columns to register. None registers every registry column.
+
+        Returns:
+        int: The number of values added.
+        """
+        added = 0
+        for column in columns or self.columns:
+            if column not in df.columns:
+                continue
+
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                uniques = values.cat.categories
+            else:
+                uniques = pd.unique(values.dropna())
+
+            with self.lock:
+                codes = self.codes[column]
+                for value in uniques:
+                    if value not in codes:
+                        codes[value] = len(self.categories[column])
+                        self.categories[column].append(value)
+                        added += 1
+
+        return added
+
+    def dtype(self, column):
+        """
+        Return the categorical dtype holding the current dictionary of a column.
+
+        Parameters:
+        - column (str): The column name.
+
+        Returns:
+        CategoricalDtype: The dtype, shared by every frame encoded since the dictionary last grew.
+        """
+        with self.lock:
+            size = len(self.categories[column])
+            cached = self.dtypes.get(column)
+            if cached is None or len(cached.categories) != size:
+                cached = pd.CategoricalDtype(self.categories[column][:size])
+                self.dtypes[column] = cached
+            return cached
+
+    def cast(self, df, columns=None):
+        """
+        Convert the registered columns of a frame to the current categorical dtypes.
+        Values must have been registered first.
+
+        Parameters:
+        - df (DataFrame): The frame, modified in place.
+        - columns (list): The columns to convert. None converts every registry column.
+
+        Returns:
+        DataFrame: The same frame.
+        """
+        for column in columns or self.columns:
+            if column not in df.columns:
+                continue
+
+            dtype = self.dtype(column)
+            if df[column].dtype == dtype:
+                continue
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                # Dictionaries only grow at the end, so the existing codes stay valid
+                df[column] = df[column].cat.set_categories(dtype.categories)
+            else:
+                df[column] = df[column].astype(dtype)
+        return df
+
+    def encode(self, df):
+        """
+        Register the values of a frame and convert its columns to categoricals.
+
+        Parameters:
+        - df (DataFrame): The frame, modified in place.
+
+        Returns:
+        DataFrame: The same frame.
+        """
+        self.register(df)
+        return self.cast(df)
+
+    def align(self, dfs):
+        """
+        Bring frames encoded at different times to the latest dictionaries.
+
+        Parameters:
+        - dfs (dict): DataFrames keyed by sector, modified in place.
+
+        Returns:
+        dict: The same dictionary.
+        """
+        for df in dfs.values():
+            self.cast(df)
+        return dfs
+
+    def concat(self, frames, **kwargs):
+        """
+        Concatenate frames keeping categorical columns categorical, even if some frames hold them as plain strings.
+        Columns that are not categorical in any frame are left alone.
+
+        Parameters:
+        - frames (list): The frames.
+        - kwargs: Passed to pd.concat.
+
+        Returns:
+        DataFrame: The concatenated frame.
+        """
+        frames = [df for df in frames if df is not None]
+        columns = [column for column in self.columns
+                   if any(column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames)]
+        if not columns:
+            return pd.concat(frames, **kwargs)
+
+        for df in frames:
+            self.register(df, columns)
+        return pd.concat([self.cast(df.copy(), columns) for df in frames], **kwargs)
+
+    def decode(self, df):
+        """
+        Convert the registered columns of a frame back to Python strings.
+
+        Parameters:
+        - df (DataFrame): The frame, modified in place.
+
+        Returns:
+        DataFrame: The same frame.
+        """
+        for column in self.columns:
+            if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype(object)
+        return df
+
+    def stats(self):
+        """
+        Report the dictionary sizes.
+
+        Returns:
+        dict: The number of distinct values per column.
+        """
+        with self.lock:
+            return {column: len(values) for column, values in self.categories.items()}
+
+registry = CategoryRegistry()  # Shared by every loader of the process
@@ -0,0 +1,335 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from utils import system
+from utils import settings
+from utils import watermark
+
+
+class ChangeDetector:
+    """
+    Finds the new and changed rows of a frame with one vectorized hash lookup.
+
+    Every row is reduced to a 64-bit hash of its key columns and a 64-bit fingerprint of the columns whose change
+    matters, such as the value and the version. A row is new when its key hash is unknown and changed when the key
+    is known with another fingerprint. Known fingerprints come either from a frame held in memory or from the
+    fingerprints table of the main database, where they persist between runs per stage and scope.
+    """
+
+    def __init__(self, stage, key_columns, fingerprint_columns=None, db_path=None):
+        """
+        Initialize the detector.
+
+        Parameters:
+        - stage (str): The name the fingerprints are stored under, for example 'statements'.
+        - key_columns (list): The columns identifying a row.
+        - fingerprint_columns (list): The columns whose change makes a row changed. None uses every other column of the frame.
+        - db_path (str): The database holding the fingerprints table. Defaults to settings.db_path.
+        """
+        self.stage = stage
+        self.key_columns = list(key_columns)
+        self.fingerprint_columns = list(fingerprint_columns) if fingerprint_columns is not None else None
+        self.db_path = db_path or settings.db_path
+        self.known = {}  # Persisted (key hashes index, fingerprints) per scope, loaded on first use
+        self.new_rows = 0
+        self.changed_rows = 0
+        self.unchanged_rows = 0
+
+    def columns_of(self, df):
+        """
+        Return the fingerprint columns present in a frame.
+
+        Parameters:
+        - df (DataFrame): The frame.
+
+        Returns:
+        list: The fingerprint columns.
+        """
+        if self.fingerprint_columns is None:
+            return [column for column in df.columns if column not in self.key_columns]
+        return self.fingerprint_columns
+
+    @staticmethod
+    def hash_columns(df, columns):
+        """
+        Hash the given columns of every row into one signed 64-bit integer, as stored by SQLite.
+
+        Categorical columns hash like their values, so encoded and plain frames give the same hashes, and numbers
+        hash as floats, so an integer column read with missing values still matches.
+
+        Parameters:
+        - df (DataFrame): The frame.
+        - columns (list): The columns to hash; missing columns hash as empty.
+
+        Returns:
+        ndarray: One int64 hash per row.
+        """
+        if not columns:
+            return np.zeros(len(df), dtype=np.int64)
+
+        data = df.reindex(columns=columns)
+        for column in columns:
+            if pd.api.types.is_numeric_dtype(data[column]) and not pd.api.types.is_bool_dtype(data[column]):
+                data[column] = data[column].astype(float) + 0.0  # -0.0 becomes 0.0
+        return pd.util.hash_pandas_object(data, index=False).to_numpy().view(np.int64)
+
+    @classmethod
+    def group_fingerprints(cls, df, group_columns, columns=None, salt=0):
+        """
+        Fingerprint each group of rows, such as a filing, from the hashes of its rows.
+
+        The row hashes of a group are summed, so the fingerprint does not depend on row order, and XORed with a
+        salt, such as a hash of the definitions the rows are processed with.
+
+        Parameters:
+        - df (DataFrame): The rows.
+        - group_columns (list): The columns identifying a group.
+        - columns (list): The columns to hash. None hashes every column.
+        - salt (int): A signed 64-bit integer mixed into every fingerprint.
+
+        Returns:
+        tuple: (groups, codes) where groups holds the group columns and the 'fingerprint' of each group,
+               and codes gives the group of each row.
+        """
+        row_hashes = cls.hash_columns(df, list(df.columns) if columns is None else columns).view(np.uint64)
+
+        codes = df.groupby(group_columns, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+        sums = np.zeros(codes.max() + 1 if len(codes) else 0, dtype=np.uint64)
+        np.add.at(sums, codes, row_hashes)  # Wraps around at 2**64
+
+        _, first = np.unique(codes, return_index=True)
+        groups = df.iloc[first][group_columns].reset_index(drop=True)
+        groups['fingerprint'] = sums.view(np.int64) ^ np.int64(salt)
+        return groups, codes
+
+    def hashes(self, df, columns=None):
+        """
+        Return the key hashes and fingerprints of a frame.
+
+        Parameters:
+        - df (DataFrame): The frame.
+        - columns (list): The fingerprint columns. None uses self.columns_of(df).
+
+        Returns:
+        tuple: (key hashes, fingerprints) as int64 arrays.
+        """
+        columns = self.columns_of(df) if columns is None else columns
+        return self.hash_columns(df, self.key_columns), self.hash_columns(df, columns)
+
+    def load(self, scope=''):
+        """
+        Load the persisted fingerprints of a scope, once per detector.
+
+        Parameters:
+        - scope (str): The scope, for example a sector table name.
+
+        Returns:
+        tuple: (pd.Index of key hashes, ndarray of fingerprints)
+        """
+        if scope not in self.known:
+            try:
+                with sqlite3.connect(self.db_path) as conn:
+                    self.create_table(conn)
+                    rows = conn.execute(f"SELECT key_hash, fingerprint FROM {settings.fingerprint_table} WHERE stage = ? AND scope = ?",
+                                        (self.stage, scope)).fetchall()
+                keys = np.array([row[0] for row in rows], dtype=np.int64)
+                fingerprints = np.array([row[1] for row in rows], dtype=np.int64)
+            except sqlite3.Error as e:
+                system.log_error(f"Error loading {self.stage} fingerprints of {scope}: {e}")
+                keys, fingerprints = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+            self.known[scope] = (pd.Index(keys), fingerprints)
+        return self.known[scope]
+
+    def detect(self, df, scope='', existing=None):
+        """
+        Flag the new and changed rows of a frame.
+
+        Parameters:
+        - df (DataFrame): The incoming rows.
+        - scope (str): The persisted scope to compare with, used when existing is None.
+        - existing (DataFrame): Rows to compare with instead of the persisted fingerprints.
+
+        Returns:
+        tuple: (is_new, is_changed) boolean arrays aligned with df.
+        """
+        columns = self.columns_of(df)
+        if existing is not None:
+            known_keys, known_fingerprints = self.hashes(existing, columns)
+            known_keys = pd.Index(known_keys)
+            if not known_keys.is_unique:
+                # Several known rows per key: keep the last one, like a later upsert would
+                is_last = ~known_keys.duplicated(keep='last')
+                known_keys, known_fingerprints = known_keys[is_last], known_fingerprints[is_last]
+        else:
+            known_keys, known_fingerprints = self.load(scope)
+
+        key_hashes, fingerprints = self.hashes(df, columns)
+        position = known_keys.get_indexer(key_hashes)
+
+        is_new = position < 0
+        is_changed = np.zeros(len(df), dtype=bool)
+        is_changed[~is_new] = known_fingerprints[position[~is_new]] != fingerprints[~is_new]
+
+        self.new_rows += int(is_new.sum())
+        self.changed_rows += int(is_changed.sum())
+        self.unchanged_rows += int(len(df) - is_new.sum() - is_changed.sum())
+        return is_new, is_changed
+
+    def changes(self, df, scope='', existing=None):
+        """
+        Return the new and changed rows of a frame.
+
+        Parameters:
+        - df (DataFrame): The incoming rows.
+        - scope (str): The persisted scope to compare with, used when existing is None.
+        - existing (DataFrame): Rows to compare with instead of the persisted fingerprints.
+
+        Returns:
+        DataFrame: The rows of df that are new or changed, in their original order.
+        """
+        if df is None or df.empty:
+            return df
+        is_new, is_changed = self.detect(df, scope, existing)
+        return df[is_new | is_changed]
+
+    def remember(self, df, scope=''):
+        """
+        Persist the fingerprints of rows once they are safely stored, replacing older fingerprints of the same keys.
+
+        Parameters:
+        - df (DataFrame): The stored rows.
+        - scope (str): The scope, for example a sector table name.
+
+        Returns:
+        int: The number of fingerprints written.
+        """
+        if df is None or df.empty:
+            return 0
+
+        key_hashes, fingerprints = self.hashes(df)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                self.create_table(conn)
+                conn.executemany(f"""
+                    INSERT INTO {settings.fingerprint_table} (stage, scope, key_hash, fingerprint)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(stage, scope, key_hash) DO UPDATE SET
+                    fingerprint=excluded.fingerprint
+                """, [(self.stage, scope, int(key), int(fingerprint)) for key, fingerprint in zip(key_hashes, fingerprints)])
+        except sqlite3.Error as e:
+            system.log_error(f"Error saving {self.stage} fingerprints of {scope}: {e}")
+            return 0
+
+        self.known.pop(scope, None)  # Reloaded with the new fingerprints on next use
+        return len(df)
+
+    def discard(self, df, scope=''):
+        """
+        Drop the persisted fingerprints of rows that no longer exist, so they are not found missing again.
+
+        Parameters:
+        - df (DataFrame): The removed rows, with the key columns.
+        - scope (str): The scope, for example a sector table name.
+
+        Returns:
+        int: The number of fingerprints dropped.
+        """
+        if df is None or df.empty:
+            return 0
+
+        key_hashes = self.hash_columns(df, self.key_columns)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                self.create_table(conn)
+                conn.executemany(f"DELETE FROM {settings.fingerprint_table} WHERE stage = ? AND scope = ? AND key_hash = ?",
+                                 [(self.stage, scope, int(key)) for key in key_hashes])
+        except sqlite3.Error as e:
+            system.log_error(f"Error dropping {self.stage} fingerprints of {scope}: {e}")
+            return 0
+
+        self.known.pop(scope, None)
+        return len(df)
+
+    def forget(self, scope=''):
+        """
+        Drop the persisted fingerprints of a scope.
+
+        Parameters:
+        - scope (str): The scope.
+
+        Returns:
+        bool: True once dropped.
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                self.create_table(conn)
+                conn.execute(f"DELETE FROM {settings.fingerprint_table} WHERE stage = ? AND scope = ?", (self.stage, scope))
+        except sqlite3.Error as e:
+            system.log_error(f"Error dropping {self.stage} fingerprints of {scope}: {e}")
+            return False
+
+        self.known.pop(scope, None)
+        return True
+
+    def sync_table(self, conn, table, scope=None):
+        """
+        Bring the persisted fingerprints of a scope up to date with an SQLite table, reading only the rows added
+        since the last sync. If rows were deleted, renumbered or rewritten in place, the fingerprints are rebuilt
+        from the whole table.
+
+        Parameters:
+        - conn (sqlite3.Connection): The connection to the database holding the table.
+        - table (str): The table name.
+        - scope (str): The scope. Defaults to the table name.
+
+        Returns:
+        int: The number of table rows read.
+        """
+        scope = scope or table
+        stage = f"fingerprints {self.stage}"
+        columns = ', '.join(dict.fromkeys(self.key_columns + (self.fingerprint_columns or [])))
+
+        max_rowid, row_count, rewrites = watermark.table_mark(conn, table)
+        last_rowid, last_count, last_rewrites = watermark.load_watermarks(stage, self.db_path).get(scope, (0, 0, rewrites))
+
+        new_rows = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid > ?", (last_rowid,)).fetchone()[0]
+        if max_rowid < last_rowid or new_rows != row_count - last_count or rewrites != last_rewrites:
+            # Rows moved or were rewritten below the watermark; start over
+            self.forget(scope)
+            last_rowid = 0
+
+        if max_rowid == last_rowid:
+            return 0
+
+        df = pd.read_sql_query(f"SELECT DISTINCT {columns} FROM {table} WHERE rowid > ?", conn, params=(last_rowid,))
+        self.remember(df, scope)
+        watermark.save_watermarks(stage, {scope: (max_rowid, row_count, rewrites)}, self.db_path)
+        return len(df)
+
+    def create_table(self, conn):
+        """
+        Create the fingerprints table if needed.
+
+        Parameters:
+        - conn (sqlite3.Connection): The connection to the main database.
+        """
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {settings.fingerprint_table} (
+                stage TEXT,
+                scope TEXT,
+                key_hash INTEGER,
+                fingerprint INTEGER,
+                PRIMARY KEY (stage, scope, key_hash)
+            ) WITHOUT ROWID
+        """)
+
+    def stats(self):
+        """
+        Report how many rows were found new, changed and unchanged.
+
+        Returns:
+        dict: new, changed and unchanged row counts.
+        """
+        return {'new': self.new_rows, 'changed': self.changed_rows, 'unchanged': self.unchanged_rows}
@@ -3,6 +3,8 @@ import os
 import shutil
 import time
 import re
+import threading
+import pandas as pd
 from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
@@ -12,6 +14,8 @@ from cachetools import cached, TTLCache
 from utils import system
 from utils import settings
 from utils import selenium_driver
+from utils import scheduler
+from utils import change_detection
 
 class CompanyScraper:
     # Configuração de cache
@@ -22,6 +26,8 @@ class CompanyScraper:
         self.driver, self.driver_wait = selenium_driver.initialize_driver()
         self.db_folder = settings.db_folder
         self.db_name = settings.db_name
+        self.change_detector = change_detection.ChangeDetector(settings.company_table, ['company_name'],
+                                                               [column for column in settings.company_columns if column != 'company_name'])
 
     @cached(cache)
     def get_raw_code(self):
@@ -144,57 +150,75 @@ class CompanyScraper:
             "registrar": registrar,
         }
 
-    def get_company_info(self):
+    def get_company_detail(self, company_name, info, driver, driver_wait):
+        """
+        Search a company on the B3 site and add its detail page data to its ticker info.
+
+        Args:
+            company_name (str): The company name to search for.
+            info (dict): The ticker info of the company, updated in place.
+            driver (webdriver.Chrome): The WebDriver to use.
+            driver_wait (WebDriverWait): Its wait object.
+
+        Returns:
+            dict: The updated info.
+        """
+        try:
+            driver.get(settings.company_url)
+            search_field_xpath = '//*[@id="keyword"]'
+            nav_tab_content_xpath = '//*[@id="nav-tabContent"]'
+            overview_xpath = '//*[@id="divContainerIframeB3"]/app-companies-overview/div/div[1]/div/div'
+
+            search_field = system.wait_forever(driver_wait, search_field_xpath)
+            search_field.clear()
+            search_field.send_keys(company_name)
+            search_field.send_keys(Keys.RETURN)
+
+            system.wait_forever(driver_wait, nav_tab_content_xpath)
+            soup = BeautifulSoup(driver.page_source, 'html.parser')
+            cards = soup.find_all('div', class_='card-body')
+
+            company_found = False
+            for card in cards:
+                card_ticker = system.clean_text(card.find('h5', class_='card-title2').text)
+                if card_ticker == info['ticker']:
+                    card_xpath = f'//h5[text()="{card_ticker}"]'
+                    system.click(card_xpath, driver_wait)
+                    system.wait_forever(driver_wait, overview_xpath)
+
+                    match = re.search(r'/main/(\d+)/', driver.current_url)
+                    cvm_code = match.group(1) if match else ''
+                    info['cvm_code'] = cvm_code
+
+                    detail_soup = BeautifulSoup(driver.page_source, 'html.parser')
+                    company_data = self.extract_company_data(detail_soup)
+
+                    info.update(company_data)
+                    company_found = True
+                    break
+
+        except Exception as e:
+            system.log_error(f"Error processing company {company_name}: {e}")
+
+        return info
+
+    def get_company_info(self, thread=False):
         existing_companies = self.load_existing_data()
         new_companies = self.get_company_ticker()
 
-        all_company_info = {}
-
         companies_to_process = {name: info for name, info in new_companies.items() if name not in existing_companies}
         total_companies_to_process = len(companies_to_process)
 
+        if thread:
+            self.get_company_info_thread(companies_to_process)
+            return existing_companies, companies_to_process
+
         start_time = time.time()
         all_data = []
 
         for i, (company_name, info) in enumerate(companies_to_process.items()):
-            try:
-                self.driver.get(settings.company_url)
-                search_field_xpath = '//*[@id="keyword"]'
-                nav_tab_content_xpath = '//*[@id="nav-tabContent"]'
-                overview_xpath = '//*[@id="divContainerIframeB3"]/app-companies-overview/div/div[1]/div/div'
-
-                search_field = system.wait_forever(self.driver_wait, search_field_xpath)
-                search_field.clear()
-                search_field.send_keys(company_name)
-                search_field.send_keys(Keys.RETURN)
-
-                system.wait_forever(self.driver_wait, nav_tab_content_xpath)
-                soup = BeautifulSoup(self.driver.page_source, 'html.parser')
-                cards = soup.find_all('div', class_='card-body')
-
-                company_found = False
-                for card in cards:
-                    card_ticker = system.clean_text(card.find('h5', class_='card-title2').text)
-                    if card_ticker == info['ticker']:
-                        card_xpath = f'//h5[text()="{card_ticker}"]'
-                        system.click(card_xpath, self.driver_wait)
-                        system.wait_forever(self.driver_wait, overview_xpath)
-
-                        match = re.search(r'/main/(\d+)/', self.driver.current_url)
-                        cvm_code = match.group(1) if match else ''
-                        info['cvm_code'] = cvm_code
-
-                        detail_soup = BeautifulSoup(self.driver.page_source, 'html.parser')
-                        company_data = self.extract_company_data(detail_soup)
-
-                        info.update(company_data)
-                        company_found = True
-                        break
-
-            except Exception as e:
-                system.log_error(f"Error processing company {company_name}: {e}")
-
-            all_company_info[company_name] = info
+            info = self.get_company_detail(company_name, info, self.driver, self.driver_wait)
+
             extra_info = [info['ticker'], info['cvm_code'], company_name]
             system.print_info(i, extra_info, start_time, total_companies_to_process)
 
@@ -206,6 +230,59 @@ class CompanyScraper:
 
         return existing_companies, companies_to_process
 
+    def get_company_info_thread(self, companies_to_process):
+        """
+        Get the company details with several WebDrivers, one company at a time from a shared queue.
+
+        Args:
+            companies_to_process (dict): Ticker info of the companies to process, keyed by company name. Updated in place.
+
+        Returns:
+            dict: The updated companies.
+        """
+        driver_pool = selenium_driver.DriverPool()
+        work_scheduler = scheduler.WorkScheduler(label='Company scheduler')
+        total_companies_to_process = len(companies_to_process)
+        start_time = time.time()
+        save_lock = threading.Lock()
+        all_data = []
+        processed = []
+
+        def process(worker_number, item):
+            company_name, info = item
+
+            # Borrow a driver per company so the pool can recycle worn out or crashed ones
+            pooled = driver_pool.acquire()
+            if pooled is None:
+                raise Exception(f"No WebDriver available for {company_name}")
+            try:
+                info = self.get_company_detail(company_name, info, pooled.driver, pooled.driver_wait)
+            finally:
+                driver_pool.release(pooled)
+
+            with save_lock:
+                extra_info = [info['ticker'], info.get('cvm_code', ''), company_name]
+                system.print_info(len(processed), extra_info, start_time, total_companies_to_process)
+                processed.append(company_name)
+
+                all_data.append({'company_name': company_name, **info})
+                if len(all_data) >= settings.batch_size:
+                    self.save_to_db(all_data)
+                    all_data.clear()
+            return company_name
+
+        try:
+            work_scheduler.put_many(companies_to_process.items())
+            work_scheduler.run(process)
+
+            # Save the last partial batch
+            if all_data:
+                self.save_to_db(all_data)
+        finally:
+            driver_pool.close()
+
+        return companies_to_process
+
     def load_existing_data(self):
         existing_data = {}
         try:
@@ -224,14 +301,32 @@ class CompanyScraper:
 
         return existing_data
 
+    def company_row(self, info):
+        """
+        Put company information in the form save_to_db stores it: one text per company_info column,
+        with the ticker and ISIN code lists joined by commas and missing values as empty texts.
+
+        Parameters:
+        - info (dict): Scraped or stored company information.
+
+        Returns:
+        dict: The column values keyed by settings.company_columns.
+        """
+        row = {}
+        for column in settings.company_columns:
+            value = info.get(column)
+            if isinstance(value, (list, tuple)):
+                value = ','.join(value)
+            row[column] = '' if value is None else value
+        return row
+
     def save_to_db(self, data):
         try:
             os.makedirs(settings.db_folder, exist_ok=True)
 
             backup_name = f"{os.path.splitext(settings.db_name)[0]} {settings.backup_name}.db"
             backup_path = os.path.join(settings.db_folder, backup_name)
-            if os.path.exists(settings.db_path):
-                shutil.copy2(settings.db_path, backup_path)
+            system.db_backup(settings.db_path, backup_path)
 
             conn = sqlite3.connect(settings.db_path)
             cursor = conn.cursor()
@@ -269,10 +364,7 @@ class CompanyScraper:
                                 registrar=excluded.registrar,
                                 cnpj=excluded.cnpj,
                                 website=excluded.website''',
-                                (info['cvm_code'], info['company_name'], info['ticker'], ','.join(info.get('ticker_codes', [])),
-                                 ','.join(info.get('isin_codes', [])), info.get('trading_name', ''), info.get('sector', ''),
-                                 info.get('subsector', ''), info.get('segment', ''), info.get('listing', ''),
-                                 info.get('activity', ''), info.get('registrar', ''), info.get('cnpj', ''), info.get('website', '')))
+                                tuple(self.company_row(info).values()))
 
             conn.commit()
             conn.close()
@@ -284,22 +376,27 @@ class CompanyScraper:
             system.log_error(e)
 
     def update_and_save_batch(self, existing_data, new_data_batch):
-        batch_to_save = []
-
-        for info in new_data_batch:
-            company_name = info['company_name']
-            if company_name in existing_data:
-                existing_info = existing_data[company_name]
-                changes = {key: info[key] for key in info if info[key] != existing_info.get(key)}
-                if changes:
-                    batch_to_save.append(info)
-            else:
-                batch_to_save.append(info)
-
+        """
+        Save the companies of a batch that are new or whose information changed.
+
+        Parameters:
+        - existing_data (dict): The stored company information keyed by company name.
+        - new_data_batch (list): The scraped company information dictionaries.
+        """
+        if not new_data_batch:
+            return
+
+        # Compare the whole batch, in its stored form, with the stored rows of the same companies through one hash lookup
+        df_batch = pd.DataFrame([self.company_row(info) for info in new_data_batch], columns=settings.company_columns)
+        df_existing = pd.DataFrame([self.company_row(existing_data[name]) for name in df_batch['company_name'] if name in existing_data],
+                                   columns=settings.company_columns)
+        is_new, is_changed = self.change_detector.detect(df_batch, existing=df_existing)
+
+        batch_to_save = [info for info, save in zip(new_data_batch, is_new | is_changed) if save]
         self.save_to_db(batch_to_save)
 
-    def run(self):
-        existing_companies, new_companies = self.get_company_info()
+    def run(self, thread=False):
+        existing_companies, new_companies = self.get_company_info(thread)
 
         total_companies = len(new_companies)
         batch_size = settings.batch_size
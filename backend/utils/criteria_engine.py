@@ -0,0 +1,371 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils import account_index
+
+
+# The filter conditions of the intel criteria trees, as the recursive implementation applied them
+# (tests/benchmarks/criteria_engine.py).
+# They run on the distinct values of a column, so each one is evaluated once per value instead of once per row.
+conditions = {
+    'equals': lambda col, val: col == val.lower(),
+    'not_equals': lambda col, val: col != val.lower(),
+    'startswith': lambda col, val: col.astype(str).str.startswith(val),
+    'not_startswith': lambda col, val: ~col.str.startswith(tuple(map(str.lower, val))),
+    'endswith': lambda col, val: col.str.endswith(tuple(map(str.lower, val))),
+    'not_endswith': lambda col, val: ~col.str.endswith(tuple(map(str.lower, val))),
+    'contains_all': lambda col, val: col.apply(lambda x: all(term in x.lower() for term in val) if pd.notna(x) else False),
+    'contains_any': lambda col, val: col.str.contains('|'.join(map(re.escape, val)), case=False, na=False),
+    'contains_none': lambda col, val: ~col.str.contains('|'.join(map(re.escape, val)), case=False, na=False),
+    'not_contains': lambda col, val: col.apply(lambda x: not all(term in x.lower() for term in val) if pd.notna(x) else True),
+    'not_contains_any': lambda col, val: col.apply(lambda x: all(term not in x.lower() for term in val) if pd.notna(x) else True),
+    'level': lambda col, val: (col.str.count(r'\.') + 1) == int(val),  # Merged level filter for exact levels
+}
+list_conditions = ['contains_any', 'contains_none', 'contains_all', 'not_contains_all']  # Conditions taking a list of terms
+output_columns = ['account_standard', 'description_standard']
+audit_columns = ['standard_criteria', 'items_match']  # Per-row provenance of the recursive implementation, kept per node in audit mode
+
+plans = {}  # Compiled plans keyed by id() of their criteria tree
+
+def compile_tree(criteria_tree):
+    """
+    Flatten a criteria tree into a plan of nodes in the order the recursive implementation visits them.
+
+    Each node keeps its target split into account and description, its criteria text and its filters with the
+    values already wrapped into lists where the condition needs one. Plans are cached per tree, so the intel
+    trees are compiled once per process.
+
+    Parameters:
+    - criteria_tree (list): The criteria, each a dict with 'target', 'filter' and 'sub_criteria'.
+
+    Returns:
+    list: One dict per node with 'account', 'description', 'criteria', 'filters', 'children' (node indexes) and 'root'.
+    """
+    cached = plans.get(id(criteria_tree))
+    if cached is not None and cached[0] is criteria_tree:
+        return cached[1]
+
+    plan = []
+
+    def add(criteria, root=False):
+        # Step 1: Validate the target and the conditions up front
+        account, description = criteria['target'].split(' - ')
+        filters = []
+        for filter_column, filter_condition, filter_value in criteria['filter']:
+            if filter_condition not in conditions:
+                raise ValueError(f"Unknown filter condition: {filter_condition}")
+            if filter_condition in list_conditions and not isinstance(filter_value, list):
+                filter_value = [filter_value]
+            filters.append((filter_column, filter_condition, filter_value))
+
+        # Step 2: Add the node, then its sub-criteria depth first
+        node = {
+            'account': account,
+            'description': description,
+            'criteria': ' | '.join([f"{c[0]} {c[1]} {c[2]}" for c in criteria['filter']]),
+            'filters': filters,
+            'children': [],
+            'root': root,
+        }
+        plan.append(node)
+        index = len(plan) - 1
+        node['children'] = [add(sub) for sub in criteria.get('sub_criteria', [])]
+        return index
+
+    for criteria in criteria_tree:
+        add(criteria, root=True)
+
+    plans[id(criteria_tree)] = (criteria_tree, plan)
+    return plan
+
+class CriteriaEngine:
+    """
+    Applies compiled criteria trees to one sector's statements.
+
+    Every filter column is factorized once, and the lowercase, stripped form of its distinct values is computed
+    once, so a filter is evaluated on the few thousand distinct accounts or descriptions rather than on every row,
+    and its result is cached for every node using the same filter. The account startswith and level filters of a
+    node are answered by the account index, which returns their rows directly; the node's other filters and the
+    accounts its parent passed on then narrow those rows. The accounts handed to sub-criteria are also found in
+    the index instead of with a startswith test per row and account. The standard columns are written once per
+    tree. Filters read the original columns, never the standard ones being written.
+
+    With a scope, such as one filing per company and quarter, sub-criteria only receive the accounts their parent
+    matched in the same scope, so each filing is standardized independently of the other rows of the frame.
+
+    Provenance is only gathered in audit mode: one record per node with its criteria, the number of rows it
+    matched and the distinct accounts and descriptions among them, instead of strings copied to every row.
+    """
+
+    def __init__(self, df, scope=None, audit=False):
+        """
+        Initialize the engine for a frame.
+
+        Parameters:
+        - df (DataFrame): The statements, with a default index.
+        - scope (list): Columns of the groups standardized independently, for example ['company_name', 'quarter'].
+                        None lets a parent's matches anywhere in the frame pass accounts on, as the recursive implementation does.
+        - audit (bool): Record the provenance of every node in self.audit_records.
+        """
+        self.df = df
+        self.rows = len(df)
+        self.groups = df.groupby(scope, sort=False, dropna=False, observed=True).ngroup().to_numpy().astype(np.int64) if scope else None
+        self.columns = {}  # (codes, raw distinct values, normalized distinct values) per column
+        self.flags = {}  # Filter result per distinct value, keyed by (column, condition, value)
+        self.indexes = {}  # Account index of the raw and of the normalized accounts
+        self.nodes = 0
+        self.audit = audit
+        self.audit_records = []  # One dict per applied node in audit mode
+        self.row_records = np.full(self.rows, -1, dtype=np.int64) if audit else None  # Audit record of the last node matching each row
+
+    def column(self, name):
+        """
+        Factorize a column, once per engine.
+
+        Parameters:
+        - name (str): The column name.
+
+        Returns:
+        tuple: (codes, raw distinct values, normalized distinct values) where codes gives the distinct value of each row.
+        """
+        if name not in self.columns:
+            series = self.df[name]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes = series.cat.codes.to_numpy().astype(np.int64)
+                uniques = np.append(series.cat.categories.to_numpy(dtype=object), np.nan)
+                codes[codes < 0] = len(uniques) - 1
+            else:
+                codes, uniques = pd.factorize(series, use_na_sentinel=False)
+                uniques = np.asarray(uniques, dtype=object)
+
+            # Text columns are compared lowercase and stripped, as the recursive implementation did per filter;
+            # other columns keep their dtype, so the conditions treat their missing values the same way
+            normalized = pd.Series(uniques, dtype=object)
+            if series.dtype == 'O':
+                normalized = normalized.str.lower().str.strip()
+            elif isinstance(series.dtype, pd.CategoricalDtype):
+                normalized = normalized.astype(series.dtype)
+
+            self.columns[name] = (codes, uniques, normalized)
+        return self.columns[name]
+
+    def filter_flags(self, column, condition, value):
+        """
+        Evaluate a filter on the distinct values of a column, once per engine.
+
+        Parameters:
+        - column (str): The filter column.
+        - condition (str): The filter condition.
+        - value: The filter value.
+
+        Returns:
+        ndarray: Whether each distinct value passes the filter.
+        """
+        key = (column, condition, repr(value))
+        if key not in self.flags:
+            normalized = self.column(column)[2]
+            self.flags[key] = pd.Series(conditions[condition](normalized, value)).eq(True).to_numpy()
+        return self.flags[key]
+
+    def account_index(self, normalized=False):
+        """
+        Build the account index, once per engine.
+
+        Parameters:
+        - normalized (bool): Index the accounts as the filters see them instead of the raw accounts.
+
+        Returns:
+        account_index.AccountIndex: The index, sharing the codes of self.column('account').
+        """
+        if normalized not in self.indexes:
+            codes, uniques, normalized_uniques = self.column('account')
+            if normalized and not normalized_uniques.astype(object).equals(pd.Series(uniques, dtype=object)):
+                self.indexes[True] = account_index.AccountIndex(normalized_uniques.to_numpy(dtype=object), codes)
+            elif (not normalized) in self.indexes and normalized_uniques.astype(object).equals(pd.Series(uniques, dtype=object)):
+                self.indexes[normalized] = self.indexes[not normalized]  # Clean accounts: one index serves both
+            else:
+                self.indexes[normalized] = account_index.AccountIndex(uniques, codes)
+        return self.indexes[normalized]
+
+    def select(self, filters, allowed=None):
+        """
+        Find the rows passing every filter of a node.
+
+        Parameters:
+        - filters (list): The compiled (column, condition, value) filters of a node.
+        - allowed (ndarray): What the parent passed on, as returned by sub_accounts. None allows every row.
+
+        Returns:
+        ndarray: The positions passing every filter, ascending.
+        """
+        # Step 1: Take the rows of the first account prefix and level filters straight from the index
+        prefix, level, remaining = None, None, []
+        for column, condition, value in filters:
+            if column == 'account' and condition == 'startswith' and prefix is None and isinstance(value, str) and not 'nan'.startswith(value):
+                prefix = value  # A prefix of 'nan' would also match missing accounts, which the index leaves out
+            elif column == 'account' and condition == 'level' and level is None:
+                level = int(value)
+            else:
+                remaining.append((column, condition, value))
+
+        if prefix is None and level is None:
+            positions = np.arange(self.rows)
+        else:
+            positions = self.account_index(normalized=True).rows(prefix or '', level)
+
+        # Step 2: Keep the rows the parent passed on, then narrow them with the other filters
+        if allowed is not None and len(positions):
+            codes = self.column('account')[0]
+            if self.groups is None:
+                positions = positions[allowed[codes[positions]]]
+            else:
+                keys = self.groups[positions] * len(self.account_index().accounts) + codes[positions]
+                positions = positions[np.isin(keys, allowed)]
+
+        for column, condition, value in remaining:
+            if not len(positions):
+                break
+            codes = self.column(column)[0]
+            positions = positions[self.filter_flags(column, condition, value)[codes[positions]]]
+        return positions
+
+    def sub_accounts(self, positions):
+        """
+        Find every account starting with one of the accounts at the given positions, the rows handed to sub-criteria.
+
+        Parameters:
+        - positions (ndarray): The row positions matched by a node.
+
+        Returns:
+        ndarray: One flag per distinct account or, with a scope, the sorted (group, account) keys passed on.
+        """
+        codes, uniques, _ = self.column('account')
+        index = self.account_index()
+        if self.groups is None:
+            return index.prefix_flags(uniques[np.unique(codes[positions])])
+
+        # Pair every matched (group, account) with the accounts starting with that account
+        accounts = len(index.accounts)
+        matched = np.unique(self.groups[positions] * accounts + codes[positions])
+        keys = []
+        for code in np.unique(matched % accounts):
+            if not isinstance(uniques[code], str):
+                continue
+            start, end = index.prefix_range(uniques[code])
+            groups = matched[matched % accounts == code] // accounts
+            keys.append((groups[:, None] * accounts + index.order[start:end][None, :]).ravel())
+        return np.unique(np.concatenate(keys)) if keys else np.array([], dtype=np.int64)
+
+    def items_match(self, positions):
+        """
+        List the distinct account and description pairs of the matched rows, in row order.
+
+        Parameters:
+        - positions (ndarray): The matched row positions, ascending.
+
+        Returns:
+        str: The pairs as 'account - description', comma separated.
+        """
+        if not len(positions):
+            return ''
+
+        account_codes = self.column('account')[0]
+        description_codes, descriptions, _ = self.column('description')
+        pairs = account_codes[positions].astype(np.int64) * len(descriptions) + description_codes[positions]
+        _, first = np.unique(pairs, return_index=True)
+        first = positions[np.sort(first)]
+
+        # Format the row values themselves, so a missing description reads as it did row by row
+        accounts = self.df['account'].to_numpy()[first]
+        descriptions = self.df['description'].to_numpy()[first]
+        return ', '.join([f"{account} - {description}" for account, description in zip(accounts, descriptions)])
+
+    def apply_tree(self, criteria_tree, sector='', section_name=''):
+        """
+        Apply a criteria tree to the frame: each matched row gets the account and description of the last node
+        matching it, in depth-first order.
+
+        Parameters:
+        - criteria_tree (list): The criteria tree.
+        - sector (str): The sector, for the progress output.
+        - section_name (str): The section, for the progress output and the audit records.
+
+        Returns:
+        DataFrame: The frame, modified in place.
+        """
+        plan = compile_tree(criteria_tree)
+        assigned = np.full(self.rows, -1, dtype=np.int64)  # Last node matching each row
+        records = np.full(len(plan), -1, dtype=np.int64)  # Audit record of each node
+
+        # Each entry is a node and the accounts its parent passed on
+        stack = [(index, None) for index in reversed(range(len(plan))) if plan[index]['root']]
+        while stack:
+            index, allowed = stack.pop()
+            node = plan[index]
+            positions = self.select(node['filters'], allowed)
+
+            assigned[positions] = index
+            self.nodes += 1
+            print(sector, section_name, f"{node['account']} - {node['description']}")
+
+            if self.audit:
+                records[index] = len(self.audit_records)
+                self.audit_records.append({
+                    'section': section_name,
+                    'node': index,
+                    'account': node['account'],
+                    'description': node['description'],
+                    'criteria': node['criteria'],
+                    'rows': len(positions),
+                    'items': self.items_match(positions),
+                })
+
+            if node['children']:
+                sub_accounts = self.sub_accounts(positions)
+                stack.extend((child, sub_accounts) for child in reversed(node['children']))
+
+        self.write(plan, assigned)
+        if self.audit:
+            hit = assigned >= 0
+            self.row_records[hit] = records[assigned[hit]]
+        return self.df
+
+    def write(self, plan, assigned):
+        """
+        Write the standard columns of the matched rows, keeping the values of the other rows.
+
+        Parameters:
+        - plan (list): The compiled nodes.
+        - assigned (ndarray): The node of each row, -1 if none matched it.
+        """
+        for column in output_columns:
+            if column not in self.df.columns:
+                self.df[column] = ''
+
+        hit = np.flatnonzero(assigned >= 0)
+        if not len(hit):
+            return
+
+        node_values = {
+            'account_standard': [node['account'] for node in plan],
+            'description_standard': [node['description'] for node in plan],
+        }
+        for column, values in node_values.items():
+            current = self.df[column].to_numpy(dtype=object, copy=True)
+            current[hit] = np.asarray(values, dtype=object)[assigned[hit]]
+            self.df[column] = current
+
+    def provenance(self):
+        """
+        Expand the audit records back to the per-row columns of the recursive implementation.
+
+        Returns:
+        DataFrame: 'standard_criteria' and 'items_match' of every row, '' where no node matched.
+        """
+        values = {}
+        for column, key in zip(audit_columns, ['criteria', 'items']):
+            texts = np.array([record[key] for record in self.audit_records] + [''], dtype=object)
+            values[column] = texts[self.row_records]  # -1 picks the trailing ''
+        return pd.DataFrame(values)
@@ -0,0 +1,207 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+
+import pandas as pd
+
+from utils import system
+from utils import settings
+
+
+class DatabaseWriter:
+    """
+    A single writer thread that owns the SQLite connections and applies DataFrame batches from a bounded queue.
+
+    Producers hand over batches with submit and go back to work; only the writer touches the database files,
+    so concurrent scrapers no longer fight over the file lock. Small batches for the same table are coalesced
+    into one transaction, and a full queue blocks the producers until the writer catches up.
+    """
+
+    def __init__(self, max_queue=None, coalesce_rows=None, flush_interval=None, label='Database writer'):
+        """
+        Initialize the writer and start its thread.
+
+        Parameters:
+        - max_queue (int): Maximum number of batches waiting. Defaults to settings.writer_queue_size.
+        - coalesce_rows (int): Rows gathered for one table before a transaction. Defaults to settings.writer_coalesce_rows.
+        - flush_interval (float): Seconds without new batches after which everything gathered is written.
+                                  Defaults to settings.writer_flush_interval.
+        - label (str): A prefix for the printed report.
+        """
+        self.queue = queue.Queue(maxsize=max_queue or settings.writer_queue_size)
+        self.coalesce_rows = coalesce_rows or settings.writer_coalesce_rows
+        self.flush_interval = flush_interval or settings.writer_flush_interval
+        self.label = label
+        self.connections = {}
+        self.pending = {}
+        self.writers = {}
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.transactions = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.rows_failed = 0
+        self.wait_time = 0.0
+        self.max_depth = 0
+
+        self.thread = threading.Thread(target=self.run, name=label, daemon=True)
+        self.thread.start()
+
+    def submit(self, db_path, table, df, write):
+        """
+        Queue a batch for writing, blocking while the queue is full.
+
+        Parameters:
+        - db_path (str): The database file.
+        - table (str): The table or sector the batch belongs to; batches are coalesced per (db_path, table, writer function).
+        - df (DataFrame): The rows to write.
+        - write (callable): write(conn, df, table), runs the statements inside the writer's transaction.
+                            Bound methods of different workers share the same function and so coalesce together.
+
+        Returns:
+        int: The number of rows queued.
+        """
+        if df is None or df.empty:
+            return 0
+
+        start_time = time.perf_counter()
+        self.queue.put((db_path, table, write, df))
+        with self.lock:
+            self.wait_time += time.perf_counter() - start_time
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+        return len(df)
+
+    def get_connection(self, db_path):
+        """
+        Return the writer's connection to a database, opening it on first use.
+
+        Parameters:
+        - db_path (str): The database file.
+
+        Returns:
+        sqlite3.Connection: The connection.
+        """
+        if db_path not in self.connections:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            self.connections[db_path] = system.db_connect(db_path)
+        return self.connections[db_path]
+
+    def flush(self, key):
+        """
+        Write everything gathered for one (db_path, table, writer function) key in a single transaction.
+
+        Parameters:
+        - key (tuple): The (db_path, table, writer function) key.
+
+        Returns:
+        int: The number of rows written.
+        """
+        dfs = self.pending.pop(key, [])
+        write = self.writers.pop(key, None)
+        if not dfs:
+            return 0
+
+        db_path, table, _ = key
+        df = pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0]
+
+        for attempt in range(settings.writer_retries + 1):
+            try:
+                system.db_backup(db_path)
+                conn = self.get_connection(db_path)
+                with conn:
+                    write(conn, df, table)
+                with self.lock:
+                    self.transactions += 1
+                    self.rows_written += len(df)
+                return len(df)
+
+            except sqlite3.OperationalError as e:
+                # Another process may still hold the file; wait and retry
+                if attempt < settings.writer_retries and 'locked' in str(e):
+                    time.sleep(settings.wait_time * (attempt + 1))
+                    continue
+                error = e
+                break
+            except Exception as e:
+                error = e
+                break
+
+        system.log_error(f"{self.label} failed to write {len(df)} rows to {table} in {db_path}: {error}")
+        with self.lock:
+            self.failures += 1
+            self.rows_failed += len(df)
+        return 0
+
+    def flush_all(self):
+        """
+        Write everything gathered for every key.
+
+        Returns:
+        int: The number of rows written.
+        """
+        return sum(self.flush(key) for key in list(self.pending))
+
+    def run(self):
+        """
+        The writer loop: gather batches per key, write a key once it has enough rows,
+        and write everything when the queue goes quiet or the writer is closed.
+        """
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self.flush_all()
+                continue
+
+            if item is None:
+                self.flush_all()
+                break
+
+            db_path, table, write, df = item
+            # A bound method is a new object on every access, so key on the function behind it
+            key = (db_path, table, getattr(write, '__func__', write))
+            self.pending.setdefault(key, []).append(df)
+            self.writers.setdefault(key, write)
+            if sum(len(pending_df) for pending_df in self.pending[key]) >= self.coalesce_rows:
+                self.flush(key)
+
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
+
+    def stats(self):
+        """
+        Report the writer throughput, the producer wait time and the failures.
+
+        Returns:
+        dict: submitted batches, transactions, rows written and failed, failures, producer wait seconds and max queue depth.
+        """
+        with self.lock:
+            return {
+                'submitted': self.submitted,
+                'transactions': self.transactions,
+                'rows_written': self.rows_written,
+                'rows_failed': self.rows_failed,
+                'failures': self.failures,
+                'wait_time': self.wait_time,
+                'max_depth': self.max_depth,
+            }
+
+    def close(self):
+        """
+        Write what is left, stop the thread, close the connections and print the report.
+
+        Returns:
+        dict: The final statistics.
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+        stats = self.stats()
+        print(f"{self.label}: {stats['rows_written']} rows in {stats['transactions']} transactions from {stats['submitted']} batches, "
+              f"{stats['failures']} failures ({stats['rows_failed']} rows), producers waited {stats['wait_time']:.1f}s, "
+              f"queue depth max {stats['max_depth']}")
+        return stats
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+
+key_columns = ['company_name', 'type', 'frame', 'account', 'year']
+target_quarters = [3, 6, 9, 12]
+
+def quarter_slots(months):
+    """
+    Map each target quarter month to the closest month present in the data, as the pivot used to.
+
+    Parameters:
+    - months (array): The month of every row.
+
+    Returns:
+    dict: The available month used for each target quarter (3, 6, 9, 12).
+    """
+    available_months = sorted(set(int(month) for month in pd.unique(months) if pd.notna(month)))
+    closest_months = {}
+    for target in target_quarters:
+        closest_month = min(available_months, key=lambda x: abs(x - target), default=None)
+        if closest_month:
+            closest_months[target] = closest_month
+    return closest_months
+
+def quarter_matrix(df):
+    """
+    Lay the values out as one row per (company, type, frame, account, year) and one column per quarter slot.
+
+    Parameters:
+    - df (DataFrame): Statements with 'year', 'month' and 'value' columns.
+
+    Returns:
+    tuple: (matrix, codes) where matrix[code, slot] holds the first value of that key in that quarter slot
+           (NaN if missing) and codes gives the key of each row.
+    """
+    codes = df.groupby(key_columns, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    months = df['month'].to_numpy()
+    values = df['value'].to_numpy(dtype=float)
+
+    # Slot of each row: the target quarter whose closest available month is the row's month
+    slot = np.full(len(df), -1, dtype=np.int64)
+    for target, month in sorted(quarter_slots(months).items()):
+        slot[months == month] = target_quarters.index(target)
+
+    matrix = np.full((codes.max() + 1 if len(codes) else 0, len(target_quarters)), np.nan)
+
+    # Keep the first value per key and slot, like the pivot's aggfunc='first'
+    has_slot = np.flatnonzero(slot >= 0)
+    cell = codes[has_slot] * len(target_quarters) + slot[has_slot]
+    _, first = np.unique(cell, return_index=True)
+    rows = has_slot[first]
+    matrix[codes[rows], slot[rows]] = values[rows]
+
+    return matrix, codes
+
+def scatter_back(df, matrix, codes):
+    """
+    Return the adjusted quarter values to their rows.
+
+    Only rows dated at the end of a quarter month (3, 6, 9 or 12) receive a value; other rows get NaN,
+    as they did when the unpivoted quarters were merged back on the quarter date.
+
+    Parameters:
+    - df (DataFrame): The statements the matrix was built from.
+    - matrix (ndarray): The adjusted values per key and quarter slot.
+    - codes (ndarray): The key of each row.
+
+    Returns:
+    ndarray: The adjusted value of every row.
+    """
+    months = df['month'].to_numpy()
+    months = np.where(pd.notna(months), months, 0).astype(np.int64)
+    quarters = pd.to_datetime(df['quarter'])
+    is_month_end = (quarters + pd.offsets.MonthEnd(0) == quarters).to_numpy()
+
+    slot_of_month = np.full(13, -1, dtype=np.int64)
+    slot_of_month[target_quarters] = np.arange(len(target_quarters))
+    slot = slot_of_month[months % 13]
+
+    result = np.full(len(df), np.nan)
+    has_value = (slot >= 0) & is_month_end
+    result[has_value] = matrix[codes[has_value], slot[has_value]]
+    return result
+
+def decumulate_year_end(df):
+    """
+    Turn the fourth quarter of year-end accounts into a quarterly value: Q4 = 12M - (9M + 6M + 3M).
+
+    Parameters:
+    - df (DataFrame): Statements with 'year', 'month' and 'value' columns.
+
+    Returns:
+    DataFrame: A copy of df with the adjusted 'value' column.
+    """
+    df = df.copy()
+    if df.empty:
+        return df
+
+    matrix, codes = quarter_matrix(df)
+    q3, q6, q9, q12 = matrix.T
+    matrix[:, 3] = q12 - (q9 + q6 + q3)
+
+    df['value'] = scatter_back(df, matrix, codes)
+    return df
+
+def decumulate_cumulative(df):
+    """
+    Turn year-to-date values into quarterly values: each quarter minus the quarters before it in the year.
+    A quarter is NaN if any earlier quarter of the year is missing.
+
+    Parameters:
+    - df (DataFrame): Statements with 'year', 'month' and 'value' columns.
+
+    Returns:
+    DataFrame: A copy of df with the adjusted 'value' column.
+    """
+    df = df.copy()
+    if df.empty:
+        return df
+
+    matrix, codes = quarter_matrix(df)
+    q3, q6, q9, q12 = matrix.T.copy()
+    d6 = q6 - q3
+    d9 = q9 - (d6 + q3)
+    d12 = q12 - (d9 + d6 + q3)
+    matrix[:, 1], matrix[:, 2], matrix[:, 3] = d6, d9, d12
+
+    df['value'] = scatter_back(df, matrix, codes)
+    return df
@@ -2,62 +2,64 @@ import os
 import sqlite3
 import time
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
 from utils import system
 from utils import settings
+from utils import storage
+from utils import categories
 
 class FinancialDataPlotter:
     def __init__(self):
         """
         Initialize the FinancialDataPlotter with a DataFrame.
 
-        Load all tables from an SQLite database into a single DataFrame.
+        Load all sectors of the standardized statements into a single DataFrame. The text columns are
+        categoricals with shared dictionaries, so the combined frame stays a fraction of its size as strings.
         """
-        db_path = os.path.join(settings.db_folder, f"{settings.db_name.split('.')[0]} {settings.statements_standard}.{settings.db_name.split('.')[-1]}")
+        # Load each sector with typed quarters and categorical text
+        dict_df = storage.load_frames(settings.statements_standard, categorical=True, backend=settings.plots_storage_backend)
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Fetch all table names
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-
-        # Load each table into a DataFrame
         df_list = []
-        start_time = time.time()  # Initialize start time for progress tracking
-        for i, table_name in enumerate(tables):
-            table_name = table_name[0]  # Extract table name from tuple
-            df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-            df['table_name'] = table_name  # Add a column to identify the source table
+        for i, (table_name, df) in enumerate(dict_df.items()):
+            df['table_name'] = pd.Categorical.from_codes(np.full(len(df), i), categories=list(dict_df))  # Identify the source table
             df_list.append(df)
 
-            # Display progress using system.print_info
-            extra_info = [table_name]
-            system.print_info(i, extra_info, start_time, len(tables))  # Removed the total_files argument
-
-            print('break')
-            break
-        conn.close()
-
-        # Concatenate all tables into a single DataFrame
-        combined_df = pd.concat(df_list, ignore_index=True)
+        # Concatenate all tables into a single DataFrame, keeping the shared categories
+        combined_df = categories.registry.concat(df_list, ignore_index=True) if df_list else pd.DataFrame()
 
-        self.df = combined_df.copy()
+        self.df = combined_df
         # Ensure 'quarter' is of datetime type
-        if self.df['quarter'].dtype != 'datetime64[ns]':
+        if 'quarter' in self.df.columns and self.df['quarter'].dtype != 'datetime64[ns]':
             self.df['quarter'] = pd.to_datetime(self.df['quarter'])
 
+    def select(self, mask):
+        """
+        Return the rows matching a filter with plain string columns, ready for plotting.
+
+        Parameters:
+        - mask (Series): Boolean filter over self.df.
+
+        Returns:
+        DataFrame: A copy of the selected rows.
+        """
+        data = self.df[mask].copy()
+        data = categories.registry.decode(data)
+        if 'table_name' in data.columns:
+            data['table_name'] = data['table_name'].astype(object)
+        return data
+
     def plot_time_series(self, company_name, description, start_date=None, end_date=None):
         """
         Plot a time series of a financial metric for a given company.
         """
         # Filter data
-        data = self.df[
+        data = self.select(
             (self.df['company_name'] == company_name) &
             (self.df['description'] == description)
-        ]
+        )
 
         # Apply date filters if provided
         if start_date:
@@ -88,11 +90,11 @@ class FinancialDataPlotter:
         Compare a financial metric across multiple companies at a specific date.
         """
         # Filter data
-        data = self.df[
+        data = self.select(
             (self.df['company_name'].isin(companies)) &
             (self.df['description'] == description) &
             (self.df['quarter'] == pd.to_datetime(date))
-        ]
+        )
 
         if data.empty:
             print("No data available for the given filters.")
@@ -114,10 +116,10 @@ class FinancialDataPlotter:
         Plot multiple financial metrics over time for a single company.
         """
         # Filter data
-        data = self.df[
+        data = self.select(
             (self.df['company_name'] == company_name) &
             (self.df['description'].isin(descriptions))
-        ]
+        )
 
         # Apply date filters if provided
         if start_date:
@@ -161,10 +163,10 @@ class FinancialDataPlotter:
         Plot a correlation heatmap of financial metrics for a given company and date.
         """
         # Filter data
-        data = self.df[
+        data = self.select(
             (self.df['company_name'] == company_name) &
             (self.df['quarter'] == pd.to_datetime(date))
-        ]
+        )
 
         # Pivot data to have descriptions as columns
         data_pivot = data.pivot_table(
@@ -195,15 +197,15 @@ class FinancialDataPlotter:
         Plot a scatter plot comparing two financial metrics across companies.
         """
         # Filter data
-        data_x = self.df[
+        data_x = self.select(
             (self.df['description'] == x_metric) &
             (self.df['quarter'] == pd.to_datetime(date))
-        ][['company_name', 'value']].rename(columns={'value': x_metric})
+        )[['company_name', 'value']].rename(columns={'value': x_metric})
 
-        data_y = self.df[
+        data_y = self.select(
             (self.df['description'] == y_metric) &
             (self.df['quarter'] == pd.to_datetime(date))
-        ][['company_name', 'value']].rename(columns={'value': y_metric})
+        )[['company_name', 'value']].rename(columns={'value': y_metric})
 
         data = pd.merge(data_x, data_y, on='company_name')
 
@@ -231,11 +233,11 @@ class FinancialDataPlotter:
         Plot a stacked bar chart to show composition of financial metrics.
         """
         # Filter data
-        data = self.df[
+        data = self.select(
             (self.df['company_name'] == company_name) &
             (self.df['description'].isin(descriptions)) &
             (self.df['quarter'] == pd.to_datetime(date))
-        ]
+        )
 
         if data.empty:
             print("No data available for the given filters.")
@@ -3,10 +3,19 @@ import os
 import pandas as pd
 import numpy as np
 import sqlite3
+import json
+import hashlib
 
 from utils import settings
+from utils import storage
+from utils import categories
 from utils import system
 from utils import intel
+from utils import formula_compiler
+from utils import ratios_engine
+from utils import change_detection
+from utils import share_counts
+from utils import rolling_indicators
 
 
 class FinancialRatios:
@@ -20,24 +29,21 @@ class FinancialRatios:
         except Exception as e:
             system.log_error(f"Error initializing FinancialRatios: {e}")
 
-    def load_data(self, files):
+    def load_data(self, files, columns=None, years=None):
         """
         Load financial data from the database and process it into DataFrames.
         
         Args:
             files (str): The name part of the database file to load.
+            columns (list): The columns to read. None reads all of them.
+            years (list): The quarter years to read. None reads every year.
 
         Returns:
             dict: A dictionary where keys are sectors and values are DataFrames containing the NSD data for that sector.
         """
         try:
-            db_file = os.path.join(self.db_folder, f"{settings.db_name.split('.')[0]} {files}.db")
-            conn = sqlite3.connect(db_file)
-            cursor = conn.cursor()
-
-            # Fetch all table names excluding internal SQLite tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-            tables = cursor.fetchall()
+            store = storage.get_store(files)
+            tables = store.sectors()  # Sector table names
 
             dfs = {}
             total_lines = 0
@@ -45,10 +51,9 @@ class FinancialRatios:
             print(files)
 
             # Iterate through each table (sector) and process the data
-            for i, table in enumerate(tables):
+            for i, sector in enumerate(tables):
                 try:
-                    sector = table[0]
-                    df = pd.read_sql_query(f"SELECT * FROM {sector}", conn)
+                    df = store.read(sector, columns, years)  # Load only the requested columns and years
 
                     # Normalize date columns to datetime format
                     df['quarter'] = pd.to_datetime(df['quarter'], errors='coerce')
@@ -63,6 +68,9 @@ class FinancialRatios:
                     missing_account = df['account'].isna() | df['account'].str.strip().eq('')
                     df.loc[missing_account, 'account'] = '0'  # Set 'account' to '0' (as text) for these rows
 
+                    if settings.categorical_frames:
+                        categories.registry.encode(df)  # Groupbys and merges then run on integer codes
+
                     dfs[sector] = df  # Store the DataFrame with the sector as the key
                     total_lines += len(df)  # Update the total number of processed lines
 
@@ -74,29 +82,270 @@ class FinancialRatios:
                     # break
 
                 except Exception as e:
-                    system.log_error(f"Error processing table {table}: {e}")
+                    system.log_error(f"Error processing table {sector}: {e}")
+
+            store.close()
 
-            conn.close()
+            # Sectors encoded early hold shorter dictionaries; bring them all to the same dtypes
+            if settings.categorical_frames:
+                categories.registry.align(dfs)
             return dfs
 
         except Exception as e:
             system.log_error(f"Error loading existing financial statements: {e}")
             return {}
 
-    def save_to_db(self):
+    def save_to_db(self, data_dict, quarters=None):
+        """
+        Save the indicator rows to the ratios database, one table per sector keyed by company, type, account
+        and quarter, so the time series of an indicator and its cross-section at a quarter are both index ranges.
+
+        Args:
+            data_dict (dict): Dictionary containing DataFrames of indicator rows for each sector.
+            quarters (dict): Optional company-quarters recomputed per sector; their previous rows are deleted first,
+                             so indicators they no longer have do not linger.
+
+        Returns:
+            dict: The saved DataFrames.
+        """
+        try:
+            # Construct the database path
+            db_path = os.path.join(self.db_folder, f"{settings.db_name.split('.')[0]} {settings.statements_ratios}.db")
+
+            with sqlite3.connect(db_path) as conn:
+                cursor = conn.cursor()
+
+                start_time = time.time()
+                total_lines = 0
+
+                for i, (sector, df) in enumerate(data_dict.items()):
+                    table_name = sector.upper().replace(' ', '_')  # Create a table name from the sector name
+
+                    # Step 1: Create the table, keyed for time series, and its cross-section index
+                    cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table_name} (
+                        nsd INTEGER,
+                        sector TEXT,
+                        subsector TEXT,
+                        segment TEXT,
+                        company_name TEXT,
+                        quarter TEXT,
+                        version TEXT,
+                        type TEXT,
+                        frame TEXT,
+                        account TEXT,
+                        description TEXT,
+                        value REAL,
+                        PRIMARY KEY (company_name, type, account, quarter)
+                    )
+                    """)
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_cross_section ON {table_name} (account, quarter, type)")
+
+                    # Step 2: Drop the previous indicators of the company-quarters being replaced
+                    if quarters is not None and sector in quarters:
+                        replaced = quarters[sector][settings.ratios_scope].copy()
+                        replaced['quarter'] = pd.to_datetime(replaced['quarter']).dt.strftime('%Y-%m-%d')
+                        cursor.executemany(f"DELETE FROM {table_name} WHERE company_name = ? AND quarter = ?",
+                                           list(categories.registry.decode(replaced).itertuples(index=False, name=None)))
+
+                    # Step 3: Insert or update the rows in one batch
+                    insert_sql = f"""
+                    INSERT INTO {table_name}
+                    (nsd, sector, subsector, segment, company_name, quarter, version, type, frame, account, description, value)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(company_name, type, account, quarter) DO UPDATE SET
+                    nsd=excluded.nsd,
+                    sector=excluded.sector,
+                    subsector=excluded.subsector,
+                    segment=excluded.segment,
+                    version=excluded.version,
+                    frame=excluded.frame,
+                    description=excluded.description,
+                    value=excluded.value
+                    """
+                    df_to_insert = categories.registry.decode(df[['nsd', 'sector', 'subsector', 'segment', 'company_name', 'quarter', 'version', 'type', 'frame', 'account', 'description', 'value']].copy())
+                    df_to_insert['quarter'] = pd.to_datetime(df_to_insert['quarter']).dt.strftime('%Y-%m-%d')
+
+                    cursor.executemany(insert_sql, list(df_to_insert.itertuples(index=False, name=None)))
+                    conn.commit()  # Commit the transaction
+
+                    total_lines += len(df)
+                    extra_info = [f'Saved {len(df)} indicator rows of {sector}, total {total_lines}']
+                    system.print_info(i, extra_info, start_time, len(data_dict))
+
+            return data_dict
+
+        except Exception as e:
+            system.log_error(f"Error saving ratios: {e}")
+            return {}
+
+    def load_ratios(self, accounts=None, years=None, companies=None):
+        """
+        Load the precomputed indicators from the ratios database.
+
+        Args:
+            accounts (list): The indicator accounts to read, such as '13.03'. None reads all of them.
+            years (list): The quarter years to read. None reads every year.
+            companies (list): The companies to read. None reads all of them.
+
+        Returns:
+            dict: A dictionary where keys are sectors and values are DataFrames with the indicator rows of that sector.
+        """
+        try:
+            db_path = os.path.join(self.db_folder, f"{settings.db_name.split('.')[0]} {settings.statements_ratios}.db")
+
+            conditions, params = [], []
+            if accounts is not None:
+                conditions.append(f"account IN ({', '.join('?' for _ in accounts)})")
+                params += [str(account) for account in accounts]
+            if years is not None:
+                conditions.append(f"substr(quarter, 1, 4) IN ({', '.join('?' for _ in years)})")
+                params += [str(year) for year in years]
+            if companies is not None:
+                conditions.append(f"company_name IN ({', '.join('?' for _ in companies)})")
+                params += list(companies)
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+
+            dfs = {}
+            with sqlite3.connect(db_path) as conn:
+                tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name != ?;", (settings.change_table,)).fetchall()]
+                for sector in tables:
+                    df = pd.read_sql_query(f"SELECT * FROM {sector}{where}", conn, params=params)
+                    dfs[sector] = storage.typed(df, settings.categorical_frames)
+
+            if settings.categorical_frames:
+                categories.registry.align(dfs)
+            return dfs
+
+        except Exception as e:
+            system.log_error(f"Error loading ratios: {e}")
+            return {}
+
+    def indicators_fingerprint(self, sections):
+        """
+        Hash the compiled indicator formulas, so a change to intel recomputes every company-quarter.
+
+        Parameters:
+        - sections (dict): Indicator lists keyed by frame name.
+
+        Returns:
+        - int: A signed 64-bit hash of the formulas.
+        """
+        dag = formula_compiler.compile_indicators(sections)
+        definition = json.dumps({'nodes': dag.nodes, 'outputs': dag.outputs}, sort_keys=True, ensure_ascii=False)
+        return int.from_bytes(hashlib.sha256(definition.encode('utf-8')).digest()[:8], 'little', signed=True)
+
+    def stored_quarters(self, sector):
+        """
+        List the company-quarters a sector has indicators saved for.
+
+        Parameters:
+        - sector (str): The sector table name.
+
+        Returns:
+        - pd.DataFrame: The 'company_name' and 'quarter' of each saved company-quarter.
+        """
+        try:
+            db_path = os.path.join(self.db_folder, f"{settings.db_name.split('.')[0]} {settings.statements_ratios}.db")
+            table_name = sector.upper().replace(' ', '_')
+            with sqlite3.connect(db_path) as conn:
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (table_name,)).fetchone():
+                    df = pd.read_sql_query(f"SELECT DISTINCT company_name, quarter FROM {table_name}", conn)
+                    df['quarter'] = pd.to_datetime(df['quarter'], errors='coerce')
+                    return df
+        except Exception as e:
+            system.log_error(f"Error listing the saved company-quarters of {sector}: {e}")
+        return pd.DataFrame(columns=settings.ratios_scope)
+
+    def window_quarters(self, quarters, changed, span):
         """
-        Save the calculated ratios back to the database.
+        Extend the changed company-quarters to those whose window formulas read them, and find the earlier
+        quarters those windows read.
+
+        Parameters:
+        - quarters (pd.DataFrame): The company-quarters of a sector, with 'company_name' and 'quarter' columns.
+        - changed (np.ndarray): Flags the changed company-quarters.
+        - span (int): The quarters the indicators look back.
+
+        Returns:
+        - tuple: (flags of the company-quarters to recompute, flags of the company-quarters whose rows they read)
         """
-        for sector, df in self.dict_df.items():
-            # Save the DataFrame back to the database, example:
-            print(f"Saving ratios for sector: {sector}")
-            # Implementar lógica de salvamento no banco de dados
+        if not span or not changed.any():
+            return changed, changed
+
+        # Key each company-quarter by company and consecutive quarter number
+        companies, _ = pd.factorize(quarters['company_name'])
+        number = rolling_indicators.quarter_number(quarters['quarter'])
+        stride = int(number.max()) + span + 1
+        key = companies.astype(np.int64) * stride + number
+
+        offsets = np.arange(span + 1)
+        affected = np.isin(key, (key[changed][:, None] + offsets).ravel()) | changed
+        context = np.isin(key, (key[affected][:, None] - offsets).ravel()) | affected
+        return affected, context
+
+    def filter_changed_quarters(self, dict_df, detector, sections):
+        """
+        Keep only the company-quarters whose standard rows or indicator formulas changed since their indicators
+        were last saved, with the later quarters whose windows read them and the earlier rows those windows need.
+        Company-quarters whose standard rows are gone are returned too, flagged 'removed', so their indicators
+        are deleted and the later quarters whose windows read them recomputed.
+
+        Parameters:
+        - dict_df (dict): Standard statements keyed by sector.
+        - detector (change_detection.ChangeDetector): The detector holding the company-quarter fingerprints.
+        - sections (dict): Indicator lists keyed by frame name.
+
+        Returns:
+        - tuple: (rows the changed company-quarters need keyed by sector, the company-quarters to recompute with their fingerprints keyed by sector)
+        """
+        dict_changed, dict_quarters = {}, {}
+        try:
+            salt = self.indicators_fingerprint(sections)
+            span = formula_compiler.compile_indicators(sections).span()
+            start_time = time.time()
+            for i, (sector, df) in enumerate(dict_df.items()):
+                columns = [column for column in settings.statements_columns if column in df.columns]
+                quarters, codes = change_detection.ChangeDetector.group_fingerprints(df, settings.ratios_scope, columns, salt)
+                is_new, is_changed = detector.detect(quarters, scope=sector)
+                quarters['removed'] = False
+
+                # Saved company-quarters the standard rows no longer have, checked only when fingerprints are unmatched
+                known_keys, _ = detector.load(sector)
+                current_keys = change_detection.ChangeDetector.hash_columns(quarters, settings.ratios_scope)
+                removed = quarters.iloc[:0]
+                if (~known_keys.isin(current_keys)).any():
+                    stored = self.stored_quarters(sector)
+                    removed = stored[~np.isin(change_detection.ChangeDetector.hash_columns(stored, settings.ratios_scope), current_keys)].copy()
+                    removed['fingerprint'] = 0
+                    removed['removed'] = True
+
+                candidates = pd.concat([quarters, removed], ignore_index=True) if len(removed) else quarters
+                is_candidate = np.concatenate([is_new | is_changed, np.ones(len(removed), dtype=bool)])
+                affected, context = self.window_quarters(candidates, is_candidate, span)
+                changed = np.flatnonzero(affected)
+
+                if len(changed):
+                    dict_changed[sector] = df[np.isin(codes, np.flatnonzero(context[:len(quarters)]))].reset_index(drop=True)
+                    dict_quarters[sector] = candidates.iloc[changed].reset_index(drop=True)
+
+                extra_info = [f'{sector}: {len(changed)} of {len(quarters)} company-quarters to recompute, {len(removed)} removed']
+                system.print_info(i, extra_info, start_time, len(dict_df))
+
+        except Exception as e:
+            system.log_error(f"Error filtering changed company-quarters: {e}")
+
+        return dict_changed, dict_quarters
 
     def adjust_dfs_types(self, df, source_types=['Dados da Empresa'], target_types=['DFs Consolidadas', 'DFs Individuais']):
         """
-        Conditionally duplicates rows of specific types for other types, 
+        Conditionally duplicates rows of specific types for other types,
         based on the prior existence of these types for the same company and quarter.
 
+        The rows keep the order they were loaded in, followed by the duplicated rows, one block per target type.
+        The standard tables are written sorted within each filing, so the first row of each company, type and
+        quarter, which its indicator rows take their metadata from, is the one a full sort would put first.
+
         Parameters:
         - df (pd.DataFrame): Original DataFrame containing the financial data.
         - source_types (list of str): List of types of rows that will be duplicated. Default: ['Dados da Empresa'].
@@ -107,185 +356,114 @@ class FinancialRatios:
         - pd.DataFrame: Updated DataFrame with the conditional duplications.
         """
         try:
-            # Step 1: Identify existing combinations of company_name and quarter for each target_type
-            existing_combinations = {}
-            for target in target_types:
-                existing_keys = df[df['type'] == target][['company_name', 'quarter']].drop_duplicates()
-                existing_combinations[target] = existing_keys
-
-            # Step 2: Initialize a list to store all duplicated DataFrames
-            all_duplicated_dfs = []
-
-            # Step 3: Loop through each source_type and perform the duplication logic
-            for source_type in source_types:
-                # Filter the rows of the source_type
-                source_df = df[df['type'] == source_type].copy()
-
-                # For each target_type, check where to duplicate
-                for target in target_types:
-                    # Get the combinations where the target_type already exists
-                    target_keys = existing_combinations[target]
-
-                    # Perform a merge to identify which rows from source_df have an existing combination
-                    to_duplicate = source_df.merge(target_keys, on=['company_name', 'quarter'], how='inner', suffixes=('', '_target'))
-
-                    if not to_duplicate.empty:
-                        # Duplicate the rows and change the 'type' to the target_type
-                        duplicated = to_duplicate.copy()
-                        duplicated['type'] = target
-                        all_duplicated_dfs.append(duplicated)
-
-            # Step 4: Concatenate all the duplications
-            if all_duplicated_dfs:
-                duplicated_df = pd.concat(all_duplicated_dfs, ignore_index=True)
-            else:
-                duplicated_df = pd.DataFrame(columns=df.columns)
-
-            # Step 5: Remove the original rows from source_types
-            df_filtered = df[~df['type'].isin(source_types)].copy()
-
-            # Step 6: Add the duplications to the DataFrame
-            if not duplicated_df.empty:
-                df_updated = pd.concat([df_filtered, duplicated_df], ignore_index=True)
-            else:
-                df_updated = df_filtered.copy()
-
-            # Step 7: Reset index and sort the DataFrame
-            df_updated.reset_index(drop=True, inplace=True)
-            df_updated = df_updated.sort_values(
-                by=['sector', 'subsector', 'segment', 'company_name', 'quarter', 'version', 'type', 'account', 'description']
-            ).reset_index(drop=True)
-
-            return df_updated
+            return share_counts.ShareCounts(df, source_types, target_types).broadcast()
         except Exception as e:
             system.log_error(f"Error processing: {e}")
-            
 
+    def get_indicator_sections(self):
+        """
+        Return the indicator lists, keyed by the frame name of their rows.
+
+        Returns:
+        - dict: Indicator lists keyed by frame name, in the order their rows are added.
+        """
+        return {
+            'Relações Entre Ativos e Passivos': intel.indicators_11,
+            'Patrimônio': intel.indicators_11b,
+            'Dívida': intel.indicators_12,
+            'Resultados Fundamentalistas 1': intel.indicators_13,
+            'Resultados Fundamentalistas 2': intel.indicators_14,
+            'Resultados Fundamentalistas 3': intel.indicators_15,
+            'Resultados Fundamentalistas 4': intel.indicators_16,
+            'Análise do Fluxo de Caixa': intel.indicators_17,
+            'Análise do Valor Agregado': intel.indicators_18,
+            'Indicadores Anualizados': intel.indicators_19,
+        }
+
+    def calculate_indicators(self, df, sections):
+        """
+        Calculates the financial indicators of every list in one pass, as rows shaped like the statements.
+
+        The accounts are laid out once as a dense matrix of company, type and quarter by account, and the formulas,
+        compiled into one graph, are computed against its columns, so sub-expressions shared by several indicators
+        are computed once and the metadata of the new rows is read once.
+
+        Parameters:
+        - df (pd.DataFrame): Original DataFrame containing financial data.
+        - sections (dict): Indicator lists keyed by the name of the 'frame' of their rows.
+
+        Returns:
+        - pd.DataFrame: The indicator rows.
+        """
+        # Step 1: Lay the accounts out as a matrix with one row per company, type and quarter
+        engine = ratios_engine.RatiosEngine(df, sections)
+
+        # Step 2: Calculate the Indicators, reporting those whose accounts are missing
+        values, missing = engine.evaluate()
+        for output, absent in zip(engine.dag.outputs, missing):
+            if absent:
+                print(f"'{output['account']} - {output['description']}': Missing accounts {', '.join(absent)}")
+
+        # Step 3: Create New Rows for the Indicators, one block per indicator
+        return engine.indicator_rows(values)
 
-    def add_indicators(self, df, frame_name, indicator_list):
+    def add_indicators(self, df, sections):
         """
-        Calculates financial indicators and adds them as new rows in the DataFrame.
+        Calculates the financial indicators of every list and adds them as new rows in the DataFrame.
 
         Parameters:
         - df (pd.DataFrame): Original DataFrame containing financial data.
-        - frame_name (str): Name to identify the new 'frame' for the indicators.
-        - indicator_list (list of dict): List of dictionaries with indicator definitions.
+        - sections (dict): Indicator lists keyed by the name of the 'frame' of their rows.
 
         Returns:
         - pd.DataFrame: Updated DataFrame with the new indicator rows.
         """
-        # Step 1: Pivot the DataFrame with accounts as columns and include 'quarter' in the index
-        pivot_df = df.pivot_table(
-            index=['company_name', 'type', 'quarter'],
-            columns='account',
-            values='value',
-            aggfunc='sum',
-            fill_value=0  # Replace missing values with 0
-        ).reset_index()
-
-        # print("Pivoted DataFrame created successfully.")
-
-        # Step 2: Calculate the Indicators
-        for indicator in indicator_list:
-            column_name = indicator['description']
-            column_account = indicator['account']
-            formula = indicator['formula']
-
-            try:
-                # Apply the formula
-                pivot_df[column_name] = formula(pivot_df)
-
-                # print(f"Indicator '{column_name}' calculated successfully.")
-
-            except KeyError as e:
-                print(f"'{column_account} - {column_name}': {e}")
-                pivot_df[column_name] = np.nan  # Assign NaN if any required account is missing
-            except Exception as e:
-                print(f"Error calculating the indicator '{column_name}': {e}")
-                pivot_df[column_name] = np.nan  # Assign NaN in case of other errors
-
-        # Step 3: Create New Rows for the Indicators
-        new_rows = []
-
-        for indicator in indicator_list:
-            account = indicator['account']
-            description = indicator['description']
-
-            if description not in pivot_df.columns:
-                print(f"Indicator '{description}' was not calculated and will be ignored.")
-                continue
-
-            # Extract the calculated values for the indicator
-            indicator_values = pivot_df[['company_name', 'type', 'quarter', description]].copy()
-            indicator_values.rename(columns={description: 'value'}, inplace=True)
-            indicator_values['account'] = account
-            indicator_values['description'] = description
-
-            # Assign 'frame' as the provided frame_name to easily identify the new rows
-            indicator_values['frame'] = frame_name
-
-            # Fill in the missing columns with information from the original DataFrame
-            # Select unique combinations of 'company_name', 'type', and 'quarter'
-            metadata = df[['company_name', 'type', 'quarter', 'nsd', 'sector', 'subsector', 'segment', 'version']].drop_duplicates(
-                subset=['company_name', 'type', 'quarter'],
-                keep='first'
-            )
-
-            # Merge with 'metadata' to fill in 'nsd', 'sector', etc.
-            indicator_row = indicator_values.merge(
-                metadata,
-                on=['company_name', 'type', 'quarter'],
-                how='left'
-            )
-
-            # Reorder the columns to match the original DataFrame
-            indicator_row = indicator_row[['nsd', 'sector', 'subsector', 'segment', 'company_name', 'quarter',
-                                        'version', 'type', 'frame', 'account', 'description', 'value']]
-
-            # Add to the list of new rows
-            new_rows.append(indicator_row)
-
-        # Combine all new indicator rows
-        if new_rows:
-            new_rows_df = pd.concat(new_rows, ignore_index=True)
-            # print("All indicators added successfully.")
-        else:
-            new_rows_df = pd.DataFrame(columns=df.columns)
-            # print("No indicators were added.")
-
-        # Step 4: Add the New Rows to the Original DataFrame
-        updated_df = pd.concat([df, new_rows_df], ignore_index=True)
-
-        # Optional: Final Treatment of Values (e.g., Fill NaN with zero)
-        # updated_df['value'] = updated_df['value'].fillna(0)
-
-        return updated_df
+        # Add the New Rows to the Original DataFrame, keeping the shared categories
+        return categories.registry.concat([df, self.calculate_indicators(df, sections)], ignore_index=True)
 
     def main(self):
         """
-        Run the financial ratios calculation using the main thread.
+        Run the financial ratios calculation using the main thread and save the indicators to the ratios database.
+
+        Returns:
+        - dict: The saved indicator rows keyed by sector.
         """
         try:
             dict_df = self.load_data(settings.statements_standard)
+            sections = self.get_indicator_sections()
 
-            dfs = {}
+            # Only the company-quarters whose standard rows or formulas changed are recomputed in incremental mode
+            detector, dict_quarters = None, None
+            if settings.ratios_incremental:
+                detector = change_detection.ChangeDetector(settings.statements_ratios, settings.ratios_scope, ['fingerprint'])
+                dict_df, dict_quarters = self.filter_changed_quarters(dict_df, detector, sections)
+
+            dict_ratios = {}
             for sector, df in dict_df.items():
                 df = self.adjust_dfs_types(df)
-                df = self.add_indicators(df, 'Relações Entre Ativos e Passivos', intel.indicators_11)
-                df = self.add_indicators(df, 'Patrimônio', intel.indicators_11b)
-                df = self.add_indicators(df, 'Dívida', intel.indicators_12)
-                df = self.add_indicators(df, 'Resultados Fundamentalistas 1', intel.indicators_13)
-                df = self.add_indicators(df, 'Resultados Fundamentalistas 2', intel.indicators_14)
-                df = self.add_indicators(df, 'Resultados Fundamentalistas 3', intel.indicators_15)
-                df = self.add_indicators(df, 'Resultados Fundamentalistas 4', intel.indicators_16)
-                df = self.add_indicators(df, 'Análise do Fluxo de Caixa', intel.indicators_17)
-                df = self.add_indicators(df, 'Análise do Valor Agregado', intel.indicators_18)
-
-                df.to_csv(f'{sector}_ratios.csv', index=False)
-                dfs[sector] = df
-            pass
+                df = self.calculate_indicators(df, sections)
+
+                # Earlier quarters were only read by the windows; keep the recomputed ones
+                if dict_quarters is not None:
+                    keys = settings.ratios_scope
+                    recomputed = change_detection.ChangeDetector.hash_columns(dict_quarters[sector], keys)
+                    df = df[np.isin(change_detection.ChangeDetector.hash_columns(df, keys), recomputed)].reset_index(drop=True)
+                dict_ratios[sector] = df
+
+            dict_ratios = self.save_to_db(dict_ratios, dict_quarters)
+
+            # Remember the fingerprints only once the indicators are safely stored
+            if detector is not None and dict_ratios:
+                for sector in dict_ratios:
+                    removed = dict_quarters[sector]['removed'].to_numpy(dtype=bool)
+                    detector.remember(dict_quarters[sector][~removed], scope=sector)
+                    detector.discard(dict_quarters[sector][removed], scope=sector)
+                print(f"Recomputed company-quarters: {detector.stats()}")
+
+            return dict_ratios
         except Exception as e:
             system.log_error(f"Error initializing MinancialRatios: {e}")
+            return {}
 
 if __name__ == "__main__":
     financial_ratios = FinancialRatios()
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+
+from utils import intel
+from utils import rolling_indicators
+
+
+def apply_operation(op, values, multiplier, parameters=(), windows=None):
+    """
+    Compute one formula node from the buffers of its operands, with the arithmetic of the intel Formula classes.
+
+    Parameters:
+    - op (str): The operation: 'add', 'subtract', 'multiply', 'divide' or 'window'.
+    - values (list): The operand buffers, in order.
+    - multiplier (float): The constant the result is multiplied by.
+    - parameters (tuple): The settings of the operation, (function, periods) for a window.
+    - windows (rolling_indicators.QuarterWindows): The quarters of the rows, needed by window operations.
+
+    Returns:
+    ndarray: The node values.
+    """
+    if op == 'add':
+        result = values[0].copy()
+        for value in values[1:]:
+            result += value
+        return result * multiplier
+
+    if op == 'subtract':
+        result = values[0].copy()
+        for value in values[1:]:
+            result -= value
+        return result * multiplier
+
+    if op == 'multiply':
+        result = np.ones(len(values[0]))
+        for value in values:
+            result *= value
+        return result * multiplier
+
+    if op == 'divide':
+        numerator, denominator = values
+        result = np.full(len(numerator), np.nan)
+        nonzero = denominator != 0
+        result[nonzero] = (numerator[nonzero] / denominator[nonzero]) * multiplier
+        return result
+
+    if op == 'window':
+        if windows is None:
+            raise ValueError("Window formulas need the company, type and quarter of every row.")
+        function, periods = parameters
+        return windows.apply(function, periods, values[0]) * multiplier
+
+    raise ValueError(f"Unknown formula operation: {op}")
+
+class FormulaDag:
+    """
+    The indicator formulas of several lists compiled into one expression graph.
+
+    Each distinct sub-expression, such as Subtraction('02', '02.03') used by many indicators, becomes a single
+    node, so it is computed once per evaluation into a NumPy buffer shared by every formula using it. Nodes are
+    numbered after their operands, so evaluating them in order never meets an operand not yet computed. The
+    accounts each indicator needs are known up front, so indicators with missing accounts are reported and
+    skipped before anything is computed, where the Formula classes raised a KeyError halfway through.
+    """
+
+    def __init__(self, sections):
+        """
+        Compile the indicator lists.
+
+        Parameters:
+        - sections (dict): Indicator lists keyed by frame name, each indicator a dict with 'account', 'description' and 'formula'.
+        """
+        self.nodes = []  # (op, operand nodes, multiplier, parameters), or ('account', account name, None, ()) for the leaves
+        self.keys = {}  # Node number of each node
+        self.requires = []  # Accounts each node depends on
+        self.spans = []  # Quarters before the current one each node reads, through its windows
+        self.outputs = []  # One dict per indicator with 'frame', 'account', 'description' and 'node'
+        self.formula_nodes = 0  # Nodes before deduplication
+
+        for frame, indicators in sections.items():
+            for indicator in indicators:
+                self.outputs.append({
+                    'frame': frame,
+                    'account': indicator['account'],
+                    'description': indicator['description'],
+                    'node': self.add(indicator['formula']),
+                })
+
+    def add(self, term):
+        """
+        Add a formula or account to the graph, reusing the node of an identical expression.
+
+        Parameters:
+        - term (intel.Formula or str): The formula or account name.
+
+        Returns:
+        int: The node number.
+        """
+        self.formula_nodes += 1
+        if isinstance(term, intel.Formula):
+            operands = tuple(self.add(operand) for operand in term.operands())
+            key = (term.op, operands, term.multiplier, tuple(term.parameters()))
+            requires = frozenset().union(*(self.requires[operand] for operand in operands))
+            span = max(self.spans[operand] for operand in operands)
+            if term.op == 'window':
+                span += rolling_indicators.window_span(*term.parameters())
+        else:
+            key = ('account', term, None, ())
+            requires = frozenset([term])
+            span = 0
+
+        if key not in self.keys:
+            self.keys[key] = len(self.nodes)
+            self.nodes.append(key)
+            self.requires.append(requires)
+            self.spans.append(span)
+        return self.keys[key]
+
+    def accounts(self):
+        """
+        List the accounts the indicators read.
+
+        Returns:
+        list: The account names, sorted.
+        """
+        return sorted(term for op, term, _, _ in self.nodes if op == 'account')
+
+    def span(self):
+        """
+        Return how many quarters before the current one the indicators read, so incremental runs can recompute
+        the quarters a changed one reaches.
+
+        Returns:
+        int: The quarters looked back, 0 without windows.
+        """
+        return max((self.spans[output['node']] for output in self.outputs), default=0)
+
+    def missing(self, available):
+        """
+        Find the accounts each indicator needs that are not available.
+
+        Parameters:
+        - available (iterable): The available account names.
+
+        Returns:
+        list: The sorted missing accounts of each indicator, aligned with self.outputs.
+        """
+        available = set(available)
+        return [sorted(self.requires[output['node']] - available) for output in self.outputs]
+
+    def evaluate(self, columns, rows=None, windows=None):
+        """
+        Compute every indicator whose accounts are all available, each shared node once.
+
+        Parameters:
+        - columns (DataFrame or dict): The values of each account, one column per account.
+        - rows (int): The number of rows, when columns is a dict that may be empty.
+        - windows (rolling_indicators.QuarterWindows): The quarters of the rows, needed by window formulas.
+
+        Returns:
+        tuple: (values, missing) where values holds one column per indicator, NaN where accounts are missing,
+               and missing gives the missing accounts of each indicator.
+        """
+        available = list(columns.columns) if isinstance(columns, pd.DataFrame) else list(columns)
+        rows = len(columns) if rows is None else rows
+        missing = self.missing(available)
+
+        # Step 1: Mark the nodes of the computable indicators and of their operands
+        needed = np.zeros(len(self.nodes), dtype=bool)
+        for output, absent in zip(self.outputs, missing):
+            if not absent:
+                needed[output['node']] = True
+        for node in reversed(range(len(self.nodes))):
+            op, operands, _, _ = self.nodes[node]
+            if needed[node] and op != 'account':
+                needed[list(operands)] = True
+
+        # Step 2: Compute them in order, operands first
+        buffers = {}
+        for node in np.flatnonzero(needed):
+            op, operands, multiplier, parameters = self.nodes[node]
+            if op == 'account':
+                buffers[node] = np.asarray(columns[operands], dtype=float)
+            else:
+                buffers[node] = apply_operation(op, [buffers[operand] for operand in operands], multiplier, parameters, windows)
+
+        values = np.full((rows, len(self.outputs)), np.nan)
+        for i, (output, absent) in enumerate(zip(self.outputs, missing)):
+            if not absent:
+                values[:, i] = buffers[output['node']]
+        return values, missing
+
+    def stats(self):
+        """
+        Report the size of the graph.
+
+        Returns:
+        dict: Number of indicators, formula nodes before and graph nodes after deduplication, accounts read and quarters looked back.
+        """
+        return {'indicators': len(self.outputs), 'formula_nodes': self.formula_nodes, 'nodes': len(self.nodes),
+                'accounts': len(self.accounts()), 'span': self.span()}
+
+dags = {}  # Compiled graphs keyed by the frame names and id() of their indicator lists
+
+def compile_indicators(sections):
+    """
+    Compile indicator lists into one graph, once per process for the same lists.
+
+    Parameters:
+    - sections (dict): Indicator lists keyed by frame name.
+
+    Returns:
+    FormulaDag: The compiled graph.
+    """
+    key = tuple((frame, id(indicators)) for frame, indicators in sections.items())
+    cached = dags.get(key)
+    if cached is not None and all(a is b for a, b in zip(cached[0], sections.values())):
+        return cached[1]
+
+    dag = FormulaDag(sections)
+    dags[key] = (list(sections.values()), dag)
+    return dag
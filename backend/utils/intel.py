@@ -1,6 +1,7 @@
 import numpy as np
 
 from utils import system
+from utils import rolling_indicators
 
 # statements standardization
 section_0_criteria = [
@@ -1861,9 +1862,23 @@ class Formula:
     """
     Base class for all formula operations.
     """
+    op = None  # Operation name used by formula_compiler
+
     def __call__(self, df):
         raise NotImplementedError("Each formula must implement the __call__ method.")
 
+    def operands(self):
+        """
+        Return the account names or Formula instances the operation applies to, in order.
+        """
+        raise NotImplementedError("Each formula must implement the operands method.")
+
+    def parameters(self):
+        """
+        Return the settings of the operation besides its operands and multiplier, such as a window length.
+        """
+        return ()
+
 class Addition(Formula):
     def __init__(self, *accounts, multiplier=1):
         """
@@ -1877,6 +1892,11 @@ class Addition(Formula):
         self.accounts = accounts
         self.multiplier = multiplier
 
+    op = 'add'
+
+    def operands(self):
+        return self.accounts
+
     def __call__(self, df):
         try:
             # Sum all accounts or formulas
@@ -1903,14 +1923,19 @@ class Subtraction(Formula):
         self.subtrahends = subtrahends
         self.multiplier = multiplier
 
+    op = 'subtract'
+
+    def operands(self):
+        return (self.minuend,) + self.subtrahends
+
     def __call__(self, df):
         try:
             # Compute minuend value
             result = self.minuend(df) if isinstance(self.minuend, Formula) else df[self.minuend]
-            # Subtract each subtrahend
+            # Subtract each subtrahend, into a new Series so the minuend column of df is left intact
             for acc in self.subtrahends:
                 sub_val = acc(df) if isinstance(acc, Formula) else df[acc]
-                result -= sub_val
+                result = result - sub_val
             return result * self.multiplier
         except KeyError as e:
             raise KeyError(f"Missing account: {e}")
@@ -1928,6 +1953,11 @@ class Multiplication(Formula):
         self.multiplicands = multiplicands
         self.multiplier = multiplier
 
+    op = 'multiply'
+
+    def operands(self):
+        return self.multiplicands
+
     def __call__(self, df):
         try:
             # Start with an initial value of 1 for multiplication
@@ -1954,6 +1984,11 @@ class Division(Formula):
         self.denominator = denominator
         self.multiplier = multiplier
 
+    op = 'divide'
+
+    def operands(self):
+        return (self.numerator, self.denominator)
+
     def __call__(self, df):
         try:
             # Compute numerator and denominator values
@@ -1969,6 +2004,75 @@ class Division(Formula):
         except KeyError as e:
             raise KeyError(f"Missing account: {e}")
 
+class Window(Formula):
+    def __init__(self, term, function='sum', periods=4, multiplier=1):
+        """
+        Initializes a rolling window over the quarters of each company and statement type.
+
+        Parameters:
+        - term (str or Formula): The account name or Formula instance the window reads.
+        - function (str): 'sum' of the last periods quarters, their 'mean', or the 'growth' over the value periods quarters earlier.
+        - periods (int): The window length in quarters. Defaults to 4, a year.
+        - multiplier (float): A constant to multiply the result by. Defaults to 1.
+        """
+        if function not in rolling_indicators.window_functions:
+            raise ValueError(f"Window function must be one of {rolling_indicators.window_functions}.")
+        self.term = term
+        self.function = function
+        self.periods = int(periods)
+        self.multiplier = multiplier
+
+    op = 'window'
+
+    def operands(self):
+        return (self.term,)
+
+    def parameters(self):
+        return (self.function, self.periods)
+
+    def __call__(self, df):
+        try:
+            # Compute the term, then its window over the quarters of each company and type
+            values = self.term(df) if isinstance(self.term, Formula) else df[self.term]
+            windows = rolling_indicators.QuarterWindows.from_frame(df)
+            return windows.apply(self.function, self.periods, np.asarray(values, dtype=float)) * self.multiplier
+        except KeyError as e:
+            raise KeyError(f"Missing account: {e}")
+
+class TTM(Window):
+    def __init__(self, term, multiplier=1):
+        """
+        Initializes the trailing twelve months sum of a quarterly flow, such as revenue or earnings.
+
+        Parameters:
+        - term (str or Formula): The account name or Formula instance to sum.
+        - multiplier (float): A constant to multiply the result by. Defaults to 1.
+        """
+        super().__init__(term, 'sum', 4, multiplier)
+
+class YoY(Window):
+    def __init__(self, term, multiplier=1):
+        """
+        Initializes the growth over the same quarter of the previous year.
+
+        Parameters:
+        - term (str or Formula): The account name or Formula instance to compare.
+        - multiplier (float): A constant to multiply the result by. Defaults to 1.
+        """
+        super().__init__(term, 'growth', 4, multiplier)
+
+class MovingAverage(Window):
+    def __init__(self, term, periods=4, multiplier=1):
+        """
+        Initializes the moving average of the last quarters, such as the average equity of a year.
+
+        Parameters:
+        - term (str or Formula): The account name or Formula instance to average.
+        - periods (int): The number of quarters. Defaults to 4.
+        - multiplier (float): A constant to multiply the result by. Defaults to 1.
+        """
+        super().__init__(term, 'mean', periods, multiplier)
+
 ##### New Indicators
 indicators_11 = [
     {
@@ -2927,3 +3031,55 @@ indicators_18 = [
         )
     }
 ]
+
+indicators_19 = [
+    {
+        'account': '19.01', 
+        'description': 'Receita dos Últimos 12 Meses',
+        'formula': TTM('03.01')  # Receita Bruta
+    },
+    {
+        'account': '19.02', 
+        'description': 'Lucro dos Últimos 12 Meses',
+        'formula': TTM('03.11')  # Lucro do Período
+    },
+    {
+        'account': '19.03', 
+        'description': 'Caixa Operacional dos Últimos 12 Meses',
+        'formula': TTM('06.01')  # Caixa de Operações
+    },
+    {
+        'account': '19.04', 
+        'description': 'Margem Líquida dos Últimos 12 Meses (Lucro por Receita)',
+        'formula': Division(
+            TTM('03.11'),  # Lucro do Período
+            TTM('03.01')  # Receita Bruta
+        )
+    },
+    {
+        'account': '19.05', 
+        'description': 'Retorno sobre o Patrimônio dos Últimos 12 Meses (ROE)',
+        'formula': Division(
+            TTM('03.11'),  # Lucro do Período
+            MovingAverage('02.03')  # Patrimônio Líquido Médio
+        )
+    },
+    {
+        'account': '19.06', 
+        'description': 'Retorno sobre o Ativo dos Últimos 12 Meses (ROA)',
+        'formula': Division(
+            TTM('03.11'),  # Lucro do Período
+            MovingAverage('01')  # Ativo Total Médio
+        )
+    },
+    {
+        'account': '19.07', 
+        'description': 'Crescimento da Receita em 12 Meses',
+        'formula': YoY('03.01')  # Receita Bruta
+    },
+    {
+        'account': '19.08', 
+        'description': 'Crescimento do Lucro dos Últimos 12 Meses',
+        'formula': YoY(TTM('03.11'))  # Lucro do Período
+    }
+]
@@ -3,12 +3,84 @@ import os
 import sqlite3
 import pandas as pd
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from utils import system
 from utils import settings
+from utils import scheduler
+from utils import db_writer
+from utils import storage
+from utils import categories
+from utils import watermark
+from utils import change_detection
+from utils import decumulation
+from utils import account_index
 
 
+def pack_frame(df):
+    """
+    Pack a DataFrame into plain NumPy arrays for cheap transfer between processes.
+
+    Text columns are sent as integer codes plus their distinct values, so pickling costs one buffer per column
+    instead of one Python object per cell. Categorical columns keep their own codes and categories.
+
+    Args:
+        df (pd.DataFrame): The frame to pack.
+
+    Returns:
+        dict: 'columns' order and, per column, ('category', codes, categories), ('codes', codes, uniques) or ('array', values).
+    """
+    packed = {'columns': list(df.columns)}
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            packed[column] = ('category', df[column].cat.codes.to_numpy(), np.asarray(df[column].cat.categories, dtype=object))
+        elif df[column].dtype == object:
+            codes, uniques = pd.factorize(df[column])
+            packed[column] = ('codes', codes.astype(np.int32), np.asarray(uniques, dtype=object))
+        else:
+            packed[column] = ('array', df[column].to_numpy())
+    return packed
+
+def unpack_frame(packed):
+    """
+    Rebuild a DataFrame packed by pack_frame.
+
+    Args:
+        packed (dict): The packed frame.
+
+    Returns:
+        pd.DataFrame: The frame, with missing text values as None.
+    """
+    data = {}
+    for column in packed['columns']:
+        kind, *arrays = packed[column]
+        if kind == 'category':
+            codes, labels = arrays
+            data[column] = pd.Categorical.from_codes(codes, labels)
+        elif kind == 'codes':
+            codes, uniques = arrays
+            values = np.append(uniques, None)  # code -1 marks a missing value
+            data[column] = values[codes]
+        else:
+            data[column] = arrays[0]
+    return pd.DataFrame(data, columns=packed['columns'])
+
+def transform_sector(sector, packed):
+    """
+    Process pool entry point: run the math transformations on one sector.
+
+    Args:
+        sector (str): The sector name.
+        packed (dict): The sector statements packed by pack_frame.
+
+    Returns:
+        tuple: (sector, the transformed frame packed by pack_frame, or None on failure)
+    """
+    dict_transformed = MathTransformation().mathmagic({sector: unpack_frame(packed)})
+    if sector not in dict_transformed:
+        return sector, None
+    return sector, pack_frame(dict_transformed[sector])
+
 class MathTransformation:
     """
     A class to perform mathematical transformations on financial data.
@@ -18,51 +90,123 @@ class MathTransformation:
         """Initialize the MathTransformation with settings."""
         self.db_folder = settings.db_folder
         self.db_name = settings.db_name
+        self.load_marks = {}  # Watermarks reached by the last load, saved once the results are stored
+
+    def normalize_data(self, df):
+        """
+        Normalize the loaded statements: datetime quarters, numeric values and '0' for missing accounts.
+
+        Args:
+            df (pd.DataFrame): The rows read from a sector table.
+
+        Returns:
+            pd.DataFrame: The normalized rows.
+        """
+        # Normalize date columns to datetime format
+        df['quarter'] = pd.to_datetime(df['quarter'], errors='coerce')
+
+        # Normalize numeric columns
+        df['value'] = pd.to_numeric(df['value'], errors='coerce')
+
+        # Fill missing 'value' with 0
+        df['value'] = df['value'].fillna(0)
+
+        # Identify rows where 'account' is missing or NaN and 'value' has been set to 0
+        missing_account = df['account'].isna() | df['account'].str.strip().eq('')
+        df.loc[missing_account, 'account'] = '0'  # Set 'account' to '0' (as text) for these rows
+
+        return df
+
+    def read_sector(self, conn, sector, mark=None):
+        """
+        Read a sector table, or only the company-years touched since a watermark.
+
+        Rows are new when their rowid is above the watermark. Every row of the same company and year is read
+        with them, since the 3/6/9/12 differencing needs all quarters of the year. If the table was renumbered,
+        lost rows or had rows rewritten in place by an upsert since the watermark, the whole table is read again.
+
+        Args:
+            conn (sqlite3.Connection): The open connection.
+            sector (str): The sector table name.
+            mark (tuple): The (row_id, row_count, rewrites) watermark, or None for a full read.
+
+        Returns:
+            tuple: (DataFrame or None if nothing is new, the new (row_id, row_count, rewrites) watermark)
+        """
+        new_mark = watermark.table_mark(conn, sector)
+        max_rowid, row_count, rewrites = new_mark
 
-    def load_data(self, files):
+        if mark is not None:
+            last_rowid, last_count, last_rewrites = mark
+            new_rows = conn.execute(f"SELECT COUNT(*) FROM {sector} WHERE rowid > ?", (last_rowid,)).fetchone()[0]
+
+            # Only added rows may sit above the watermark and no row below it may have been rewritten
+            if max_rowid >= last_rowid and new_rows == row_count - last_count and rewrites == last_rewrites:
+                if new_rows == 0:
+                    return None, new_mark
+
+                # Company-years touched by the new rows, as indexed quarter ranges on the primary key
+                keys = conn.execute(f"SELECT DISTINCT company_name, substr(quarter, 1, 4) FROM {sector} WHERE rowid > ?", (last_rowid,)).fetchall()
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS math_keys (company_name TEXT, quarter_start TEXT, quarter_end TEXT)")
+                conn.execute("DELETE FROM math_keys")
+                conn.executemany("INSERT INTO math_keys VALUES (?, ?, ?)", [(company_name, f"{year}-01-01", f"{year}-12-31 99") for company_name, year in keys if year])
+
+                # In rowid order, so latest_versions breaks version ties like the current-version view
+                query = f"""
+                    SELECT t.* FROM math_keys k
+                    JOIN {sector} t ON t.company_name = k.company_name AND t.quarter BETWEEN k.quarter_start AND k.quarter_end
+                    ORDER BY t.rowid
+                """
+                return pd.read_sql_query(query, conn), new_mark
+
+            print(f"{sector}: rows changed below the watermark, reloading the whole table")
+
+        return pd.read_sql_query(f"SELECT * FROM {sector}", conn), new_mark
+
+    def load_data(self, files, marks=None, columns=None, years=None):
         """
-        Load financial data from the database.
+        Load financial data from the storage of a stage.
 
         Args:
             files (str): The name part of the database file to load.
+            marks (dict): Optional (row_id, row_count, rewrites) watermarks per sector. If given, only the company-years
+                          with rows added since the watermark are loaded from the SQLite file, and the reached
+                          watermarks are kept in self.load_marks.
+            columns (list): The columns to read on a full load. None reads all of them.
+            years (list): The quarter years to read on a full load. None reads every year.
 
         Returns:
             dict: A dictionary where keys are sectors and values are DataFrames containing the NSD data for that sector.
         """
         try:
-            db_file = os.path.join(self.db_folder, f"{settings.db_name.split('.')[0]} {files}.db")
-            conn = sqlite3.connect(db_file)
-            cursor = conn.cursor()
-
-            # Fetch all table names excluding internal SQLite tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-            tables = cursor.fetchall()
+            # Watermarks are SQLite rowids, so incremental loads read the SQLite file itself
+            store = storage.SqliteStore(files) if marks is not None else storage.get_store(files)
+            tables = store.sectors()
 
             dfs = {}
             total_lines = 0
             start_time = time.time()  # Initialize start time for progress tracking
             print(files)
 
-            # Iterate through each table (sector) and process the data
-            for i, table in enumerate(tables):
-                sector = table[0]
-                df = pd.read_sql_query(f"SELECT * FROM {sector}", conn)
-
-                # Normalize date columns to datetime format
-                df['quarter'] = pd.to_datetime(df['quarter'], errors='coerce')
-
-                # Normalize numeric columns
-                df['value'] = pd.to_numeric(df['value'], errors='coerce')
+            self.load_marks = {}
 
-                # Fill missing 'value' with 0
-                df['value'] = df['value'].fillna(0)
+            # Iterate through each table (sector) and process the data
+            for i, sector in enumerate(tables):
+                if marks is None:
+                    # The storage only hands back the latest version of each statement line
+                    df = store.read(sector, columns, years, versions='current')
+                else:
+                    df, self.load_marks[sector] = self.read_sector(store.conn, sector, marks.get(sector))
+                    if df is None:
+                        continue
 
-                # Identify rows where 'account' is missing or NaN and 'value' has been set to 0
-                missing_account = df['account'].isna() | df['account'].str.strip().eq('')
-                df.loc[missing_account, 'account'] = '0'  # Set 'account' to '0' (as text) for these rows
+                df = self.normalize_data(df)
+                if settings.categorical_frames:
+                    categories.registry.encode(df)  # Sorts, groupbys and merges then run on integer codes
 
-                # Filter out only the latest versions for each group
-                df, _ = self.filter_newer_versions(df)
+                if marks is not None:
+                    # Filter out only the latest versions of the company-years read
+                    df = storage.latest_versions(df)
                 dfs[sector] = df  # Store the DataFrame with the sector as the key
                 total_lines += len(df)  # Update the total number of processed lines
 
@@ -70,51 +214,33 @@ class MathTransformation:
                 extra_info = [f'Loaded {len(df)} items from {sector} in {files}, total {total_lines}']
                 system.print_info(i, extra_info, start_time, len(tables))  # Removed the total_files argument
 
+            store.close()
+
+            # Sectors encoded early hold shorter dictionaries; bring them all to the same dtypes
+            if settings.categorical_frames:
+                categories.registry.align(dfs)
             return dfs
 
         except Exception as e:
             system.log_error(f"Error loading existing financial statements: {e}")
+            self.load_marks = {}
             return {}
 
-    def filter_newer_versions(self, df):
-        """
-        Filter and keep only the newest data from groups of (company_name, quarter, type, frame, account).
-
-        Args:
-            df (pd.DataFrame): DataFrame containing the financial statements data.
-
-        Returns:
-            pd.DataFrame: Filtered DataFrame with only the latest versions for each group.
-        """
-        group_columns = ['company_name', 'quarter', 'type', 'frame', 'account']
-        version_column = 'version'
-
-        try:
-            df_sorted = df.sort_values(by=group_columns + [version_column], ascending=[True] * len(group_columns) + [False])
-            df_filtered = df_sorted.drop_duplicates(subset=group_columns, keep='first')
-
-            # Also return duplicates as an optional output
-            df_duplicates = df_sorted[df_sorted.duplicated(subset=group_columns, keep=False) & (df_sorted.duplicated(subset=group_columns + [version_column], keep=False) == False)]
-
-            return df_filtered, df_duplicates
-
-        except Exception as e:
-            system.log_error(f"Error during filtering newer versions: {e}")
-            return pd.DataFrame(columns=settings.statements_columns), pd.DataFrame(columns=settings.statements_columns)
-
     def filter_new_entries(self, dict_new, dict_existing):
         """
-        Filter out new entries in dict_new that are not present in dict_existing.
+        Filter out entries in dict_new that are already present, unchanged, in dict_existing.
+
+        Rows are matched on (company_name, quarter, type, frame, account) through one hash lookup per sector;
+        a row is kept when its key is new or its value or version differs from the existing row.
 
         Args:
             dict_new (dict): A dictionary where keys are sectors and values are DataFrames containing the latest data.
             dict_existing (dict): A dictionary where keys are sectors and values are DataFrames containing already processed data.
 
         Returns:
-            dict: A dictionary where keys are sectors and values are DataFrames with entries in dict_new that are not present in dict_existing.
+            dict: A dictionary where keys are sectors and values are DataFrames with the new or changed entries of dict_new.
         """
-        key_columns = ['company_name', 'quarter', 'type', 'frame', 'account']  # Define columns that will be used as keys for comparison
-        new_entries_column = 'version'  # Define the column that will be used to identify the latest version of entries
+        detector = change_detection.ChangeDetector(settings.statements_file_math, settings.version_columns, ['value', 'version'])
 
         filtered_results = {}  # Initialize an empty dictionary to store the filtered results
         start_time = time.time()  # Record the start time to measure processing time for each sector
@@ -125,36 +251,11 @@ class MathTransformation:
             # Iterate over each sector and its associated DataFrame in the new data dictionary
             for i, (sector, df_new) in enumerate(dict_new.items()):
                 if sector in dict_existing:
-                    # If the sector exists in both new and existing data, retrieve the existing DataFrame
-                    df_existing = dict_existing[sector]
-
-                    # Merge new and existing DataFrames on key columns with an indicator column to show where each row is from
-                    df_comparison = pd.merge(df_new, df_existing[key_columns], on=key_columns, how='outer', indicator=True)
-
-                    # Select rows that are only in the new DataFrame (left_only in the merged indicator)
-                    df_left_only = df_comparison[df_comparison['_merge'] == 'left_only'].drop(columns=['_merge'])
-
-                    # Select rows that are present in both DataFrames (both in the merged indicator)
-                    df_both = df_comparison[df_comparison['_merge'] == 'both'].copy()
-
-                    # Filter out rows where 'account' is NaN or blank after trimming whitespace
-                    df_both = df_both[df_both['account'].notna() & df_both['account'].str.strip().astype(bool)]
-
-                    # Sort the DataFrame by key columns and version, descending to have the newest versions at the top
-                    df_both = df_both.sort_values(by=key_columns + [new_entries_column], ascending=[True] * len(key_columns) + [False])
-
-                    # Remove entries from df_both that already exist in df_existing based on key columns
-                    df_both = df_both[~df_both.set_index(key_columns).index.isin(df_existing.set_index(key_columns).index)]
-
-                    # Concatenate the two DataFrames (df_left_only and filtered df_both) to get the final set of new entries
-                    df_filtered = pd.concat([df_left_only, df_both], ignore_index=True)
-
-                    # Determine the number of new entries identified for the current sector
-                    size = len(df_filtered)
-
+                    # Keep the rows whose key is unknown or whose value or version changed
+                    df_filtered = detector.changes(df_new, existing=dict_existing[sector])
                     if not df_filtered.empty:
-                        # If there are new entries, add them to the filtered results dictionary
                         filtered_results[sector] = df_filtered
+                    size = len(df_filtered)
                 else:
                     # If the sector does not exist in the existing data, add all entries from the new data to the results
                     filtered_results[sector] = df_new
@@ -185,14 +286,19 @@ class MathTransformation:
             tuple: Three DataFrames for unmodified, adjust_year_end_balance, and adjust_cumulative_quarter_balances groups.
         """
         try:
+            # Match the account prefixes once per distinct account rather than once per row
+            index = account_index.AccountIndex(df['account'])
+            is_year_end = index.prefix_mask(settings.year_end_accounts)
+            is_cumulative = index.prefix_mask(settings.cumulative_quarter_accounts)
+
             # Group 1: Entries that don't need modification
-            unmodified_statements = df[~df['account'].str.startswith(tuple(settings.year_end_accounts + settings.cumulative_quarter_accounts))]
+            unmodified_statements = df[~(is_year_end | is_cumulative)]
 
             # Group 2: Entries for adjust_year_end_balance
-            year_end_balance_statements = df[df['account'].str.startswith(tuple(settings.year_end_accounts))]
+            year_end_balance_statements = df[is_year_end]
 
             # Group 3: Entries for adjust_cumulative_quarter_balances
-            cumulative_quarter_balances_statements = df[df['account'].str.startswith(tuple(settings.cumulative_quarter_accounts))]
+            cumulative_quarter_balances_statements = df[is_cumulative]
 
             return unmodified_statements, year_end_balance_statements, cumulative_quarter_balances_statements
 
@@ -200,109 +306,6 @@ class MathTransformation:
             system.log_error(f"Error during data splitting: {e}")
             return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
-    def math_create_pivot(self, df):
-        """
-        Create a pivot table for the 'value' column, transforming the DataFrame to show values for different months in separate columns.
-
-        Args:
-            df (pd.DataFrame): The input DataFrame containing financial data.
-
-        Returns:
-            pd.DataFrame: A DataFrame with the 'value' column pivoted by month and merged with the original DataFrame.
-        """
-        try:
-            df.to_csv('df.csv')
-            # Create a pivot table for the 'value' column
-            value_pivot = df.pivot_table(
-                index=['company_name', 'type', 'frame', 'account', 'year'],
-                columns='month',
-                values='value',
-                aggfunc='first'
-            ).reset_index()
-
-            # Renaming the columns to match the desired format
-            value_pivot.columns.name = None
-
-            # Get the available month columns after pivot
-            available_months = set(value_pivot.columns) - {'company_name', 'type', 'frame', 'account', 'year'}
-
-            # Define the target months for quarterly data
-            target_quarters = [3, 6, 9, 12]
-
-            # Find the closest available month for each target quarter
-            closest_months = {}
-            for target in target_quarters:
-                closest_month = min(available_months, key=lambda x: abs(x - target), default=None)
-                if closest_month:
-                    closest_months[target] = closest_month
-
-            # Keep only columns for the closest months of each quarter
-            columns_to_keep = ['company_name', 'type', 'frame', 'account', 'year'] + list(closest_months.values())
-            value_pivot = value_pivot[columns_to_keep]
-
-            # Ensure columns are renamed to standard quarters (3, 6, 9, 12)
-            rename_columns = {closest_months[q]: q for q in target_quarters if q in closest_months}
-            value_pivot.rename(columns=rename_columns, inplace=True)
-
-            # Merge the pivoted data back with the original dataframe on key columns
-            final_df = pd.merge(
-                df.drop(columns=['nsd', 'version', 'value', 'quarter', 'month']),  # Drop 'value', 'quarter', 'month' columns to avoid duplication
-                value_pivot,
-                left_on=['company_name', 'type', 'frame', 'account', 'year'],
-                right_on=['company_name', 'type', 'frame', 'account', 'year'],
-                how='left'
-            )
-
-            # Removing duplicates based on all columns to keep the first occurrence
-            final_df = final_df.drop_duplicates(subset=['company_name', 'type', 'frame', 'account', 'year'])
-
-            return final_df
-
-        except Exception as e:
-            system.log_error(f"Error during pivot creation: {e}")
-            return pd.DataFrame()  # Return an empty DataFrame on error
-
-
-    def math_unpivot(self, df_pivot, df):
-        """
-        Unpivot the DataFrame to transform month columns back to rows and merge additional columns from the original DataFrame.
-
-        Args:
-            df_pivot (pd.DataFrame): The pivoted DataFrame containing financial data by month.
-            df (pd.DataFrame): The original DataFrame to merge additional columns from.
-
-        Returns:
-            pd.DataFrame: A DataFrame unpivoted back to the original structure with added columns.
-        """
-        try:
-            # Create a new DataFrame by unpivoting the columns 3, 6, 9, and 12
-            unpivoted_df = df_pivot.melt(
-                id_vars=['company_name', 'type', 'frame', 'account', 'year'],  # Columns to keep
-                value_vars=[3, 6, 9, 12],  # Columns to unpivot
-                var_name='month',  # Name for the 'variable' column
-                value_name='value'  # Name for the 'value' column
-            )
-
-            # Create the 'quarter' column based on 'year' and 'month'
-            unpivoted_df['quarter'] = pd.to_datetime(unpivoted_df['year'].astype(str) + '-' + unpivoted_df['month'].astype(str) + '-01') + pd.offsets.MonthEnd(0)
-
-            # Sort the filtered DataFrame by company_name and quarter for better readability
-            unpivoted_df = unpivoted_df.sort_values(by=['company_name', 'quarter']).reset_index(drop=True)
-
-            # Merge unpivoted DataFrame with the original df on common columns to incorporate additional columns
-            merged_df = pd.merge(
-                unpivoted_df,
-                df[['nsd', 'sector', 'subsector', 'segment', 'company_name', 'quarter', 'version', 'type', 'frame', 'account', 'description']],
-                on=['company_name', 'type', 'frame', 'account', 'quarter'],
-                how='right'
-            )[df.columns]
-
-            return merged_df
-
-        except Exception as e:
-            system.log_error(f"Error during unpivot operation: {e}")
-            return pd.DataFrame()  # Return an empty DataFrame on error
-
     def adjust_year_end_balance(self, df):
         """
         Adjust the 'value' column for the last quarter by subtracting the cumulative values of previous quarters.
@@ -314,18 +317,7 @@ class MathTransformation:
             pd.DataFrame: DataFrame with adjusted values for the last quarter.
         """
         try:
-            df = df.copy()
-            
-            # pivot
-            df_pivot = self.math_create_pivot(df)
-
-            # mathmagic
-            df_pivot[12] = df_pivot[12] - (df_pivot[9] + df_pivot[6] + df_pivot[3])
-
-            # unpivot
-            df = self.math_unpivot(df_pivot, df)
-
-            return df
+            return decumulation.decumulate_year_end(df)
 
         except Exception as e:
             system.log_error(f"Error during year-end balance adjustment: {e}")
@@ -342,21 +334,7 @@ class MathTransformation:
             pd.DataFrame: DataFrame with adjusted values for all quarters.
         """
         try:
-            df = df.copy()
-            
-            # pivot
-            df_pivot = self.math_create_pivot(df)
-
-            # mathmagic
-            df_pivot[3] = df_pivot[3]
-            df_pivot[6] = df_pivot[6] - (df_pivot[3])
-            df_pivot[9] = df_pivot[9] - (df_pivot[6] + df_pivot[3])
-            df_pivot[12] = df_pivot[12] - (df_pivot[9] + df_pivot[6] + df_pivot[3])
-
-            # unpivot
-            df = self.math_unpivot(df_pivot, df)
-
-            return df
+            return decumulation.decumulate_cumulative(df)
 
         except Exception as e:
             system.log_error(f"Error during cumulative quarter balance adjustment: {e}")
@@ -403,9 +381,7 @@ class MathTransformation:
                 # Drop 'year' and 'month' columns from the transformed DataFrame
                 transformed_df = transformed_df.drop(columns=['year', 'month'])
 
-               # Store the transformed data in the dictionary (we will merge with existing data during saving)
-                transformed_df.to_csv(f'{sector}_math.csv', index=False)
-
+                # Store the transformed data in the dictionary (we will merge with existing data during saving)
                 dict_transformed[sector] = transformed_df
                 size = len(transformed_df)
                 total_lines += size
@@ -420,129 +396,208 @@ class MathTransformation:
             system.log_error(f"Error during mathematical transformations: {e}")
             return {}
 
-    def save_to_db(self, data_dict):
+    def get_db_path(self):
+        """
+        Return the path of the math database.
+
+        Returns:
+            str: The database path.
+        """
+        return os.path.join(self.db_folder, f"{settings.db_name.split('.')[0]} {settings.statements_file_math}.db")
+
+    def write_batch(self, conn, df, sector):
+        """
+        Create the sector table if needed and upsert the transformed rows, inside the caller's transaction.
+
+        Args:
+            conn (sqlite3.Connection): The open connection.
+            df (DataFrame): The transformed data of one sector.
+            sector (str): The sector name.
+
+        Returns:
+            int: The number of rows written.
+        """
+        table_name = sector.upper().replace(' ', '_')  # Create a table name from sector name
+
+        # SQL for creating the table
+        create_table_sql = f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            nsd INTEGER,
+            sector TEXT,
+            subsector TEXT,
+            segment TEXT,
+            company_name TEXT,
+            quarter TEXT,
+            version TEXT,
+            type TEXT,
+            frame TEXT,
+            account TEXT,
+            description TEXT,
+            value REAL,
+            PRIMARY KEY (company_name, quarter, version, type, frame, account, description)
+        )
+        """
+
+        # SQL command for INSERT OR REPLACE
+        insert_sql = f"""
+        INSERT INTO {table_name} 
+        (nsd, sector, subsector, segment, company_name, quarter, version, type, frame, account, description, value) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(company_name, quarter, version, type, frame, account, description) DO UPDATE SET
+        nsd=excluded.nsd,
+        sector=excluded.sector,
+        subsector=excluded.subsector,
+        segment=excluded.segment,
+        type=excluded.type,
+        frame=excluded.frame,
+        account=excluded.account,
+        description=excluded.description,
+        value=excluded.value
+        """
+
+        # Prepare the data for bulk insertion
+        df = df.copy()  # Work on a copy to avoid modifying the original DataFrame
+
+        # Ensure 'quarter' column is datetime and convert it to string format for SQLite compatibility
+        df['quarter'] = pd.to_datetime(df['quarter'], errors='coerce').dt.strftime('%Y-%m-%d')
+
+        # Replace NaN and NaT with None to make the DataFrame compatible with SQLite
+        df = df.astype(object).where(pd.notna(df), None)
+
+        # Convert DataFrame to list of tuples for batch insertion
+        data_to_insert = list(df.itertuples(index=False, name=None))
+
+        # Execute batch insert
+        conn.execute(create_table_sql)
+        conn.executemany(insert_sql, data_to_insert)
+        return len(data_to_insert)
+
+    def save_to_db(self, data_dict, writer=None):
         """
         Save the transformed data to the SQLite database, creating or replacing tables as necessary.
         Updates existing data and inserts new data.
 
         Args:
             data_dict (dict): Dictionary containing DataFrames of transformed data for each sector.
+            writer (DatabaseWriter): If given, each sector is queued for this shared writer instead of written directly.
         """
         try:
             # Construct the database path
-            db_path = os.path.join(self.db_folder, f"{settings.db_name.split('.')[0]} {settings.statements_file_math}.db")
+            db_path = self.get_db_path()
 
-            with sqlite3.connect(db_path) as conn:
-                cursor = conn.cursor()
+            if writer is not None:
+                for sector, df in data_dict.items():
+                    writer.submit(db_path, sector, df, self.write_batch)
+                return db_path
 
+            conn = system.db_connect(db_path)
+            try:
                 start_time = time.time()
                 total_lines = 0
                 for i, (sector, df) in enumerate(data_dict.items()):
-                    table_name = sector.upper().replace(' ', '_')  # Create a table name from sector name
-                    
-                    # # SQL for dropping the table if it exists
-                    # drop_table_sql = f"DROP TABLE IF EXISTS {table_name}"
-                    # cursor.execute(drop_table_sql)
-                        
-                    # SQL for creating the table
-                    create_table_sql = f"""
-                    CREATE TABLE IF NOT EXISTS {table_name} (
-                        nsd INTEGER,
-                        sector TEXT,
-                        subsector TEXT,
-                        segment TEXT,
-                        company_name TEXT,
-                        quarter TEXT,
-                        version TEXT,
-                        type TEXT,
-                        frame TEXT,
-                        account TEXT,
-                        description TEXT,
-                        value REAL,
-                        PRIMARY KEY (company_name, quarter, version, type, frame, account, description)
-                    )
-                    """
-                    cursor.execute(create_table_sql)
-
-                    # SQL command for INSERT OR REPLACE
-                    insert_sql = f"""
-                    INSERT INTO {table_name} 
-                    (nsd, sector, subsector, segment, company_name, quarter, version, type, frame, account, description, value) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(company_name, quarter, version, type, frame, account, description) DO UPDATE SET
-                    nsd=excluded.nsd,
-                    sector=excluded.sector,
-                    subsector=excluded.subsector,
-                    segment=excluded.segment,
-                    type=excluded.type,
-                    frame=excluded.frame,
-                    account=excluded.account,
-                    description=excluded.description,
-                    value=excluded.value
-                    """
-
-                    # Prepare the data for bulk insertion
-                    df = df.copy()  # Work on a copy to avoid modifying the original DataFrame
-
-                    # Ensure 'quarter' column is datetime and convert it to string format for SQLite compatibility
-                    df['quarter'] = pd.to_datetime(df['quarter'], errors='coerce').dt.strftime('%Y-%m-%d')
-                   
-                    # Replace NaN and NaT with None to make the DataFrame compatible with SQLite
-                    df = df.where(pd.notna(df), None)
-
-                    # Convert DataFrame to list of tuples for batch insertion
-                    data_to_insert = list(df.itertuples(index=False, name=None))
-
-                    # Execute batch insert
-                    cursor.executemany(insert_sql, data_to_insert)
-
-                    conn.commit()  # Commit the transaction to save changes
+                    # One transaction per sector
+                    with conn:
+                        self.write_batch(conn, df, sector)
 
                     total_lines += len(df)
                     extra_info = [f'{sector}: {len(df)}, {total_lines} lines']
                     system.print_info(i, extra_info, start_time, len(data_dict))
+            finally:
+                conn.close()
 
-                cursor.close()  # Close the cursor after all operations are complete
+            return db_path
 
         except Exception as e:
             system.log_error(f"Error saving transformed data to database: {e}")
 
-    def process_and_save(self, dict_filtered, batch_index=0):
+    def process_and_save(self, dict_filtered, batch_index=0, writer=None):
         """
         Process and save data for a batch of sectors.
 
         Args:
             batch_data (dict): Dictionary containing data for a batch of sectors.
+            writer (DatabaseWriter): Optional shared writer the results are queued for.
+
+        Returns:
+            bool: True if every sector was transformed and saved or queued.
         """
         # Apply mathematical transformations to the filtered data
         dict_transformed = self.mathmagic(dict_filtered, batch_index)
 
         # Save the transformed data to the database
-        self.save_to_db(dict_transformed)
+        saved = self.save_to_db(dict_transformed, writer)
+        return bool(saved) and len(dict_transformed) == len(dict_filtered)
 
     def main_thread(self, dict_filtered, dict_math):
         """
-        Run the math transformations using multiple threads.
+        Run the math transformations using multiple threads, one sector at a time from a shared queue.
+        The largest sectors are scheduled first so they do not end up running alone at the tail,
+        and one DatabaseWriter applies all saves so the threads never contend for the database file.
 
         Args:
             dict_filtered (dict): Dictionary containing filtered data to be processed.
+
+        Returns:
+            bool: True if every sector was transformed and written without failures.
         """
         try:
-            total_lines = sum(len(df) for df in dict_filtered.values())
-            batch_size = max(1, total_lines // settings.max_workers)
+            writer = db_writer.DatabaseWriter(label='Math writer')
+            work_scheduler = scheduler.WorkScheduler(label='Math scheduler')
+            work_scheduler.put_many(dict_filtered.keys(), priority=lambda sector: -len(dict_filtered[sector]))
+            try:
+                results = work_scheduler.run(lambda worker_number, sector: self.process_and_save({sector: dict_filtered[sector]}, worker_number, writer))
+            finally:
+                stats = writer.close()
 
-            with ThreadPoolExecutor(max_workers=settings.max_workers) as executor:
-                futures = []
-                for batch_index, start in enumerate(range(0, total_lines, batch_size)):
-                    end = min(start + batch_size, total_lines)
-                    batch_data = {k: dict_filtered[k] for k in list(dict_filtered.keys())[start:end]}
-                    futures.append(executor.submit(lambda data=batch_data: self.process_and_save(data, batch_index)))
-
-                for future in as_completed(futures):
-                    future.result()
+            return len(results) == len(dict_filtered) and all(results) and stats['failures'] == 0
 
         except Exception as e:
             system.log_error(f"Error during batch processing: {e}")
+            return False
+
+    def main_process(self, dict_filtered, dict_math):
+        """
+        Run the math transformations in a process pool, one sector per task, so the work is not bound to one core.
+        Sectors are submitted largest first to balance the workers by row count, frames travel packed as NumPy
+        arrays, and every result is written by one DatabaseWriter in this process.
+
+        Args:
+            dict_filtered (dict): Dictionary containing filtered data to be processed.
+
+        Returns:
+            bool: True if every sector was transformed and written without failures.
+        """
+        try:
+            db_path = self.get_db_path()
+            sectors = sorted(dict_filtered, key=lambda sector: len(dict_filtered[sector]), reverse=True)
+            transformed = 0
+
+            writer = db_writer.DatabaseWriter(label='Math writer')
+            try:
+                with ProcessPoolExecutor(max_workers=settings.math_processes) as executor:
+                    futures = [executor.submit(transform_sector, sector, pack_frame(dict_filtered[sector])) for sector in sectors]
+
+                    start_time = time.time()
+                    for i, future in enumerate(as_completed(futures)):
+                        sector, packed = future.result()
+                        if packed is None:
+                            system.log_error(f"Math transformation failed for sector {sector}")
+                            continue
+
+                        df = unpack_frame(packed)
+                        writer.submit(db_path, sector, df, self.write_batch)
+                        transformed += 1
+
+                        extra_info = [f'{len(df)} lines from {sector}']
+                        system.print_info(i, extra_info, start_time, len(sectors))
+            finally:
+                stats = writer.close()
+
+            return transformed == len(sectors) and stats['failures'] == 0
+
+        except Exception as e:
+            system.log_error(f"Error during process pool processing: {e}")
+            return False
 
     def main_sequential(self, dict_filtered, dict_math):
         """
@@ -550,31 +605,44 @@ class MathTransformation:
 
         Args:
             dict_filtered (dict): Dictionary containing filtered data to be processed.
+
+        Returns:
+            bool: True if every sector was transformed and saved.
         """
         try:
-            self.process_and_save(dict_filtered, dict_math)
+            return self.process_and_save(dict_filtered)
                              
         except Exception as e:
             # Log any errors encountered during the sequential processing
             system.log_error(f"Error during sequential processing: {e}")
+            return False
 
-    def main(self, thread=False):
+    def main(self, thread=False, process=False):
         """
-        Main function to run the math transformations either sequentially or using multiple threads.
+        Main function to run the math transformations sequentially, using multiple threads or a process pool.
 
         Args:
             thread (bool): Flag to determine whether to run in thread mode or sequential mode.
+            process (bool): Run the sectors in a process pool; takes precedence over thread.
         """
-        dict_statements = self.load_data(settings.statements_file)
+        # Only the company-years touched since the last run are loaded in incremental mode
+        marks = watermark.load_watermarks(settings.statements_file_math) if settings.math_incremental else None
+        dict_statements = self.load_data(settings.statements_file, marks)
         # dict_math = self.load_data(settings.statements_file_math)
         dict_math = {}
         dict_filtered = self.filter_new_entries(dict_statements, dict_math)
 
-        if thread:
-            self.main_thread(dict_filtered, dict_math)
+        if process:
+            saved = self.main_process(dict_filtered, dict_math)
+        elif thread:
+            saved = self.main_thread(dict_filtered, dict_math)
         else:
-            self.main_sequential(dict_filtered, dict_math)
+            saved = self.main_sequential(dict_filtered, dict_math)
+
+        # Move the watermarks forward only once the results are stored
+        if saved and marks is not None:
+            watermark.save_watermarks(settings.statements_file_math, self.load_marks)
 
 if __name__ == "__main__":
     transformer = MathTransformation()
-    transformer.main(thread=True)
+    transformer.main(process=True)
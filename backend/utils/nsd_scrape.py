@@ -6,8 +6,11 @@ from cachetools import cached, TTLCache
 import time
 import os
 import shutil
+import asyncio
 
 from utils import system, settings
+from utils import async_fetcher
+from utils import page_cache
 
 class NSDScraper:
     """
@@ -24,6 +27,8 @@ class NSDScraper:
         self.db_name = settings.db_name
         self.db_folder = settings.db_folder
         self.db_full_path = os.path.join(self.db_folder, self.db_name)
+        self.frontier_report = {}
+        self.page_cache = page_cache.PageCache()
 
     def get_max_nsd(self):
         """
@@ -64,31 +69,128 @@ class NSDScraper:
             # system.log_error(f"Error retrieving missing NSDs from database: {e}")
             return []
 
-    def generate_nsd_range(self):
+    def estimate_new_nsds(self, max_nsd, last_sent_date):
+        """
+        Estimate how many NSDs were published since the last one in the database.
+
+        Parameters:
+        max_nsd (int): The maximum NSD in the database.
+        last_sent_date (datetime): The sent date of that NSD, or None.
+
+        Returns:
+        int: The estimated number of new NSDs, including the safety factor.
+        """
+        # Calculate the daily submission estimate from the database
+        daily_submission_estimate = self.calculate_daily_submission_estimate()
+
+        # Calculate the date difference from today
+        days_elapsed = (datetime.now() - last_sent_date).days + 1 if last_sent_date else 1
+
+        # Calculate the number of new NSDs with a safety factor
+        estimated_new_nsds = int(daily_submission_estimate * days_elapsed * settings.safety_factor)
+        return estimated_new_nsds
+
+    def probe_nsd(self, nsd, probed_nsds):
+        """
+        Check whether a published document exists in the window of NSDs starting at nsd.
+
+        A window of consecutive NSDs is checked so that isolated unused numbers are not
+        mistaken for the end of the sequence.
+
+        Parameters:
+        nsd (int): The first NSD of the window.
+        probed_nsds (set): The NSDs requested so far, updated in place.
+
+        Returns:
+        bool: True if any NSD in the window holds a valid document.
+        """
+        for candidate in range(nsd, nsd + settings.nsd_frontier_window):
+            probed_nsds.add(candidate)
+            html = self.fetch_page(candidate)
+            if html and self.parse_nsd_data(html, candidate):
+                self.page_cache.put(page_cache.PageCache.nsd_key(candidate), html)
+                return True
+        return False
+
+    def find_nsd_frontier(self, max_nsd):
+        """
+        Find the last published NSD with galloping probes past max_nsd followed by a binary search.
+
+        Parameters:
+        max_nsd (int): The maximum NSD in the database, known to be published.
+
+        Returns:
+        tuple: The last published NSD and the number of distinct NSD pages requested to find it.
+               When documents go on past the largest galloping step, the NSD at that step is returned
+               and the cap is logged.
+        """
+        probed_nsds = set()
+
+        # Step 1: Gallop with doubling steps until a probe finds an empty window
+        lower = max_nsd
+        step = 1
+        while step <= settings.nsd_frontier_max_step and self.probe_nsd(max_nsd + step, probed_nsds):
+            lower = max_nsd + step
+            step *= 2
+        upper = max_nsd + step
+
+        # The gallop stopped at the largest step without probing upper: probe it before trusting it is empty
+        if step > settings.nsd_frontier_max_step and self.probe_nsd(upper, probed_nsds):
+            system.log_error(f"NSD frontier search capped at {upper}: documents go on past max_nsd + 2 * nsd_frontier_max_step")
+            return upper, len(probed_nsds)
+
+        # Step 2: Binary search between the last live probe and the first empty one
+        while upper - lower > 1:
+            middle = (lower + upper) // 2
+            if self.probe_nsd(middle, probed_nsds):
+                lower = middle
+            else:
+                upper = middle
+
+        # The window after lower is empty, so lower itself is the last published NSD
+        return lower, len(probed_nsds)
+
+    def generate_nsd_range(self, mode=None):
         """
         Generate the range of NSD values to scrape, including missing and new NSDs.
 
+        Parameters:
+        mode (str): 'frontier' probes for the last published NSD, 'estimate' uses the
+                    daily submission estimate with the safety factor. Defaults to settings.nsd_range_mode.
+
         Returns:
         list: A list of NSD values to scrape.
         """
+        mode = mode or settings.nsd_range_mode
         try:
             # Step 1: Get the maximum NSD and the sent date of the last NSD
             max_nsd, last_sent_date = self.get_last_nsd_and_date()
 
-            # Step 2: Calculate the daily submission estimate from the database
-            daily_submission_estimate = self.calculate_daily_submission_estimate()
-
-            # Step 3: Calculate the date difference from today
-            days_elapsed = (datetime.now() - last_sent_date).days + 1 if last_sent_date else 1
-
-            # Step 4: Calculate the number of new NSDs with a safety factor
-            estimated_new_nsds = int(daily_submission_estimate * days_elapsed * settings.safety_factor)
-
-            # Step 5: Generate the full range of NSDs to scrape
-            new_nsds = list(range(max_nsd + 1, max_nsd + estimated_new_nsds + 1))
+            # Step 2: Estimate the new NSDs as the old method would have queued them
+            estimated_new_nsds = self.estimate_new_nsds(max_nsd, last_sent_date)
+
+            # Step 3: Find the last NSD to scrape
+            if mode == 'frontier':
+                frontier, probe_requests = self.find_nsd_frontier(max_nsd)
+                new_nsds = list(range(max_nsd + 1, frontier + 1))
+
+                # Report the requests made against the estimate; negative when the probes cost more than they saved
+                requests_made = probe_requests + len(new_nsds)
+                self.frontier_report = {
+                    'frontier': frontier,
+                    'probe_requests': probe_requests,
+                    'estimated_requests': estimated_new_nsds,
+                    'saved_requests': estimated_new_nsds - requests_made,
+                }
+                print(f"NSD frontier {frontier}: {len(new_nsds)} new NSDs, {probe_requests} probes, "
+                      f"{requests_made} requests against the estimate of {estimated_new_nsds} "
+                      f"({estimated_new_nsds - requests_made:+d} saved)")
+            else:
+                new_nsds = list(range(max_nsd + 1, max_nsd + estimated_new_nsds + 1))
+
+            # Step 4: Generate the full range of NSDs to scrape
             missing_nsds = self.get_missing_nsds()
             nsd_range = new_nsds + missing_nsds
-            nsd_range = new_nsds + missing_nsds
 
             return nsd_range
         except Exception as e:
@@ -151,10 +253,34 @@ class NSDScraper:
             # system.log_error(f"Error retrieving last NSD and date from database: {e}")
             return 0, None
 
+    def get_nsd_url(self, nsd):
+        """
+        Build the URL of an NSD page.
+
+        Parameters:
+        nsd (int): The NSD value.
+
+        Returns:
+        str: The URL of the NSD page.
+        """
+        return settings.nsd_url.format(nsd=nsd)
+
+    def get_cached_page(self, nsd):
+        """
+        Return an NSD page from the on-disk page cache.
+
+        Parameters:
+        nsd (int): The NSD value.
+
+        Returns:
+        str: The cached HTML content, or None on a miss.
+        """
+        return self.page_cache.get(page_cache.PageCache.nsd_key(nsd))
+
     @cached(cache)
     def fetch_page(self, nsd):
         """
-        Fetch the HTML content of an NSD page
+        Fetch the HTML content of an NSD page, reading the on-disk page cache first
 
         Parameters:
         nsd (int): The NSD value to fetch.
@@ -163,7 +289,11 @@ class NSDScraper:
         str: The HTML content of the NSD page.
         """
         try:
-            url = f"https://www.rad.cvm.gov.br/ENET/frmGerenciaPaginaFRE.aspx?NumeroSequencialDocumento={nsd}&CodigoTipoInstituicao=1"
+            html = self.get_cached_page(nsd)
+            if html:
+                return html
+
+            url = self.get_nsd_url(nsd)
             headers = system.header_random()  # Use the random headers from the system module
             response = requests.get(url, headers=headers)
             response.raise_for_status()
@@ -251,8 +381,7 @@ class NSDScraper:
             # Backup the existing database before saving new data
             backup_name = f"{os.path.splitext(self.db_name)[0]} {settings.backup_name}.db"
             backup_path = os.path.join(self.db_folder, backup_name)
-            if os.path.exists(self.db_full_path):
-                shutil.copy2(self.db_full_path, backup_path)
+            system.db_backup(self.db_full_path, backup_path)
 
             with sqlite3.connect(self.db_full_path) as conn:
                 cursor = conn.cursor()
@@ -303,51 +432,155 @@ class NSDScraper:
         except Exception as e:
             system.log_error(f"Error saving data to database: {e}")
 
-    def scrape_nsd(self):
+    def collect_nsd_page(self, nsd, html, nsd_data):
         """
-        The main method to scrape NSD data, parse it, and save it to the database.
+        Parse a fetched NSD page and append the result to the pending batch.
+
+        Parameters:
+        nsd (int): The NSD value of the page.
+        html (str): The HTML content of the page, or None if it could not be fetched.
+        nsd_data (list): The pending batch of parsed NSD data.
+
+        Returns:
+        list: Extra information for progress reporting.
         """
+        extra_info = [nsd]
+        if html:
+            data = self.parse_nsd_data(html, nsd)
+            if data:
+                # Prepare extra information for progress reporting
+                extra_info = [nsd, data['sent_date'], data['quarter'].strftime("%Y-%m-%d"), data['nsd_type'], data['company_name']]
+                nsd_data.append(data)
+
+                # Only published documents are kept on disk, empty pages past the frontier may fill in later
+                self.page_cache.put(page_cache.PageCache.nsd_key(nsd), html)
+
+        return extra_info
+
+    def periodic_save(self, i, total_nsds, nsd_data, limit_counter):
+        """
+        Save the pending batch on the regressive batch boundary and detect the end of the published NSDs.
+
+        Parameters:
+        i (int): The index of the current NSD in the range.
+        total_nsds (int): The size of the NSD range.
+        nsd_data (list): The pending batch of parsed NSD data, cleared after saving.
+        limit_counter (int): The number of consecutive empty batches so far.
+
+        Returns:
+        tuple: The updated limit_counter and True if scraping should stop.
+        """
+        # Regressive periodic save
+        if (total_nsds - i - 1) % (settings.batch_size // 1) == 0:
+            if nsd_data:
+                self.save_to_db(nsd_data)
+                nsd_data.clear()
+                limit_counter = 0
+            else:
+                limit_counter += 1
+                # Two empty batches in a row mean we are past the last published NSD
+                if limit_counter >= 2:
+                    return limit_counter, True
+
+        return limit_counter, False
+
+    def scrape_nsd_sequential(self, nsd_range):
+        """
+        Fetch, parse and save the NSD range one request at a time.
+
+        Parameters:
+        nsd_range (list): The NSD values to scrape.
+
+        Returns:
+        list: The NSD range.
+        """
+        nsd_data = []
+        total_nsds = len(nsd_range)
+        limit_counter = 0
+
+        start_time = time.time()
+        for i, nsd in enumerate(nsd_range):
+            try:
+                html = self.fetch_page(nsd)
+                extra_info = self.collect_nsd_page(nsd, html, nsd_data)
+
+                # Print progress information
+                system.print_info(i, extra_info, start_time, total_nsds)
+
+                limit_counter, stop = self.periodic_save(i, total_nsds, nsd_data, limit_counter)
+                if stop:
+                    return nsd_range  # Interrupts the function so it does not go to infinity
+
+            except Exception as e:
+                system.log_error(f"Error processing NSD {nsd}: {e}")
+
+        system.db_optimize(self.db_name)
+        return nsd_range
+
+    async def scrape_nsd_async(self, nsd_range):
+        """
+        Fetch the NSD range concurrently and stream the pages, in NSD order, into parsing and saving.
+
+        Parameters:
+        nsd_range (list): The NSD values to scrape.
+
+        Returns:
+        list: The NSD range.
+        """
+        nsd_data = []
+        total_nsds = len(nsd_range)
+        limit_counter = 0
+
+        fetcher = async_fetcher.AsyncPageFetcher()
+        stream = fetcher.fetch_ordered(nsd_range, self.get_nsd_url, cached_page=self.get_cached_page)
+
         try:
-            nsd_range = self.generate_nsd_range()
-            nsd_data = []
-            total_nsds = len(nsd_range)
+            i = -1
             start_time = time.time()
-            limit_counter = 0
-
-            for i, nsd in enumerate(nsd_range):
+            async for nsd, html in stream:
+                i += 1
                 try:
-                    html = self.fetch_page(nsd)
-                    if html:
-                        data = self.parse_nsd_data(html, nsd)
-                        if not data:
-                            extra_info = [nsd]
-                        else:
-                        # Prepare extra information for progress reporting
-                            extra_info = [nsd, data['sent_date'], data['quarter'].strftime("%Y-%m-%d"), data['nsd_type'], data['company_name']]
-
-                            nsd_data.append(data)
+                    extra_info = self.collect_nsd_page(nsd, html, nsd_data)
 
                     # Print progress information
                     system.print_info(i, extra_info, start_time, total_nsds)
 
-                    # Regressive periodic save
-                    if (total_nsds - i - 1) % (settings.batch_size // 1) == 0:
-                        if nsd_data:
-                            nsd_data = self.save_to_db(nsd_data)
-                            nsd_data.clear()
-                            limit_counter = 0
-                        else:
-                            limit_counter += 1
-                            # Check if the counter has reached 5
-                            if limit_counter >= 2:
-                                nsd_data = self.save_to_db(nsd_data)
-                                return nsd_range # Interrupts the function so it does not go to infinity
+                    limit_counter, stop = self.periodic_save(i, total_nsds, nsd_data, limit_counter)
+                    if stop:
+                        return nsd_range  # Interrupts the function so it does not go to infinity
 
                 except Exception as e:
                     system.log_error(f"Error processing NSD {nsd}: {e}")
-            system.db_optimize(self.db_name)
+        finally:
+            # Cancel the requests still in flight
+            await stream.aclose()
+
+        system.db_optimize(self.db_name)
+        return nsd_range
+
+    def scrape_nsd(self, concurrent=None):
+        """
+        The main method to scrape NSD data, parse it, and save it to the database.
+
+        Parameters:
+        concurrent (bool): Fetch the pages with the asyncio engine instead of one request at a time.
+                           Defaults to settings.nsd_concurrent.
+
+        Returns:
+        list: The NSD range that was scraped.
+        """
+        concurrent = settings.nsd_concurrent if concurrent is None else concurrent
+        try:
+            nsd_range = self.generate_nsd_range()
+
+            if concurrent:
+                nsd_range = asyncio.run(self.scrape_nsd_async(nsd_range))
+            else:
+                nsd_range = self.scrape_nsd_sequential(nsd_range)
+
+            self.page_cache.print_stats('NSD page cache')
             return nsd_range
-        
+
         except Exception as e:
             system.log_error(f"Error in scrape_nsd: {e}")
 
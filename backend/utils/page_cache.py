@@ -0,0 +1,288 @@
+import os
+import time
+import zlib
+import hashlib
+import sqlite3
+import threading
+
+from utils import system
+from utils import settings
+
+
+class PageCache:
+    """
+    A persistent, size-bounded store of fetched HTML pages kept in an SQLite file.
+
+    Pages are stored compressed with a content hash, evicted by TTL and least recent use,
+    and survive process restarts so reruns can reparse pages without hitting CVM again.
+    """
+
+    def __init__(self, max_bytes=None, ttl=None):
+        """
+        Initialize the cache and create its table if needed.
+
+        Parameters:
+        - max_bytes (int): Maximum compressed size of all pages. Defaults to settings.page_cache_max_bytes.
+        - ttl (float): Seconds a page stays valid. Defaults to settings.page_cache_ttl; None disables expiry.
+        """
+        self.db_path = os.path.join(settings.db_folder, f"{settings.db_name.split('.')[0]} {settings.pages_file}.db")
+        self.max_bytes = max_bytes or settings.page_cache_max_bytes
+        self.ttl = ttl if ttl is not None else settings.page_cache_ttl
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.lock = threading.Lock()
+
+        try:
+            os.makedirs(settings.db_folder, exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    key TEXT PRIMARY KEY,
+                    content BLOB,
+                    content_hash TEXT,
+                    size INTEGER,
+                    created_at REAL,
+                    accessed_at REAL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+            self.conn.commit()
+        except sqlite3.Error as e:
+            system.log_error(f"Error opening page cache {self.db_path}: {e}")
+            self.conn = None
+
+    @staticmethod
+    def nsd_key(nsd):
+        """
+        Build the cache key of an NSD page.
+
+        Parameters:
+        - nsd (int): The NSD value.
+
+        Returns:
+        str: The cache key.
+        """
+        return f"nsd:{nsd}"
+
+    @staticmethod
+    def frame_key(nsd, group, frame):
+        """
+        Build the cache key of a statement frame page.
+
+        Parameters:
+        - nsd (int): The NSD value.
+        - group (str): The statement group, for example 'DFs Consolidadas'.
+        - frame (str): The statement frame, for example 'Demonstração do Resultado'.
+
+        Returns:
+        str: The cache key.
+        """
+        return f"frame:{nsd}:{group}:{frame}"
+
+    def get(self, key):
+        """
+        Return a cached page, or None on a miss, an expired entry or a hash mismatch.
+
+        Parameters:
+        - key (str): The cache key.
+
+        Returns:
+        str: The HTML content, or None.
+        """
+        if self.conn is None:
+            self.misses += 1
+            return None
+
+        try:
+            with self.lock:
+                row = self.conn.execute("SELECT content, content_hash, created_at FROM pages WHERE key = ?", (key,)).fetchone()
+                now = time.time()
+
+                if row is not None:
+                    content, content_hash, created_at = row
+                    html = zlib.decompress(content).decode('utf-8')
+
+                    # Expired or corrupted entries count as misses and are dropped
+                    is_expired = self.ttl is not None and now - created_at > self.ttl
+                    is_corrupted = hashlib.sha256(html.encode('utf-8')).hexdigest() != content_hash
+                    if not is_expired and not is_corrupted:
+                        self.conn.execute("UPDATE pages SET accessed_at = ? WHERE key = ?", (now, key))
+                        self.conn.commit()
+                        self.hits += 1
+                        return html
+
+                    self.conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+                    self.conn.commit()
+
+                self.misses += 1
+                return None
+
+        except (sqlite3.Error, zlib.error, UnicodeDecodeError) as e:
+            system.log_error(f"Error reading page {key} from cache: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, key, html):
+        """
+        Store a page, replacing any previous content under the same key.
+
+        Parameters:
+        - key (str): The cache key.
+        - html (str): The HTML content.
+
+        Returns:
+        str: The content hash of the stored page.
+        """
+        if self.conn is None or not html:
+            return None
+
+        try:
+            content_hash = hashlib.sha256(html.encode('utf-8')).hexdigest()
+            content = zlib.compress(html.encode('utf-8'))
+            now = time.time()
+
+            with self.lock:
+                self.conn.execute("""
+                    INSERT INTO pages (key, content, content_hash, size, created_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                    content=excluded.content,
+                    content_hash=excluded.content_hash,
+                    size=excluded.size,
+                    created_at=excluded.created_at,
+                    accessed_at=excluded.accessed_at
+                """, (key, content, content_hash, len(content), now, now))
+                self.conn.commit()
+                self.puts += 1
+
+                # Check the size bound every few writes instead of on each one
+                if self.puts % settings.page_cache_evict_every == 0:
+                    self.evict()
+
+            return content_hash
+
+        except sqlite3.Error as e:
+            system.log_error(f"Error writing page {key} to cache: {e}")
+            return None
+
+    def count_present(self, keys):
+        """
+        Count how many of the given keys are stored, without reading the pages.
+
+        Parameters:
+        - keys (list): The cache keys.
+
+        Returns:
+        int: The number of keys present.
+        """
+        if self.conn is None or not keys:
+            return 0
+
+        placeholders = ', '.join('?' for _ in keys)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM pages WHERE key IN ({placeholders})", list(keys)).fetchone()[0]
+
+    def keys(self, prefix='', limit=None):
+        """
+        List the stored keys that start with a prefix.
+
+        Parameters:
+        - prefix (str): The key prefix, for example 'frame:'.
+        - limit (int): Maximum number of keys to return. None returns all.
+
+        Returns:
+        list: The matching keys, most recently used first.
+        """
+        if self.conn is None:
+            return []
+
+        query = "SELECT key FROM pages WHERE substr(key, 1, ?) = ? ORDER BY accessed_at DESC"
+        params = [len(prefix), prefix]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self.lock:
+            return [row[0] for row in self.conn.execute(query, params).fetchall()]
+
+    def evict(self):
+        """
+        Drop expired pages, then the least recently used ones until the store fits in max_bytes.
+        Must be called with the lock held.
+
+        Returns:
+        int: The number of pages evicted.
+        """
+        evicted = 0
+
+        # Step 1: Drop expired pages
+        if self.ttl is not None:
+            cursor = self.conn.execute("DELETE FROM pages WHERE created_at < ?", (time.time() - self.ttl,))
+            evicted += cursor.rowcount
+
+        # Step 2: Drop least recently used pages until the size bound holds
+        total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        while total_bytes > self.max_bytes:
+            rows = self.conn.execute("SELECT key, size FROM pages ORDER BY accessed_at LIMIT 100").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+                total_bytes -= size
+                evicted += 1
+                if total_bytes <= self.max_bytes:
+                    break
+
+        self.conn.commit()
+        return evicted
+
+    def stats(self):
+        """
+        Report hit/miss statistics and the current size of the store.
+
+        Returns:
+        dict: hits, misses, hit_rate, pages and bytes.
+        """
+        pages, total_bytes = 0, 0
+        if self.conn is not None:
+            with self.lock:
+                pages, total_bytes = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'pages': pages,
+            'bytes': total_bytes,
+        }
+
+    def print_stats(self, label='Page cache'):
+        """
+        Print the hit/miss statistics.
+
+        Parameters:
+        - label (str): A prefix for the printed line.
+
+        Returns:
+        dict: The statistics that were printed.
+        """
+        stats = self.stats()
+        print(f"{label}: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.2%}), "
+              f"{stats['pages']} pages, {stats['bytes'] / 1024 / 1024:.1f} MB")
+        return stats
+
+    def close(self):
+        """
+        Close the underlying connection.
+
+        Returns:
+        bool: True once closed.
+        """
+        if self.conn is not None:
+            with self.lock:
+                self.conn.close()
+                self.conn = None
+        return True
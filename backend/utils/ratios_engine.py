@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+from utils import formula_compiler
+from utils import rolling_indicators
+
+
+class RatiosEngine:
+    """
+    The accounts of a sector laid out once as a dense matrix, one row per company, type and quarter and one
+    column per account the indicators read, and every indicator list computed against it.
+
+    Rows are mapped to their entity and account through integer codes, categorical codes when the frame is
+    encoded, and the values are summed into the matrix with a single bincount, so no pivot_table or merge runs.
+    Entities are ordered like the pivot_table they replace, by company, type and quarter, and the metadata of
+    each entity is taken from its first row, like drop_duplicates(keep='first'), so the indicator rows come out
+    identical to adding each list on its own pivot.
+    """
+
+    keys = ['company_name', 'type', 'quarter']
+    metadata_columns = ['nsd', 'sector', 'subsector', 'segment', 'version']
+    output_columns = ['nsd', 'sector', 'subsector', 'segment', 'company_name', 'quarter',
+                      'version', 'type', 'frame', 'account', 'description', 'value']
+
+    def __init__(self, df, sections):
+        """
+        Build the account matrix.
+
+        Parameters:
+        - df (DataFrame): One sector's statements, after FinancialRatios.adjust_dfs_types.
+        - sections (dict): Indicator lists keyed by the name of the 'frame' of their rows.
+        """
+        self.df = df
+        self.dag = formula_compiler.compile_indicators(sections)
+
+        # Step 1: Number the entities, rows with a missing key belong to none
+        entity = np.zeros(len(df), dtype=np.int64)
+        valid = np.ones(len(df), dtype=bool)
+        for column in self.keys:
+            codes, uniques = self.factorize(df[column])
+            entity = entity * max(len(uniques), 1) + codes
+            valid &= codes >= 0
+
+        rows = np.flatnonzero(valid)
+        entities, first, inverse = np.unique(entity[rows], return_index=True, return_inverse=True)
+        self.first = rows[first]  # First row of each entity, in key order
+        self.rows = len(entities)
+
+        # Step 2: Number the accounts the indicators read, among those the entities have
+        codes, uniques = self.factorize(df['account'])
+        codes = codes[rows]
+        present = np.zeros(len(uniques), dtype=bool)
+        present[codes[codes >= 0]] = True
+
+        column_of = np.full(len(uniques), -1, dtype=np.int64)
+        positions = pd.Index(uniques).get_indexer(self.dag.accounts())
+        positions = positions[positions >= 0]
+        positions = positions[present[positions]]
+        column_of[positions] = np.arange(len(positions))
+        self.accounts = [uniques[position] for position in positions]
+
+        # Step 3: Sum the values of every entity and account into the matrix, missing ones as 0
+        columns = np.where(codes >= 0, column_of[codes], -1)
+        kept = columns >= 0
+        values = pd.to_numeric(df['value'], errors='coerce').to_numpy(dtype=float)[rows[kept]]
+        values = np.where(np.isnan(values), 0.0, values)
+        cells = inverse.ravel()[kept] * len(self.accounts) + columns[kept]
+        self.matrix = np.bincount(cells, weights=values, minlength=self.rows * len(self.accounts)).reshape(self.rows, len(self.accounts))
+
+    @staticmethod
+    def factorize(values):
+        """
+        Return the integer code of every value and the distinct values, sorted like a groupby would sort them.
+
+        Parameters:
+        - values (Series): The column.
+
+        Returns:
+        tuple: (codes, uniques) with -1 as the code of missing values.
+        """
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return values.cat.codes.to_numpy(dtype=np.int64), values.cat.categories
+        codes, uniques = pd.factorize(values, sort=True)
+        return codes.astype(np.int64), uniques
+
+    @staticmethod
+    def repeat_labels(labels, rows):
+        """
+        Repeat every label for a block of rows, as a categorical so the labels are not copied per row.
+
+        Parameters:
+        - labels (list): One label per block.
+        - rows (int): The rows per block.
+
+        Returns:
+        Categorical: The labels of every row.
+        """
+        codes, uniques = pd.factorize(pd.Series(labels, dtype=object))
+        return pd.Categorical.from_codes(np.repeat(codes, rows), categories=uniques)
+
+    def columns(self):
+        """
+        Return the matrix as one column per account.
+
+        Returns:
+        dict: The values of each account, views of the matrix.
+        """
+        return {account: self.matrix[:, j] for j, account in enumerate(self.accounts)}
+
+    def windows(self):
+        """
+        Index the quarters of the matrix rows for the window formulas, one series per company and type.
+
+        Returns:
+        rolling_indicators.QuarterWindows: The index.
+        """
+        return rolling_indicators.QuarterWindows.from_frame(self.df.iloc[self.first], ['company_name', 'type'])
+
+    def evaluate(self):
+        """
+        Compute every indicator against the matrix.
+
+        Returns:
+        tuple: (values, missing) as returned by FormulaDag.evaluate, one row per entity and one column per indicator.
+        """
+        return self.dag.evaluate(self.columns(), rows=self.rows, windows=self.windows())
+
+    def entities(self):
+        """
+        Return the keys and metadata of every entity, taken from its first row.
+
+        Returns:
+        DataFrame: One row per entity, in matrix order.
+        """
+        return self.df.iloc[self.first][self.keys + self.metadata_columns].reset_index(drop=True)
+
+    def indicator_rows(self, values):
+        """
+        Lay the indicator values out as statement rows, one block of entities per indicator.
+
+        Parameters:
+        - values (ndarray): The indicator values, as returned by evaluate.
+
+        Returns:
+        DataFrame: The new rows, with the columns of the statements.
+        """
+        outputs = self.dag.outputs
+        base = self.entities()
+        new_rows_df = base.iloc[np.tile(np.arange(self.rows), len(outputs))].reset_index(drop=True)
+        for column in ['frame', 'account', 'description']:
+            new_rows_df[column] = self.repeat_labels([output[column] for output in outputs], self.rows)
+        new_rows_df['value'] = values.T.ravel()  # Indicator by indicator, like the blocks
+        return new_rows_df[self.output_columns]
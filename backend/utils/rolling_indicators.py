@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+
+window_functions = ['sum', 'mean', 'growth']
+
+def quarter_number(quarters):
+    """
+    Number the quarters consecutively, so the quarter before 2021-03-31 is 2020-12-31 whatever the day.
+
+    Parameters:
+    - quarters (array): The quarter dates.
+
+    Returns:
+    ndarray: year * 4 + quarter of the year, counted from 0, or -1 for missing dates.
+    """
+    quarters = pd.DatetimeIndex(pd.to_datetime(pd.Series(quarters), errors='coerce'))
+    number = quarters.year.to_numpy() * 4 + (quarters.month.to_numpy() - 1) // 3
+    return np.where(quarters.isna(), -1, number).astype(np.int64)
+
+def window_span(function, periods):
+    """
+    Return how many quarters before the current one a window reads.
+
+    Parameters:
+    - function (str): 'sum', 'mean' or 'growth'.
+    - periods (int): The window length.
+
+    Returns:
+    int: The quarters looked back.
+    """
+    return int(periods) if function == 'growth' else int(periods) - 1
+
+class QuarterWindows:
+    """
+    The quarters of a set of series, such as the rows of the ratios matrix, one series per company and type.
+
+    The quarterly values are de-cumulated by MathTransformation, so the trailing twelve months of a flow account
+    are the sum of its last four quarters. Rows are keyed by series and quarter number, and the row holding the
+    same series some quarters earlier is found for every row at once with one binary search, so windows are
+    computed for whole matrices, every account at once, without grouping. A window over a missing quarter is
+    NaN rather than spanning the gap.
+    """
+
+    def __init__(self, groups, quarters):
+        """
+        Index the rows.
+
+        Parameters:
+        - groups (ndarray): The series of every row, as integer codes.
+        - quarters (array): The quarter date of every row; each series has a quarter once.
+        """
+        self.number = quarter_number(quarters)
+        self.groups = np.asarray(groups, dtype=np.int64)
+        self.stride = int(self.number.max()) + 1 if len(self.number) else 1
+
+        key = self.groups * self.stride + self.number
+        key = np.where(self.number >= 0, key, -1 - np.arange(len(key)))  # Rows without a quarter match nothing
+        self.order = np.argsort(key, kind='stable')
+        self.sorted_keys = key[self.order]
+        self.key = key
+        self.lags = {}  # Row of each row some quarters earlier, per lag
+
+    @classmethod
+    def from_frame(cls, df, keys=['company_name', 'type']):
+        """
+        Index the rows of a frame with one row per series and quarter, such as the pivoted accounts.
+
+        Parameters:
+        - df (DataFrame): The frame, with the keys and 'quarter' columns.
+        - keys (list): The columns identifying a series.
+
+        Returns:
+        QuarterWindows: The index.
+        """
+        groups = df.groupby(keys, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+        return cls(groups, df['quarter'])
+
+    def lag(self, periods):
+        """
+        Find the row holding the same series a number of quarters earlier.
+
+        Parameters:
+        - periods (int): The quarters back.
+
+        Returns:
+        ndarray: The row of every row, or -1 where the series has no such quarter.
+        """
+        if periods not in self.lags:
+            if not len(self.key):
+                return np.array([], dtype=np.int64)
+            target = self.key - periods
+            position = np.minimum(np.searchsorted(self.sorted_keys, target), len(self.sorted_keys) - 1)
+            found = (self.sorted_keys[position] == target) & (self.number - periods >= 0)
+            self.lags[periods] = np.where(found, self.order[position], -1)
+        return self.lags[periods]
+
+    def shift(self, values, periods):
+        """
+        Return the values of the same series a number of quarters earlier.
+
+        Parameters:
+        - values (ndarray): One value per row, or one row of values per row.
+        - periods (int): The quarters back.
+
+        Returns:
+        ndarray: The earlier values, NaN where the series has no such quarter.
+        """
+        rows = self.lag(periods)
+        shifted = np.full(np.shape(values), np.nan)
+        shifted[rows >= 0] = np.asarray(values, dtype=float)[rows[rows >= 0]]
+        return shifted
+
+    def apply(self, function, periods, values):
+        """
+        Compute a window over the quarters of every series.
+
+        Parameters:
+        - function (str): 'sum' of the last periods quarters, such as trailing twelve months with 4, their 'mean',
+                          or the 'growth' over the value periods quarters earlier, such as year over year with 4.
+        - periods (int): The window length in quarters.
+        - values (ndarray): One value per row, or one row of values per row.
+
+        Returns:
+        ndarray: The window of every row, NaN where a quarter it reads is missing.
+        """
+        values = np.asarray(values, dtype=float)
+        if function in ('sum', 'mean'):
+            total = values.copy()
+            for lag in range(1, int(periods)):
+                total += self.shift(values, lag)
+            return total / int(periods) if function == 'mean' else total
+
+        if function == 'growth':
+            # Change over the absolute earlier value, so a loss turning into a profit grows
+            earlier = self.shift(values, int(periods))
+            result = np.full(values.shape, np.nan)
+            valid = (earlier != 0) & ~np.isnan(earlier)
+            result[valid] = (values[valid] - earlier[valid]) / np.abs(earlier[valid])
+            return result
+
+        raise ValueError(f"Unknown window function: {function}")
@@ -0,0 +1,182 @@
+import time
+import queue
+import itertools
+import threading
+
+from utils import system
+from utils import settings
+
+
+class WorkScheduler:
+    """
+    Feeds individual work items from a shared priority queue to a fixed number of worker threads.
+
+    Each worker takes the next item as soon as it is free, so a few expensive items no longer hold up a
+    whole slice of work. Lower priorities run first; items with equal priority keep their insertion order.
+    """
+
+    def __init__(self, workers=None, label='Scheduler'):
+        """
+        Initialize the scheduler.
+
+        Parameters:
+        - workers (int): Number of worker threads. Defaults to settings.max_workers.
+        - label (str): A prefix for the printed report.
+        """
+        self.workers = workers or settings.max_workers
+        self.label = label
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.busy_time = {}
+        self.items_done = {}
+        self.depth_samples = []
+        self.elapsed = 0.0
+
+    def put(self, item, priority=0):
+        """
+        Add a work item.
+
+        Parameters:
+        - item: The work item.
+        - priority (float): Lower values run first.
+
+        Returns:
+        int: The queue depth after the insertion.
+        """
+        self.queue.put((priority, next(self.sequence), item))
+        return self.queue.qsize()
+
+    def put_many(self, items, priority=None):
+        """
+        Add several work items.
+
+        Parameters:
+        - items (iterable): The work items.
+        - priority (callable): Returns the priority of one item. None keeps the insertion order.
+
+        Returns:
+        int: The queue depth after the insertions.
+        """
+        for item in items:
+            self.put(item, priority(item) if priority else 0)
+        return self.queue.qsize()
+
+    def get(self):
+        """
+        Take the next work item, recording the queue depth.
+
+        Returns:
+        The next work item, or None once the queue is empty.
+        """
+        try:
+            _, _, item = self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+        with self.lock:
+            self.depth_samples.append(self.queue.qsize())
+        return item
+
+    def run_worker(self, worker_number, process, setup, teardown, results):
+        """
+        Take items until the queue is empty, timing the busy part of each one.
+
+        Parameters:
+        - worker_number (int): The worker number.
+        - process (callable): process(context, item), called for each item.
+        - setup (callable): setup(worker_number), returns the worker context. None uses the worker number.
+        - teardown (callable): teardown(context), called once the worker stops.
+        - results (list): Receives the return values of process.
+
+        Returns:
+        int: The number of items this worker processed.
+        """
+        busy_time = 0.0
+        items_done = 0
+        context = setup(worker_number) if setup else worker_number
+
+        try:
+            while True:
+                item = self.get()
+                if item is None:
+                    break
+
+                start_time = time.perf_counter()
+                try:
+                    result = process(context, item)
+                    with self.lock:
+                        results.append(result)
+                except Exception as e:
+                    system.log_error(f"Error in {self.label} worker {worker_number}: {e}")
+                busy_time += time.perf_counter() - start_time
+                items_done += 1
+
+        finally:
+            if teardown:
+                teardown(context)
+            with self.lock:
+                self.busy_time[worker_number] = busy_time
+                self.items_done[worker_number] = items_done
+
+        return items_done
+
+    def run(self, process, setup=None, teardown=None):
+        """
+        Process every queued item with the worker threads and print a utilization report.
+
+        Parameters:
+        - process (callable): process(context, item), called for each item.
+        - setup (callable): setup(worker_number), returns the context passed to process.
+        - teardown (callable): teardown(context), called once per worker when it stops.
+
+        Returns:
+        list: The return values of process, in completion order.
+        """
+        results = []
+        start_time = time.perf_counter()
+
+        threads = [
+            threading.Thread(target=self.run_worker, args=(worker_number, process, setup, teardown, results), daemon=True)
+            for worker_number in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.elapsed = time.perf_counter() - start_time
+        self.print_stats()
+        return results
+
+    def stats(self):
+        """
+        Report per-worker utilization and the queue depth seen by the workers.
+
+        Returns:
+        dict: elapsed seconds, items, per-worker utilization and items, and the maximum and mean queue depth.
+        """
+        with self.lock:
+            depths = list(self.depth_samples)
+            utilization = {worker: busy / self.elapsed if self.elapsed else 0.0 for worker, busy in sorted(self.busy_time.items())}
+            return {
+                'elapsed': self.elapsed,
+                'items': sum(self.items_done.values()),
+                'utilization': utilization,
+                'items_per_worker': dict(sorted(self.items_done.items())),
+                'max_depth': max(depths) if depths else 0,
+                'mean_depth': sum(depths) / len(depths) if depths else 0.0,
+            }
+
+    def print_stats(self):
+        """
+        Print the utilization report.
+
+        Returns:
+        dict: The statistics that were printed.
+        """
+        stats = self.stats()
+        utilization = ', '.join(f"{worker}: {value:.0%}" for worker, value in stats['utilization'].items())
+        print(f"{self.label}: {stats['items']} items in {stats['elapsed']:.1f}s, "
+              f"queue depth max {stats['max_depth']} mean {stats['mean_depth']:.1f}, utilization {utilization}")
+        return stats
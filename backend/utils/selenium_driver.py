@@ -1,5 +1,7 @@
 import os
 import re
+import queue
+import threading
 import requests
 import subprocess
 import zipfile
@@ -138,12 +140,13 @@ def get_chromedriver_path():
         system.log_error(str(e))
         return None
 
-def load_driver(chromedriver_path):
+def load_driver(chromedriver_path, headless=False):
     """
     Initialize and return the Selenium WebDriver and WebDriverWait instances.
 
     Args:
         chromedriver_path (str): The path to the ChromeDriver executable.
+        headless (bool): Run Chrome without a window.
 
     Returns:
         tuple: A tuple containing the WebDriver and WebDriverWait instances.
@@ -162,7 +165,8 @@ def load_driver(chromedriver_path):
         chrome_options.add_argument('--log-level=3')
         chrome_options.add_argument('--ignore-ssl-errors')
         chrome_options.add_argument('--disable-infobars')
-        # chrome_options.add_argument('--headless')
+        if headless:
+            chrome_options.add_argument('--headless=new')
 
         driver = webdriver.Chrome(service=chrome_service, options=chrome_options)
         exceptions_ignore = (NoSuchElementException, StaleElementReferenceException)
@@ -174,21 +178,24 @@ def load_driver(chromedriver_path):
         system.log_error(load_driver_error_msg.format(e=e))
         return None, None
 
-def initialize_driver():
+def initialize_driver(headless=False):
     """
     Obtain the Selenium WebDriver and WebDriverWait instances.
 
     This function either uses a predefined path to ChromeDriver or fetches and loads it dynamically.
 
+    Args:
+        headless (bool): Run Chrome without a window.
+
     Returns:
         tuple: A tuple containing the WebDriver and WebDriverWait instances.
     """
-    hardcoded_chromedriver_path = r'D:\\Fausto Stangler\\Documentos\\Python\\FLY\\backend\\bin\\chromedriver-win64\\chromedriver.exe'
+    hardcoded_chromedriver_path = settings.hardcoded_chromedriver_path
     initialize_driver_error_msg = 'Failed to load driver from hardcoded path.'
     dynamic_driver_error_msg = 'Failed to obtain ChromeDriver path dynamically.'
 
     try:
-        driver, driver_wait = load_driver(hardcoded_chromedriver_path)
+        driver, driver_wait = load_driver(hardcoded_chromedriver_path, headless)
         if driver is not None:
             return driver, driver_wait
         else:
@@ -200,12 +207,189 @@ def initialize_driver():
             if not chromedriver_path:
                 raise Exception(dynamic_driver_error_msg)
 
-            driver, driver_wait = load_driver(chromedriver_path)
+            driver, driver_wait = load_driver(chromedriver_path, headless)
             return driver, driver_wait
 
         except Exception as dynamic_error:
             system.log_error(str(dynamic_error))
             return None, None
 
+def resolve_chromedriver_path():
+    """
+    Find the ChromeDriver executable once: the hardcoded path if it exists, otherwise a downloaded one.
+
+    Returns:
+        str: The path to the ChromeDriver executable, or None if none could be obtained.
+    """
+    if os.path.exists(settings.hardcoded_chromedriver_path):
+        return settings.hardcoded_chromedriver_path
+    return get_chromedriver_path()
+
+def is_driver_healthy(driver):
+    """
+    Check that a WebDriver session still answers.
+
+    Args:
+        driver (webdriver.Chrome): The WebDriver to check.
+
+    Returns:
+        bool: True if the browser responds to a command.
+    """
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+class PooledDriver:
+    """
+    A WebDriver lent out by a DriverPool, with the number of NSD pages it has served.
+    """
+
+    def __init__(self, driver, driver_wait):
+        """
+        Wrap a started driver.
+
+        Args:
+            driver (webdriver.Chrome): The WebDriver.
+            driver_wait (WebDriverWait): Its wait object.
+        """
+        self.driver = driver
+        self.driver_wait = driver_wait
+        self.pages = 0
+
+class DriverPool:
+    """
+    Keeps a fixed number of WebDrivers alive and lends them to worker threads.
+
+    The ChromeDriver path is resolved once for the whole pool. Drivers are started on first demand,
+    then reused; a driver that fails its health check or reaches max_pages is quit and replaced.
+    """
+
+    def __init__(self, size=None, headless=None, max_pages=None):
+        """
+        Initialize the pool.
+
+        Args:
+            size (int): Maximum number of live drivers. Defaults to settings.driver_pool_size.
+            headless (bool): Run Chrome without a window. Defaults to settings.driver_headless.
+            max_pages (int): Pages served before a driver is recycled. Defaults to settings.driver_max_pages.
+        """
+        self.size = size or settings.driver_pool_size
+        self.headless = settings.driver_headless if headless is None else headless
+        self.max_pages = max_pages or settings.driver_max_pages
+        self.chromedriver_path = None
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.live = 0
+        self.started = 0
+        self.recycled = 0
+        self.crashed = 0
+
+    def start_driver(self):
+        """
+        Start one driver, resolving the ChromeDriver path on first use.
+
+        Returns:
+            PooledDriver: The new driver, or None if it could not be started.
+        """
+        with self.lock:
+            if self.chromedriver_path is None:
+                self.chromedriver_path = resolve_chromedriver_path()
+            chromedriver_path = self.chromedriver_path
+
+        driver, driver_wait = load_driver(chromedriver_path, self.headless) if chromedriver_path else (None, None)
+        if driver is None:
+            return None
+
+        with self.lock:
+            self.started += 1
+        return PooledDriver(driver, driver_wait)
+
+    def acquire(self):
+        """
+        Borrow a driver, starting one if the pool is not full, or waiting for one to be released.
+
+        Returns:
+            PooledDriver: The borrowed driver, or None if a new driver could not be started.
+        """
+        while True:
+            with self.lock:
+                can_start = self.idle.empty() and self.live < self.size
+                if can_start:
+                    self.live += 1
+
+            if can_start:
+                pooled = self.start_driver()
+                if pooled is None:
+                    with self.lock:
+                        self.live -= 1
+                return pooled
+
+            # Wait for a release, checking again whether a recycled slot can be refilled
+            try:
+                return self.idle.get(timeout=settings.wait_time)
+            except queue.Empty:
+                continue
+
+    def release(self, pooled, pages=1):
+        """
+        Return a driver to the pool, recycling it if it crashed or served max_pages.
+
+        Args:
+            pooled (PooledDriver): The borrowed driver.
+            pages (int): Number of NSD pages served since it was acquired.
+
+        Returns:
+            bool: True if the driver went back to the pool, False if it was recycled.
+        """
+        pooled.pages += pages
+        healthy = is_driver_healthy(pooled.driver)
+
+        if healthy and pooled.pages < self.max_pages:
+            self.idle.put(pooled)
+            return True
+
+        # Quit the driver; its slot is refilled by the next acquire
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+
+        with self.lock:
+            self.live -= 1
+            if healthy:
+                self.recycled += 1
+            else:
+                self.crashed += 1
+        return False
+
+    def stats(self):
+        """
+        Report how many drivers were started, recycled and lost to crashes.
+
+        Returns:
+            dict: live, started, recycled and crashed counts.
+        """
+        with self.lock:
+            return {'live': self.live, 'started': self.started, 'recycled': self.recycled, 'crashed': self.crashed}
+
+    def close(self):
+        """
+        Quit every idle driver.
+
+        Returns:
+            bool: True once all drivers are closed.
+        """
+        while not self.idle.empty():
+            pooled = self.idle.get_nowait()
+            try:
+                pooled.driver.quit()
+            except Exception:
+                pass
+            with self.lock:
+                self.live -= 1
+        return True
+
 if __name__ == '__main__':
     print(settings.module_alert)
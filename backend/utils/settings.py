@@ -4,6 +4,13 @@ db_folder = 'backend/data'
 db_folder_short = 'data'
 db_path = 'backend/data/b3.db'
 backup_name = 'backup'
+backup_interval = 3600  # Minimum seconds between two snapshots of the same database
+
+# Database writer
+writer_queue_size = 64  # Batches waiting for the writer before producers block
+writer_coalesce_rows = 20000  # Rows gathered for one table before they are written in one transaction
+writer_flush_interval = 5  # Seconds without new batches before everything gathered is written
+writer_retries = 3  # Extra attempts for a transaction that hit a locked database
 
 # batches
 batch_size = 50  # Batch size for data processing
@@ -13,6 +20,10 @@ big_batch_size = int(40000 / max_workers)
 # Selenium settings
 wait_time = 2  # Wait time for Selenium operations
 driver = driver_wait = None  # Placeholders for Selenium driver and wait objects
+driver_pool_size = max_workers  # Number of WebDrivers kept alive by the driver pool
+driver_headless = True  # Run pooled WebDrivers without a window
+driver_max_pages = 200  # Recycle a pooled WebDriver after this many NSD pages
+hardcoded_chromedriver_path = r'D:\\Fausto Stangler\\Documentos\\Python\\FLY\\backend\\bin\\chromedriver-win64\\chromedriver.exe'
 
 # Requests
 USER_AGENTS = [
@@ -82,13 +93,32 @@ nsd_columns = ['nsd', 'company_name', 'quarter', 'version', 'nsd_type', 'auditor
 nsd_order = ['company_name', 'quarter', 'version']
 default_daily_submission_estimate = 30
 safety_factor = 3  # Apply a safety factor to account for possible increases
+nsd_url = "https://www.rad.cvm.gov.br/ENET/frmGerenciaPaginaFRE.aspx?NumeroSequencialDocumento={nsd}&CodigoTipoInstituicao=1"  # NSD page URL template
+nsd_concurrent = True  # Fetch NSD pages with the asyncio engine instead of one request at a time
+nsd_max_concurrency = 16  # Maximum NSD requests in flight at once
+nsd_requests_per_second = 20  # Maximum request starts per second for each host
+nsd_request_timeout = 30  # Total timeout in seconds for a single NSD request
+nsd_request_retries = 2  # Extra attempts for a failed NSD request
+nsd_range_mode = 'frontier'  # 'frontier' probes for the last published NSD, 'estimate' uses the safety factor range
+nsd_frontier_window = 5  # Consecutive NSDs checked per probe so isolated unused numbers are skipped
+nsd_frontier_max_step = 2 ** 20  # Largest galloping step past the maximum NSD in the database
+
+# Page cache settings
+pages_file = 'pages'  # Name part of the on-disk page cache database
+page_cache_max_bytes = 2 * 1024 ** 3  # Maximum compressed size of the cached pages
+page_cache_ttl = 180 * 24 * 3600  # Seconds a cached page stays valid
+page_cache_evict_every = 100  # Check the size bound every this many writes
 
 # Statements settings
 statements_sheet_columns = ['company_name', 'quarter', 'version', 'type', 'frame']
 
 statements_file = 'statements'
+statements_priority = 'newest'  # Scrape order in thread mode: 'newest' quarter first, or highest estimated 'cost' first
+statements_engine = 'http'  # 'http' requests the frame documents directly, 'selenium' drives Chrome for every frame
 statements_types = ["DEMONSTRACOES FINANCEIRAS PADRONIZADAS", "INFORMACOES TRIMESTRAIS"]
 financial_statements_columns = ['account', 'description', 'value']  # Assuming these are the financial/statements columns
+financial_table_xpath = '//*[@id="ctl00_cphPopUp_tbDados"]'  # Data table of a financial statement frame
+financial_title_xpath = '//*[@id="TituloTabelaSemBorda"]'  # Title of a financial statement frame, holds the thousands marker
 statements_columns = ['nsd', 'sector', 'subsector', 'segment', 'company_name', 'quarter', 'version', 'type', 'frame'] + financial_statements_columns
 statements_order = ['sector', 'subsector', 'segment', 'company_name', 'quarter', 'version', 'type', 'account', 'description']
 year_end_accounts = ['3', '4']
@@ -96,11 +126,32 @@ cumulative_quarter_accounts = ['6', '7']
 
 # Math settings
 statements_file_math = 'math'
+math_incremental = True  # Only transform the company-years touched by statements rows added since the last math run
+math_processes = None  # Worker processes for the math process mode, None for one per CPU
+watermark_table = 'watermarks'  # Table in the main database holding the last processed rowid of each stage and sector
+change_table = 'table_changes'  # Table in each stage database counting the rows rewritten in place per sector, kept by triggers
+fingerprint_table = 'fingerprints'  # Table in the main database holding the key hash and fingerprint of the rows each stage has seen
+
+# Storage settings
+storage_backend = 'sqlite'  # 'sqlite' reads the tables directly, 'parquet' reads a columnar copy rebuilt from a sector table whenever it changed
+plots_storage_backend = 'parquet'  # Backend of the plots, which read the whole standard stage without writing it; the stages use storage_backend
+storage_folder = 'backend/data/parquet'  # Root of the columnar copy, one folder per database file and sector, partitioned by year
+category_columns = ['sector', 'subsector', 'segment', 'company_name', 'type', 'frame', 'account', 'description']  # Text columns loaded as categoricals with shared dictionaries
+categorical_frames = True  # Hold the category columns of loaded statements as categoricals instead of Python strings
+version_columns = ['company_name', 'quarter', 'type', 'frame', 'account']  # A statement line, whose newest version is the current one
+current_view_suffix = '_current'  # Suffix of the per-sector views holding only the current version of each statement line
 
 # Standard settings
 statements_standard = 'standard'
+standard_incremental = True  # Only standardize the filings whose math rows or criteria changed since the last standardization
+standard_scope = ['company_name', 'quarter']  # A filing, standardized on its own: sub-criteria only see the accounts matched in the same filing
+standard_audit = False  # Record the criteria, row count and matched items of every standardization node in the audit table
+standard_audit_table = 'standard_audit'  # Table in the main database holding the standardization audit, one row per sector, section and node
 
 # ratios
+statements_ratios = 'ratios'  # Database file of the indicator rows, one table per sector keyed by company, quarter, type and account
+ratios_incremental = True  # Only recompute the company-quarters whose standard rows or indicator formulas changed since the last run
+ratios_scope = ['company_name', 'quarter']  # A company-quarter, whose indicators only read its own standard rows
 
 
 # Descriptions and accounts
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from utils import categories
+from utils import ratios_engine
+
+
+class ShareCounts:
+    """
+    The capital composition rows of a sector, such as the share counts filed as 'Dados da Empresa', broadcast to
+    the statement types each company-quarter has, such as 'DFs Consolidadas' and 'DFs Individuais'.
+
+    Every row gets the integer code of its (company_name, quarter), from the categorical codes when the frame is
+    encoded, and each target type flags the codes it has in a boolean array. The capital rows to copy for a type
+    are then found by indexing that array, and the broadcast frame is built with a single take of row positions,
+    so no merge, concatenation of copies or sort runs and the largest sector is only copied once.
+    """
+
+    def __init__(self, df, source_types=['Dados da Empresa'], target_types=['DFs Consolidadas', 'DFs Individuais']):
+        """
+        Index the company-quarters of a sector.
+
+        Parameters:
+        - df (DataFrame): One sector's standard statements.
+        - source_types (list of str): Types of the rows to broadcast.
+        - target_types (list of str): Types the rows are broadcast to, where the company-quarter has them.
+        """
+        self.df = df
+        self.source_types = list(source_types)
+        self.target_types = list(target_types)
+
+        # Step 1: Code every (company_name, quarter); missing values get their own code, as in a merge
+        key = np.zeros(len(df), dtype=np.int64)
+        for column in ['company_name', 'quarter']:
+            codes, uniques = ratios_engine.RatiosEngine.factorize(df[column])
+            key = key * (len(uniques) + 1) + codes + 1
+        self.key = key
+        size = int(key.max()) + 1 if len(key) else 0
+
+        # Step 2: Flag the company-quarters of each target type
+        types = df['type']
+        self.sources = np.flatnonzero(types.isin(self.source_types).to_numpy())
+        self.present = {}
+        for target in self.target_types:
+            present = np.zeros(size, dtype=bool)
+            present[key[(types == target).to_numpy()]] = True
+            self.present[target] = present
+
+    def positions(self, target):
+        """
+        Return the capital rows whose company-quarter has a target type.
+
+        Parameters:
+        - target (str): The target type.
+
+        Returns:
+        ndarray: The row positions, in frame order.
+        """
+        return self.sources[self.present[target][self.key[self.sources]]]
+
+    def broadcast(self):
+        """
+        Replace the capital rows by their copies for every target type their company-quarter has.
+
+        Returns:
+        DataFrame: The other rows in their original order, then the copies, one block per target type.
+        """
+        # Step 1: Take the other rows and the copies in one go
+        others = np.setdiff1d(np.arange(len(self.df)), self.sources, assume_unique=True)
+        blocks = [self.positions(target) for target in self.target_types]
+        df = self.df.take(np.concatenate([others] + blocks)).reset_index(drop=True)
+
+        # Step 2: Give each block of copies its target type
+        if isinstance(df['type'].dtype, pd.CategoricalDtype):
+            if any(target not in df['type'].cat.categories for target in self.target_types):
+                categories.registry.register(pd.DataFrame({'type': self.target_types}), ['type'])
+                categories.registry.cast(df, ['type'])
+            types = df['type']
+            codes = types.cat.codes.to_numpy().copy()
+            start = len(others)
+            for target, block in zip(self.target_types, blocks):
+                codes[start:start + len(block)] = types.cat.categories.get_loc(target)
+                start += len(block)
+            df['type'] = pd.Categorical.from_codes(codes, dtype=types.dtype)
+        else:
+            types = df['type']
+            values = types.to_numpy(dtype=object).copy()
+            start = len(others)
+            for target, block in zip(self.target_types, blocks):
+                values[start:start + len(block)] = target
+                start += len(block)
+            df['type'] = values
+        return df
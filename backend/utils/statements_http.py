@@ -0,0 +1,228 @@
+import re
+import html
+from urllib.parse import urljoin, urlsplit, parse_qs
+
+import requests
+from lxml import html as lxml_html
+
+from utils import system
+from utils import settings
+from utils import page_cache
+
+
+class StatementsHttpExtractor:
+    """
+    Fetches statement frame documents straight from the NSD page links, without a browser.
+
+    The NSD page embeds the URL of the frame documents it lists (group and frame as query parameters),
+    so each (type, frame) pair it links can be requested directly over one keep-alive session. A frame the
+    page does not link is only taken as absent when the page's own frame list of its group leaves it out;
+    otherwise the browser is the fallback.
+    """
+
+    def __init__(self, cache=None):
+        """
+        Initialize the extractor with a keep-alive HTTP session.
+
+        Parameters:
+        - cache (PageCache): The page cache used for NSD pages. A new one is opened if omitted.
+        """
+        self.session = requests.Session()
+        self.session.headers.update(system.header_random())
+        self.page_cache = cache or page_cache.PageCache()
+        self.frame_urls = {}
+        self.frame_lists = {}
+        self.refreshed_nsd = None
+
+    def fetch(self, url):
+        """
+        Fetch a URL over the shared session.
+
+        Parameters:
+        - url (str): The URL to fetch.
+
+        Returns:
+        str: The response body, or None if the request failed.
+        """
+        try:
+            response = self.session.get(url, timeout=settings.nsd_request_timeout)
+            response.raise_for_status()
+            return response.text
+        except requests.RequestException as e:
+            system.log_error(f"Error fetching {url}: {e}")
+            return None
+
+    def get_nsd_page(self, nsd, refresh=False):
+        """
+        Return the NSD page, from the page cache unless a refresh is requested.
+
+        Parameters:
+        - nsd (int): The NSD value.
+        - refresh (bool): Request the page again through the session, for example to renew its cookies.
+
+        Returns:
+        str: The HTML of the NSD page, or None.
+        """
+        key = page_cache.PageCache.nsd_key(nsd)
+        nsd_html = None if refresh else self.page_cache.get(key)
+
+        if nsd_html is None:
+            nsd_html = self.fetch(settings.nsd_url.format(nsd=nsd))
+            self.page_cache.put(key, nsd_html)
+
+        return nsd_html
+
+    def find_frame_urls(self, nsd, nsd_html):
+        """
+        Extract the frame document URLs embedded in an NSD page.
+
+        Parameters:
+        - nsd (int): The NSD value, used to resolve relative URLs.
+        - nsd_html (str): The HTML of the NSD page.
+
+        Returns:
+        dict: Absolute frame URLs keyed by the normalized (group, frame) pair.
+        """
+        frame_url_pattern = r'frm\w+\.aspx\?[^"\'\s<>]*Grupo=[^"\'\s<>]*'
+        base_url = settings.nsd_url.format(nsd=nsd)
+
+        frame_urls = {}
+        for match in re.findall(frame_url_pattern, nsd_html or ''):
+            frame_url = html.unescape(match)
+            query = parse_qs(urlsplit(frame_url).query)
+            group = query.get('Grupo', [''])[0]
+            frame = query.get('Quadro', [''])[0]
+            if group and frame:
+                frame_urls.setdefault(self.normalize(group, frame), urljoin(base_url, frame_url))
+
+        return frame_urls
+
+    @staticmethod
+    def normalize(group, frame):
+        """
+        Normalize a (group, frame) pair for matching against the settings.
+
+        Parameters:
+        - group (str): The statement group.
+        - frame (str): The statement frame.
+
+        Returns:
+        tuple: The casefolded, whitespace-collapsed pair.
+        """
+        return (' '.join(group.split()).casefold(), ' '.join(frame.split()).casefold())
+
+    def find_frame_list(self, nsd_html):
+        """
+        Read the frames the NSD page itself lists: the cmbQuadro options, which belong to the group selected in cmbGrupo.
+
+        Parameters:
+        - nsd_html (str): The HTML of the NSD page.
+
+        Returns:
+        dict: The normalized frame names keyed by the normalized group, empty when the page has no such lists.
+        """
+        if not nsd_html:
+            return {}
+
+        page = lxml_html.fromstring(nsd_html)
+        groups = page.xpath('//select[@id="cmbGrupo"]/option[@selected]') or page.xpath('//select[@id="cmbGrupo"]/option[1]')
+        frames = [option.text_content() for option in page.xpath('//select[@id="cmbQuadro"]/option')]
+        if not groups or not frames:
+            return {}
+
+        group = groups[0].text_content()
+        return {self.normalize(group, '')[0]: {self.normalize(group, frame)[1] for frame in frames}}
+
+    def get_frame_urls(self, nsd, refresh=False):
+        """
+        Return the frame URLs of an NSD, discovering them once per NSD.
+
+        Parameters:
+        - nsd (int): The NSD value.
+        - refresh (bool): Renew the NSD page before discovering, at most once per NSD.
+
+        Returns:
+        dict: Absolute frame URLs keyed by the normalized (group, frame) pair.
+        """
+        if refresh and self.refreshed_nsd != nsd:
+            self.refreshed_nsd = nsd
+            self.discover(nsd, self.get_nsd_page(nsd, refresh=True))
+        elif nsd not in self.frame_urls:
+            self.discover(nsd, self.get_nsd_page(nsd))
+
+        return self.frame_urls[nsd]
+
+    def discover(self, nsd, nsd_html):
+        """
+        Keep the frame URLs and the frame list of an NSD page, replacing those of the previous NSD.
+
+        Parameters:
+        - nsd (int): The NSD value.
+        - nsd_html (str): The HTML of the NSD page.
+
+        Returns:
+        dict: Absolute frame URLs keyed by the normalized (group, frame) pair.
+        """
+        self.frame_urls = {nsd: self.find_frame_urls(nsd, nsd_html)}
+        self.frame_lists = {nsd: self.find_frame_list(nsd_html)}
+        return self.frame_urls[nsd]
+
+    def frame_exists(self, nsd, cmbGrupo, cmbQuadro):
+        """
+        Tell whether a frame may exist for an NSD, so that a browser fallback is worth trying.
+
+        Links found in the page do not prove a frame is missing; only the page's own frame list of the group does.
+
+        Parameters:
+        - nsd (int): The NSD value.
+        - cmbGrupo (str): The statement group.
+        - cmbQuadro (str): The statement frame.
+
+        Returns:
+        bool: False only when the NSD page lists the frames of this group and this one is not among them.
+        """
+        self.get_frame_urls(nsd)
+        group, frame = self.normalize(cmbGrupo, cmbQuadro)
+        frames = self.frame_lists.get(nsd, {}).get(group)
+        return frames is None or frame in frames
+
+    def get_frame_html(self, nsd, cmbGrupo, cmbQuadro, xpath_ready):
+        """
+        Request the frame document for one (type, frame) pair of an NSD.
+
+        Parameters:
+        - nsd (int): The NSD value.
+        - cmbGrupo (str): The statement group, for example 'DFs Consolidadas'.
+        - cmbQuadro (str): The statement frame, for example 'Demonstração do Resultado'.
+        - xpath_ready (str): XPath of an element that must be present in a complete frame document.
+
+        Returns:
+        str: The HTML of the frame document, or None if it could not be found or fetched.
+        """
+        key = self.normalize(cmbGrupo, cmbQuadro)
+
+        # The second attempt renews the NSD page in case its links or cookies went stale
+        for refresh in (False, True):
+            frame_url = self.get_frame_urls(nsd, refresh=refresh).get(key)
+
+            # No renewal brings back a frame the page's own list confirms is absent
+            if frame_url is None:
+                if not self.frame_exists(nsd, cmbGrupo, cmbQuadro):
+                    return None
+                continue
+
+            frame_html = self.fetch(frame_url)
+            if frame_html and lxml_html.fromstring(frame_html).xpath(xpath_ready):
+                return frame_html
+
+        return None
+
+    def close(self):
+        """
+        Close the HTTP session.
+
+        Returns:
+        bool: True once closed.
+        """
+        self.session.close()
+        return True
@@ -4,27 +4,85 @@ import sqlite3
 import pandas as pd
 import time
 import shutil
-from io import StringIO
+import threading
+from lxml import html as lxml_html
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.support import expected_conditions as EC
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 from utils import system
 from utils import settings
 from utils import selenium_driver
+from utils import page_cache
+from utils import statements_http
+from utils import table_parser
+from utils import scheduler
+from utils import db_writer
+from utils import change_detection
 
 class StatementsDataScraper:
     """
     A class to scrape and store statements data from NSD pages.
     """
 
-    def __init__(self):
-        """Initialize the scraper with settings and WebDriver."""
-        self.driver, self.driver_wait = selenium_driver.initialize_driver()
+    def __init__(self, engine=None, driver_pool=None, db_writer=None):
+        """
+        Initialize the scraper with settings and WebDriver.
+
+        Parameters:
+        - engine (str): 'http' requests the frame documents directly and only starts Chrome as a fallback,
+                        'selenium' drives Chrome for every frame. Defaults to settings.statements_engine.
+        - driver_pool (DriverPool): If given, WebDrivers are borrowed from the pool for one NSD at a time
+                                    instead of being started by this scraper.
+        - db_writer (DatabaseWriter): If given, saves are queued for this shared writer instead of written directly.
+        """
+        engine = engine or settings.statements_engine
+        self.engine = engine
+        self.driver_pool = driver_pool
+        self.pooled_driver = None
+        self.db_writer = db_writer
+        self.driver, self.driver_wait = (None, None) if engine == 'http' or driver_pool else selenium_driver.initialize_driver()
         self.db_folder = settings.db_folder
         self.db_name = settings.db_name
+        self.page_cache = page_cache.PageCache()
+        self.http_extractor = statements_http.StatementsHttpExtractor(self.page_cache) if engine == 'http' else None
+        self.loaded_nsd = None
+        self.driver_failed = False  # Set when a frame needed the browser and no WebDriver was available
+        self.pending = {}  # Scraped DataFrames waiting to be saved, per sector
+        self.pending_rows = {}  # Company-quarters behind the pending DataFrames, per sector
+
+    def ensure_driver(self):
+        """
+        Start the WebDriver on first use, for the selenium engine fallback, or borrow one from the driver pool.
+
+        Returns:
+        bool: True if a WebDriver is available.
+        """
+        if self.driver is None:
+            if self.driver_pool is not None:
+                self.pooled_driver = self.driver_pool.acquire()
+                if self.pooled_driver is not None:
+                    self.driver, self.driver_wait = self.pooled_driver.driver, self.pooled_driver.driver_wait
+            else:
+                self.driver, self.driver_wait = selenium_driver.initialize_driver()
+        return self.driver is not None
+
+    def release_driver(self):
+        """
+        Return a borrowed WebDriver to the driver pool, which recycles it if it crashed or is worn out.
+
+        Returns:
+        bool: True if a driver was returned.
+        """
+        if self.pooled_driver is None:
+            return False
+
+        self.driver_pool.release(self.pooled_driver)
+        self.pooled_driver = None
+        self.driver, self.driver_wait = None, None
+        self.loaded_nsd = None
+        return True
 
     def load_nsd_list(self):
         """
@@ -64,7 +122,7 @@ class StatementsDataScraper:
             cursor = conn.cursor()
 
             # Query to get all table names, excluding internal SQLite tables like sqlite_stat1
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name != ?;", (settings.change_table,))
             tables = cursor.fetchall()
 
             total_files = len(tables)
@@ -99,76 +157,201 @@ class StatementsDataScraper:
             system.log_error(f"Error loading company_info data: {e}")
             return pd.DataFrame()  # Return an empty DataFrame on error
 
-    def scrape_financial_data(self, cmbGrupo, cmbQuadro):
+    def open_nsd_page(self, nsd):
         """
-        Scrapes statements data from the specified page.
+        Navigate the WebDriver to the NSD page unless it is already there.
 
         Parameters:
-        - group_value: The group combo box value.
-        - quadro_value: The frame combo box value.
+        - nsd (int): The NSD value.
 
         Returns:
-        - DataFrame: A DataFrame containing the scraped data.
+        bool: True once the page is loaded, False if no WebDriver could be started or borrowed.
         """
-        try:
-            drop_items = '3.99'
-            xpath_grupo = '//*[@id="cmbGrupo"]'
-            xpath_quadro = '//*[@id="cmbQuadro"]'
-            xpath_frame = '//*[@id="iFrameFormulariosFilho"]'
-
-            # Select the correct options for cmbGrupo and cmbQuadro
-            grupo = system.select(xpath_grupo, cmbGrupo, self.driver, self.driver_wait)
-            quadro = system.select(xpath_quadro, cmbQuadro, self.driver, self.driver_wait)
+        if self.loaded_nsd != nsd:
+            if not self.ensure_driver():
+                # The frames of this NSD cannot be read, which is not the same as them being absent
+                self.driver_failed = True
+                system.log_error(f"No WebDriver available to open NSD {nsd}")
+                return False
+            url = f"https://www.rad.cvm.gov.br/ENET/frmGerenciaPaginaFRE.aspx?NumeroSequencialDocumento={nsd}&CodigoTipoInstituicao=1"
+            self.driver.get(url)
+            self.loaded_nsd = nsd
+        return True
 
-            # selenium enter frame
-            frame = system.wait_forever(self.driver_wait, xpath_frame)
-            frame = self.driver.find_elements(By.XPATH, xpath_frame)
-            self.driver.switch_to.frame(frame[0])
+    def get_frame_html(self, cmbGrupo, cmbQuadro, xpath_ready):
+        """
+        Select a statement frame in the NSD page and return the HTML of its iframe.
 
-            # read and clean quadro
-            xpath = '//*[@id="ctl00_cphPopUp_tbDados"]'
-            thousand = system.wait_forever(self.driver_wait, xpath)
+        Parameters:
+        - cmbGrupo: The group combo box value.
+        - cmbQuadro: The frame combo box value.
+        - xpath_ready (str): XPath of an element that is present once the frame has loaded.
 
-            xpath = '//*[@id="TituloTabelaSemBorda"]'
-            thousand = self.driver_wait.until(EC.presence_of_element_located((By.XPATH, xpath))).text
-            thousand = 1000 if "Mil" in thousand else 1
+        Returns:
+        str: The HTML source of the frame.
+        """
+        xpath_grupo = '//*[@id="cmbGrupo"]'
+        xpath_quadro = '//*[@id="cmbQuadro"]'
+        xpath_frame = '//*[@id="iFrameFormulariosFilho"]'
 
-            html_content = self.driver.page_source
-            df1 = pd.read_html(StringIO(html_content), header=0)[0]
-            df2 = pd.read_html(StringIO(html_content), header=0, thousands='.')[0].fillna(0)
-
-            df1 = df1.iloc[:,0:3]
-            df2 = df2.iloc[:,0:3]
-            df1.columns = settings.financial_statements_columns
-            df2.columns = settings.financial_statements_columns
-            df = pd.concat([df1.iloc[:, :2], df2.iloc[:, 2:3]], axis=1)
-
-            col = df.iloc[:, 2].astype(str)
-            col = col.str.replace('.', '', regex=False)
-            col = col.str.replace(',', '.', regex=False)
-            col = pd.to_numeric(col, errors='coerce')
-            col = col * thousand
-            df.iloc[:, 2] = col
+        # Select the correct options for cmbGrupo and cmbQuadro
+        grupo = system.select(xpath_grupo, cmbGrupo, self.driver, self.driver_wait)
+        quadro = system.select(xpath_quadro, cmbQuadro, self.driver, self.driver_wait)
 
-            try:
-                df = df[~df[settings.financial_statements_columns[0]].str.startswith(drop_items)]
-            except Exception as e:
-                pass
+        # selenium enter frame
+        frame = system.wait_forever(self.driver_wait, xpath_frame)
+        frame = self.driver.find_elements(By.XPATH, xpath_frame)
+        self.driver.switch_to.frame(frame[0])
 
+        try:
+            # Wait for the frame content and capture it
+            system.wait_forever(self.driver_wait, xpath_ready)
+            html_content = self.driver.page_source
+        finally:
             # selenium exit frame
             self.driver.switch_to.parent_frame()
 
+        return html_content
+
+    def get_frame(self, nsd, cmbGrupo, cmbQuadro, xpath_ready):
+        """
+        Return the HTML of a statement frame from the page cache, or scrape and cache it.
+
+        Parameters:
+        - nsd (int): The NSD value.
+        - cmbGrupo: The group combo box value.
+        - cmbQuadro: The frame combo box value.
+        - xpath_ready (str): XPath of an element that is present once the frame has loaded.
+
+        Returns:
+        str: The HTML source of the frame, or None if the NSD has no such frame.
+        """
+        key = page_cache.PageCache.frame_key(nsd, cmbGrupo, cmbQuadro)
+        html_content = self.page_cache.get(key)
+
+        if html_content is None and self.http_extractor is not None:
+            # Request the frame document directly
+            html_content = self.http_extractor.get_frame_html(nsd, cmbGrupo, cmbQuadro, xpath_ready)
+
+            # Frames the NSD page's own frame list leaves out are absent, not worth starting Chrome for
+            if html_content is None and not self.http_extractor.frame_exists(nsd, cmbGrupo, cmbQuadro):
+                return None
+
+        if html_content is None:
+            # Only navigate when a frame is missing from the cache
+            if not self.open_nsd_page(nsd):
+                return None
+            html_content = self.get_frame_html(cmbGrupo, cmbQuadro, xpath_ready)
+
+        self.page_cache.put(key, html_content)
+
+        return html_content
+
+    def parse_financial_data(self, html_content):
+        """
+        Parse the HTML of a financial statement frame into a DataFrame.
+
+        Parameters:
+        - html_content (str): The HTML source of the frame.
+
+        Returns:
+        - DataFrame: A DataFrame containing the account, description and value columns.
+        """
+        return table_parser.parse_financial_table(html_content)
+
+    def scrape_financial_data(self, nsd, cmbGrupo, cmbQuadro):
+        """
+        Scrapes statements data from the specified page.
+
+        Parameters:
+        - nsd: The NSD value of the page.
+        - group_value: The group combo box value.
+        - quadro_value: The frame combo box value.
+
+        Returns:
+        - DataFrame: A DataFrame containing the scraped data.
+        """
+        try:
+            xpath_ready = settings.financial_table_xpath
+
+            html_content = self.get_frame(nsd, cmbGrupo, cmbQuadro, xpath_ready)
+            if html_content is None:
+                return None
+            df = self.parse_financial_data(html_content)
+
             return df
         
         except Exception as e:
-            # system.log_error(e)
+            system.log_error(f"Error scraping financial data: {e}")
             return None
 
-    def scrape_statements_data(self, cmbGrupo, cmbQuadro):
+    def parse_statements_data(self, html_content):
+        """
+        Parse the HTML of the capital composition frame into a DataFrame.
+
+        Parameters:
+        - html_content (str): The HTML source of the frame.
+
+        Returns:
+        DataFrame: A Pandas DataFrame containing the share counts.
+        """
+        xpath_thousand = '//*[@id="UltimaTabela"]/table//tr[1]/td[1]/b'
+        thousand_word = 'Mil'
+
+        # XPaths for the different data points
+        acoes_on_xpath = '//*[@id="QtdAordCapiItgz_1"]'
+        acoes_pn_xpath = '//*[@id="QtdAprfCapiItgz_1"]'
+        acoes_on_tesouraria_xpath = '//*[@id="QtdAordTeso_1"]'
+        acoes_pn_tesouraria_xpath = '//*[@id="QtdAprfTeso_1"]'
+
+        tree = lxml_html.fromstring(html_content)
+
+        # Check if the values are in thousands
+        thousand_text = tree.xpath(xpath_thousand)[0].text_content()
+        thousand = 1000 if thousand_word in thousand_text else 1
+
+        # Extract the required values
+        data = {
+            settings.financial_statements_columns[0]: [],  # 'account'
+            settings.financial_statements_columns[1]: [],  # 'description'
+            settings.financial_statements_columns[2]: []   # 'value'
+        }
+
+        # Extract values using the XPaths
+        acoes_on = tree.xpath(acoes_on_xpath)[0].text_content().strip().replace('.', '').replace(',', '.')
+        acoes_pn = tree.xpath(acoes_pn_xpath)[0].text_content().strip().replace('.', '').replace(',', '.')
+        acoes_on_tesouraria = tree.xpath(acoes_on_tesouraria_xpath)[0].text_content().strip().replace('.', '').replace(',', '.')
+        acoes_pn_tesouraria = tree.xpath(acoes_pn_tesouraria_xpath)[0].text_content().strip().replace('.', '').replace(',', '.')
+
+        # Populate the data dictionary using settings values
+        data[settings.financial_statements_columns[0]] = [
+            settings.accounts['acoes_on'], 
+            settings.accounts['acoes_pn'], 
+            settings.accounts['acoes_on_tesouraria'], 
+            settings.accounts['acoes_pn_tesouraria']
+        ]
+        data[settings.financial_statements_columns[1]] = [
+            settings.descriptions['acoes_on'], 
+            settings.descriptions['acoes_pn'], 
+            settings.descriptions['acoes_on_tesouraria'], 
+            settings.descriptions['acoes_pn_tesouraria']
+        ]
+        data[settings.financial_statements_columns[2]] = [
+            float(acoes_on) * thousand, 
+            float(acoes_pn) * thousand, 
+            float(acoes_on_tesouraria) * thousand, 
+            float(acoes_pn_tesouraria) * thousand
+        ]
+
+        df = pd.DataFrame(data)
+        return df
+
+    def scrape_statements_data(self, nsd, cmbGrupo, cmbQuadro):
         """
         Process the scraped statements data into a DataFrame.
 
         Parameters:
+        - nsd: The NSD value of the page.
         - cmbGrupo: The group combo box value.
         - cmbQuadro: The frame combo box value.
 
@@ -176,78 +359,131 @@ class StatementsDataScraper:
         DataFrame: A Pandas DataFrame containing the processed data.
         """
         try:
-            # Define the XPaths
-            xpath_grupo = '//*[@id="cmbGrupo"]'
-            xpath_quadro = '//*[@id="cmbQuadro"]'
-            xpath_frame = '//*[@id="iFrameFormulariosFilho"]'
-            xpath_thousand = '//*[@id="UltimaTabela"]/table/tbody[1]/tr[1]/td[1]/b'
-            thousand_word = 'Mil'
-            
-            # XPaths for the different data points
-            acoes_on_xpath = '//*[@id="QtdAordCapiItgz_1"]'
-            acoes_pn_xpath = '//*[@id="QtdAprfCapiItgz_1"]'
-            acoes_on_tesouraria_xpath = '//*[@id="QtdAordTeso_1"]'
-            acoes_pn_tesouraria_xpath = '//*[@id="QtdAprfTeso_1"]'
-
-            # Select the correct options for cmbGrupo and cmbQuadro
-            grupo = system.select(xpath_grupo, cmbGrupo, self.driver, self.driver_wait)
-            quadro = system.select(xpath_quadro, cmbQuadro, self.driver, self.driver_wait)
-
-            # Selenium enter frame
-            frame = system.wait_forever(self.driver_wait, xpath_frame)
-            self.driver.switch_to.frame(frame)
-
-            # Check if the values are in thousands
-            thousand_text = system.wait_forever(self.driver_wait, xpath_thousand).text
-            thousand = 1000 if thousand_word in thousand_text else 1
-
-            # Extract the required values
-            data = {
-                settings.financial_statements_columns[0]: [],  # 'account'
-                settings.financial_statements_columns[1]: [],  # 'description'
-                settings.financial_statements_columns[2]: []   # 'value'
-            }
-
-            # Extract values using the XPaths
-            acoes_on = self.driver.find_element(By.XPATH, acoes_on_xpath).text.strip().replace('.', '').replace(',', '.')
-            acoes_pn = self.driver.find_element(By.XPATH, acoes_pn_xpath).text.strip().replace('.', '').replace(',', '.')
-            acoes_on_tesouraria = self.driver.find_element(By.XPATH, acoes_on_tesouraria_xpath).text.strip().replace('.', '').replace(',', '.')
-            acoes_pn_tesouraria = self.driver.find_element(By.XPATH, acoes_pn_tesouraria_xpath).text.strip().replace('.', '').replace(',', '.')
-
-            # Populate the data dictionary using settings values
-            data[settings.financial_statements_columns[0]] = [
-                settings.accounts['acoes_on'], 
-                settings.accounts['acoes_pn'], 
-                settings.accounts['acoes_on_tesouraria'], 
-                settings.accounts['acoes_pn_tesouraria']
-            ]
-            data[settings.financial_statements_columns[1]] = [
-                settings.descriptions['acoes_on'], 
-                settings.descriptions['acoes_pn'], 
-                settings.descriptions['acoes_on_tesouraria'], 
-                settings.descriptions['acoes_pn_tesouraria']
-            ]
-            data[settings.financial_statements_columns[2]] = [
-                float(acoes_on) * thousand, 
-                float(acoes_pn) * thousand, 
-                float(acoes_on_tesouraria) * thousand, 
-                float(acoes_pn_tesouraria) * thousand
-            ]
-
-            df = pd.DataFrame(data)
-
-            # Selenium exit frame
-            self.driver.switch_to.parent_frame()
-            
+            xpath_ready = '//*[@id="UltimaTabela"]/table//tr[1]/td[1]/b'
+
+            html_content = self.get_frame(nsd, cmbGrupo, cmbQuadro, xpath_ready)
+            if html_content is None:
+                return None
+            df = self.parse_statements_data(html_content)
+
             return df
             
         except Exception as e:
             system.log_error(f"Error processing statements data: {e}")
             return None
 
+    def get_db_path(self):
+        """
+        Return the path of the statements database.
+
+        Returns:
+        str: The database path.
+        """
+        # Define the base database name using settings
+        db_name_base = f"{self.db_name.split('.')[0]} {settings.statements_file}" 
+        return os.path.join(self.db_folder, f"{db_name_base}.db")
+
+    def get_table_name(self, setor):
+        """
+        Return the table holding the statements of a sector.
+
+        Parameters:
+        - setor (str): The sector name.
+
+        Returns:
+        str: The sector name with underscores instead of spaces, or '_' for a blank sector.
+        """
+        return setor.strip().replace(' ', '_') if setor.strip() else '_'
+
+    def sync_scraped_nsds(self, detector):
+        """
+        Bring the fingerprints of the scraped NSDs up to date with the statements database,
+        reading only the rows added to each sector table since the last sync.
+
+        Parameters:
+        - detector (ChangeDetector): The detector keyed on 'nsd'.
+
+        Returns:
+        int: The number of NSDs read from the statements tables.
+        """
+        db_file = f"{settings.db_path.replace('.db', '')} {settings.statements_file}.db"
+        if not os.path.exists(db_file):
+            return 0
+
+        total_lines = 0
+        with sqlite3.connect(db_file) as conn:
+            tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name != ?;", (settings.change_table,)).fetchall()
+            start_time = time.time()
+            for i, (table,) in enumerate(tables):
+                lines = detector.sync_table(conn, table)
+                total_lines += lines
+
+                extra_info = [f'{lines} new NSDs in', table, f'{total_lines} total']
+                system.print_info(i, extra_info, start_time, len(tables))
+        return total_lines
+
+    def write_batch(self, conn, df, setor):
+        """
+        Create the sector table if needed and upsert the rows, inside the caller's transaction.
+
+        Parameters:
+        - conn (sqlite3.Connection): The open connection.
+        - df (DataFrame): The processed statements data as a DataFrame.
+        - setor (str): The sector associated with the data.
+
+        Returns:
+        int: The number of rows written.
+        """
+        table_name = self.get_table_name(setor)
+
+        # SQL command to create the table with a composite primary key
+        create_table_sql = f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            nsd INTEGER,
+            sector TEXT,
+            subsector TEXT,
+            segment TEXT,
+            company_name TEXT,
+            quarter TEXT,
+            version TEXT,
+            type TEXT,
+            frame TEXT,
+            account TEXT,
+            description TEXT,
+            value REAL,
+            PRIMARY KEY (company_name, quarter, version, type, frame, account, description)
+        )
+        """
+
+        # SQL command for INSERT OR REPLACE
+        insert_sql = f"""
+        INSERT INTO {table_name} 
+        (nsd, sector, subsector, segment, company_name, quarter, version, type, frame, account, description, value) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(company_name, quarter, version, type, frame, account, description) DO UPDATE SET
+        nsd=excluded.nsd,
+        sector=excluded.sector,
+        subsector=excluded.subsector,
+        segment=excluded.segment,
+        type=excluded.type,
+        frame=excluded.frame,
+        account=excluded.account,
+        description=excluded.description,
+        value=excluded.value
+        """
+
+        # Build the rows once, in table column order, with NaN as NULL
+        df = df[settings.statements_columns]
+        data_to_insert = list(df.astype(object).where(pd.notna(df), None).itertuples(index=False, name=None))
+
+        conn.execute(create_table_sql)
+        conn.executemany(insert_sql, data_to_insert)
+        return len(data_to_insert)
+
     def save_to_db(self, df, setor):
         """
         Save the processed statements data to a sector-specific table in the main database.
+        With a database writer the batch is queued for it, otherwise it is written right away.
 
         Parameters:
         - df (DataFrame): The processed statements data as a DataFrame.
@@ -255,67 +491,24 @@ class StatementsDataScraper:
         """
 
         try:
-            # Define the base database name using settings
-            db_name_base = f"{self.db_name.split('.')[0]} {settings.statements_file}" 
-
-            # Construct the full path for the main database and its backup
-            db_path = os.path.join(self.db_folder, f"{db_name_base}.db")
-            backup_path = os.path.join(self.db_folder, f"{db_name_base} {settings.backup_name}.db")
-
-            # Create a sector table name with underscores instead of spaces
-            table_name = setor.strip().replace(' ', '_') if setor.strip() else '_'
-
-            # SQL command to create the table with a composite primary key
-            create_table_sql = f"""
-            CREATE TABLE IF NOT EXISTS {table_name} (
-                nsd INTEGER,
-                sector TEXT,
-                subsector TEXT,
-                segment TEXT,
-                company_name TEXT,
-                quarter TEXT,
-                version TEXT,
-                type TEXT,
-                frame TEXT,
-                account TEXT,
-                description TEXT,
-                value REAL,
-                PRIMARY KEY (company_name, quarter, version, type, frame, account, description)
-            )
-            """
-
-            # SQL command for INSERT OR REPLACE
-            insert_sql = f"""
-            INSERT INTO {table_name} 
-            (nsd, sector, subsector, segment, company_name, quarter, version, type, frame, account, description, value) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(company_name, quarter, version, type, frame, account, description) DO UPDATE SET
-            nsd=excluded.nsd,
-            sector=excluded.sector,
-            subsector=excluded.subsector,
-            segment=excluded.segment,
-            type=excluded.type,
-            frame=excluded.frame,
-            account=excluded.account,
-            description=excluded.description,
-            value=excluded.value
-            """
-
-            # Create a backup if the database already exists
-            if os.path.exists(db_path):
-                shutil.copy2(db_path, backup_path)
-
-            # Connect to the main database
-            with sqlite3.connect(db_path) as conn:
-                # Create the table with the composite primary key if it doesn't exist
-                conn.execute(create_table_sql)
-                conn.commit()
+            db_path = self.get_db_path()
 
-                # Insert data using INSERT OR REPLACE
-                for _, row in df.iterrows():
-                    conn.execute(insert_sql, tuple(row))
+            if self.db_writer is not None:
+                self.db_writer.submit(db_path, setor, df, self.write_batch)
+                return db_path
 
-                conn.commit()
+            os.makedirs(self.db_folder, exist_ok=True)
+
+            # Snapshot the database now and then instead of copying it on every save
+            system.db_backup(db_path)
+
+            # Create the table and insert all rows in a single transaction
+            conn = system.db_connect(db_path)
+            try:
+                with conn:
+                    self.write_batch(conn, df, setor)
+            finally:
+                conn.close()
 
             print('Partial save completed...')
             return db_path
@@ -327,9 +520,9 @@ class StatementsDataScraper:
         """
         Identifies and returns companies that need new financial data scraping.
 
-        This function loads the NSD list, financial statements, and company information,
-        filters out NSD entries already present in financial statements, and merges 
-        the remaining NSD entries with company information to identify the scrape targets.
+        This function loads the NSD list and company information, merges them, and filters out
+        the NSD entries already present in the financial statements with one hash lookup per sector
+        against the persisted NSD fingerprints, which only read the statements rows added since the last run.
 
         Returns:
             pd.DataFrame: A DataFrame containing the companies that need new financial data scraping.
@@ -343,21 +536,21 @@ class StatementsDataScraper:
             company_info = self.load_company_info()
 
             nsd_company_info = pd.merge(nsd_list, company_info, on='company_name', how='inner')
-            # Group the merged DataFrame by sector and store in a dictionary
-            nsd_list_with_sector = {sector if sector.strip() else '_': df for sector, df in nsd_company_info.groupby('sector')}
+            # Group the merged DataFrame by the sector table its statements are saved to
+            nsd_list_with_sector = {self.get_table_name(sector): df for sector, df in nsd_company_info.groupby('sector')}
 
-            financial_statements = self.load_financial_statements()
+            # Only the presence of an NSD matters, so the fingerprint is empty
+            detector = change_detection.ChangeDetector(settings.statements_file, ['nsd'], [])
+            self.sync_scraped_nsds(detector)
 
             scrape_target = []
             # Loop through each sector and filter out NSD entries that are already in financial statements
             for sector, df in nsd_list_with_sector.items():
-                if sector in financial_statements:
-                    # Filter out NSD entries that are already in the financial statements for the sector
-                    filtered_df = df[~df['nsd'].isin(financial_statements[sector]['nsd'])]
-                    if not filtered_df.empty:
-                        scrape_target.append(filtered_df)
+                filtered_df = detector.changes(df, scope=sector)
+                if not filtered_df.empty:
+                    scrape_target.append(filtered_df)
 
-            if not filtered_df.empty:
+            if scrape_target:
                 scrape_targets = pd.concat(scrape_target)
             else:
                 scrape_targets = pd.DataFrame(columns=settings.statements_columns)
@@ -404,9 +597,9 @@ class StatementsDataScraper:
             segment = row['segment']
             version = row['version']
 
-            # Construct the URL for the NSD entry
-            url = f"https://www.rad.cvm.gov.br/ENET/frmGerenciaPaginaFRE.aspx?NumeroSequencialDocumento={nsd}&CodigoTipoInstituicao=1"
-            self.driver.get(url)
+            # The NSD page is only opened if a frame is missing from the page cache
+            self.loaded_nsd = None
+            self.driver_failed = False
 
             # Define all statements to be scraped
             statements = settings.financial_data_statements + settings.statements_data_statements
@@ -414,9 +607,14 @@ class StatementsDataScraper:
             for cmbGrupo, cmbQuadro in statements:
                 # Determine which scraping method to use
                 if [cmbGrupo, cmbQuadro] in settings.financial_data_statements:
-                    df = self.scrape_financial_data(cmbGrupo, cmbQuadro)
+                    df = self.scrape_financial_data(nsd, cmbGrupo, cmbQuadro)
                 else:
-                    df = self.scrape_statements_data(cmbGrupo, cmbQuadro)
+                    df = self.scrape_statements_data(nsd, cmbGrupo, cmbQuadro)
+
+                # Without a browser the remaining frames are unknown: skip the company-quarter so it is scraped again
+                if self.driver_failed:
+                    system.log_error(f"Skipped NSD {nsd} of {company_name}: no WebDriver to read {cmbGrupo} {cmbQuadro}")
+                    return []
 
                 if df is not None:
                     # Add necessary metadata columns to the DataFrame
@@ -440,6 +638,30 @@ class StatementsDataScraper:
             # Log any errors encountered during processing
             system.log_error(f"Error processing company quarter data: {e}")
             return []  # Return an empty list to prevent the process from stopping
+        finally:
+            # A pooled driver serves one NSD at a time
+            self.release_driver()
+
+    def save_batch(self, all_data, sector):
+        """
+        Concatenate, sort and save the pending DataFrames of a sector, then clear them.
+
+        Parameters:
+        - all_data (list): The pending DataFrames.
+        - sector (str): The sector whose database table receives the data.
+
+        Returns:
+        list: The emptied list.
+        """
+        if all_data:
+            batch_df = pd.concat(all_data, ignore_index=True)
+            # Reorder columns and sort
+            batch_df = batch_df[settings.statements_columns].sort_values(by=settings.statements_order)
+            db_path = self.save_to_db(batch_df, sector)
+            all_data.clear()  # Clear the list after saving
+            # Optimize the database after saving
+            # system.db_optimize(db_path)
+        return all_data
 
     def run_scraper(self, scrape_targets, batch_number=None):
         """
@@ -469,14 +691,7 @@ class StatementsDataScraper:
 
                         # Save to DB every settings.batch_size iterations or at the end
                         if (total_items - processed_items - 1) % int(settings.batch_size // settings.max_workers) == 0:
-                            if all_data:
-                                batch_df = pd.concat(all_data, ignore_index=True)
-                                # Reorder columns and sort
-                                batch_df = batch_df[settings.statements_columns].sort_values(by=settings.statements_order)
-                                db_path = self.save_to_db(batch_df, sector)
-                                all_data.clear()  # Clear the list after saving
-                                # Optimize the database after saving
-                                # system.db_optimize(db_path)
+                            self.save_batch(all_data, sector)
 
                     except Exception as e:
                         # Log any errors encountered during processing of individual rows
@@ -484,13 +699,10 @@ class StatementsDataScraper:
 
                     processed_items += 1  # Increment the processed items counter after each row
 
-                # Optimize database after processing each sector
-                if all_data:  # Make sure there is data to save
-                    batch_df = pd.concat(all_data, ignore_index=True)
-                    batch_df = batch_df[settings.statements_columns].sort_values(by=settings.statements_order)
-                    db_path = self.save_to_db(batch_df, sector)
-                    # system.db_optimize(db_path)
+                # Save what is left of the sector
+                self.save_batch(all_data, sector)
 
+            self.page_cache.print_stats(f'Statements page cache {batch_number}')
             return scrape_targets
 
         except Exception as e:
@@ -498,24 +710,121 @@ class StatementsDataScraper:
             system.log_error(f"Error in run_scraper: {e}")
             return None  # Return None to indicate that the scraping process did not complete
 
-    def main_thread(self, scrape_targets, total_items, batch_size):
+    def estimate_cost(self, row):
+        """
+        Estimate the work left for a company-quarter as the number of its frames missing from the page cache.
+
+        Parameters:
+        - row (pd.Series): A scrape target row.
+
+        Returns:
+        int: The number of frames that still have to be fetched.
+        """
+        statements = settings.financial_data_statements + settings.statements_data_statements
+        keys = [page_cache.PageCache.frame_key(row['nsd'], cmbGrupo, cmbQuadro) for cmbGrupo, cmbQuadro in statements]
+        return len(keys) - self.page_cache.count_present(keys)
+
+    def target_priority(self, row, priority=None):
+        """
+        Return the scheduling priority of a scrape target; lower values are scraped first.
+
+        Parameters:
+        - row (pd.Series): A scrape target row.
+        - priority (str): 'newest' for the newest quarter first, 'cost' for the most expensive target first.
+                          Defaults to settings.statements_priority.
+
+        Returns:
+        float: The priority.
+        """
+        priority = priority or settings.statements_priority
+        if priority == 'cost':
+            return -self.estimate_cost(row)
+        return -pd.to_datetime(row['quarter'], errors='coerce').value
+
+    def process_target(self, row, worker_number, progress):
+        """
+        Scrape one company-quarter and save its sector once enough rows are pending.
+
+        Parameters:
+        - row (pd.Series): A scrape target row.
+        - worker_number (int): The worker number shown in the progress line.
+        - progress (dict): Shared 'processed' counter, 'total', 'start_time' and 'lock'.
+
+        Returns:
+        int: The number of DataFrames scraped for the row.
+        """
+        save_every = max(int(settings.batch_size // settings.max_workers), 1)
+        sector = row['sector']
+
+        # Print progress information
+        with progress['lock']:
+            processed_items = progress['processed']
+            progress['processed'] += 1
+        extra_info = [worker_number, row['nsd'], row['company_name'], pd.to_datetime(row['quarter'], dayfirst=False, errors='coerce').strftime('%Y-%m-%d')]
+        system.print_info(processed_items, extra_info, progress['start_time'], progress['total'])
+
+        company_quarter_data = self.process_company_quarter_data(row)
+        all_data = self.pending.setdefault(sector, [])
+        all_data.extend(company_quarter_data)
+        self.pending_rows[sector] = self.pending_rows.get(sector, 0) + 1
+
+        # Save to DB every few rows of the same sector
+        if self.pending_rows[sector] >= save_every:
+            self.save_batch(all_data, sector)
+            self.pending_rows[sector] = 0
+
+        return len(company_quarter_data)
+
+    def flush_pending(self):
+        """
+        Save the pending DataFrames of every sector.
+
+        Returns:
+        dict: The emptied pending DataFrames.
+        """
+        for sector, all_data in self.pending.items():
+            self.save_batch(all_data, sector)
+            self.pending_rows[sector] = 0
+        return self.pending
+
+    def main_thread(self, scrape_targets):
+        """
+        Process the scrape targets with settings.max_workers workers fed one company-quarter at a time
+        from a shared priority queue. WebDrivers come from one DriverPool, so they are started once and recycled,
+        and all saves go through one DatabaseWriter, so the workers never contend for the database file.
+
+        Parameters:
+        - scrape_targets (DataFrame): DataFrame containing all the targets to scrape.
+        """
+        driver_pool = selenium_driver.DriverPool()
+        writer = db_writer.DatabaseWriter(label='Statements writer')
+        work_scheduler = scheduler.WorkScheduler(label='Statements scheduler')
+        progress = {'processed': 0, 'total': len(scrape_targets), 'start_time': time.time(), 'lock': threading.Lock()}
+
+        def setup(worker_number):
+            worker = StatementsDataScraper(driver_pool=driver_pool, db_writer=writer)
+            worker.worker_number = worker_number
+            return worker
+
+        def teardown(worker):
+            try:
+                worker.flush_pending()
+                worker.page_cache.print_stats(f'Statements page cache {worker.worker_number}')
+            finally:
+                worker.close_scraper()
+
         try:
-            with ThreadPoolExecutor(max_workers=settings.max_workers) as executor:
-                futures = []
-                for batch_index, start in enumerate(range(0, total_items, batch_size)):
-                    end = min(start + batch_size, total_items)
-                    futures.append(executor.submit(
-                        lambda targets=scrape_targets[start:end], index=batch_index + 0: (
-                            self.run_scraper_with_new_instance(targets, index)
-                        )
-                    ))
-
-                for future in as_completed(futures):
-                    future.result()  # This will raise an exception if one occurred in the thread
+            work_scheduler.put_many((row for _, row in scrape_targets.iterrows()), priority=self.target_priority)
+            work_scheduler.run(lambda worker, row: worker.process_target(row, worker.worker_number, progress), setup, teardown)
+
+            stats = driver_pool.stats()
+            print(f"Driver pool: {stats['started']} started, {stats['recycled']} recycled, {stats['crashed']} crashed")
 
         except Exception as e:
             system.log_error(f"Error during batch processing: {e}")
         finally:
+            writer.close()
+            driver_pool.close()
             self.close_scraper()
 
     def main_sequential(self, scrape_targets):
@@ -537,13 +846,11 @@ class StatementsDataScraper:
     def main(self, thread=False):
         # Identify the scrape targets
         scrape_targets = self.identify_scrape_targets()
-        total_items = len(scrape_targets)
-        batch_size = int(total_items / settings.max_workers)
 
         if not scrape_targets.empty: 
             if thread:
                 # Run with threading
-                self.main_thread(scrape_targets, total_items, batch_size)
+                self.main_thread(scrape_targets)
             else:
                 # Run sequentially
                 self.main_sequential(scrape_targets)  # Pass only scrape_targets
@@ -560,9 +867,14 @@ class StatementsDataScraper:
             scraper.close_scraper()
 
     def close_scraper(self):
-        """Close the WebDriver."""
-        if self.driver:
+        """Close the WebDriver, the HTTP session and the page cache."""
+        if self.pooled_driver is not None:
+            self.release_driver()
+        elif self.driver:
             self.driver.quit()
+        if self.http_extractor is not None:
+            self.http_extractor.close()
+        self.page_cache.close()
 
 if __name__ == "__main__":
     try:
@@ -3,13 +3,17 @@ import pandas as pd
 import numpy as np
 import sqlite3
 import time
-import re
+import json
+import hashlib
 
 import plotly.express as px
 
 from utils import system
 from utils import settings
+from utils import storage
 from utils import intel
+from utils import criteria_engine
+from utils import change_detection
 
 
 class StandardizedReport:
@@ -27,24 +31,21 @@ class StandardizedReport:
         except Exception as e:
             system.log_error(f"Error initializing StandardizedReport: {e}")
 
-    def load_data(self, files):
+    def load_data(self, files, columns=None, years=None):
         """
         Load financial data from the database and process it into DataFrames.
         
         Args:
             files (str): The name part of the database file to load.
+            columns (list): The columns to read. None reads all of them.
+            years (list): The quarter years to read. None reads every year.
 
         Returns:
             dict: A dictionary where keys are sectors and values are DataFrames containing the NSD data for that sector.
         """
         try:
-            db_file = os.path.join(self.db_folder, f"{settings.db_name.split('.')[0]} {files}.db")
-            conn = sqlite3.connect(db_file)
-            cursor = conn.cursor()
-
-            # Fetch all table names excluding internal SQLite tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-            tables = cursor.fetchall()
+            store = storage.get_store(files)
+            tables = store.sectors()  # Sector table names
 
             dfs = {}
             total_lines = 0
@@ -52,10 +53,9 @@ class StandardizedReport:
             print(files)
 
             # Iterate through each table (sector) and process the data
-            for i, table in enumerate(tables):
+            for i, sector in enumerate(tables):
                 try:
-                    sector = table[0]
-                    df = pd.read_sql_query(f"SELECT * FROM {sector}", conn)
+                    df = store.read(sector, columns, years, versions='current')  # Latest versions of the requested columns and years
 
                     # Normalize date columns to datetime format
                     df['quarter'] = pd.to_datetime(df['quarter'], errors='coerce')
@@ -70,8 +70,6 @@ class StandardizedReport:
                     missing_account = df['account'].isna() | df['account'].str.strip().eq('')
                     df.loc[missing_account, 'account'] = '0'  # Set 'account' to '0' (as text) for these rows
 
-                    # Filter out only the latest versions for each group
-                    df, _ = self.filter_newer_versions(df)
                     dfs[sector] = df  # Store the DataFrame with the sector as the key
                     total_lines += len(df)  # Update the total number of processed lines
 
@@ -83,170 +81,59 @@ class StandardizedReport:
                     # break
 
                 except Exception as e:
-                    system.log_error(f"Error processing table {table}: {e}")
+                    system.log_error(f"Error processing table {sector}: {e}")
 
-            conn.close()
+            store.close()
             return dfs
 
         except Exception as e:
             system.log_error(f"Error loading existing financial statements: {e}")
             return {}
 
-    def filter_newer_versions(self, df):
-        """
-        Filter and keep only the newest data from groups of (company_name, quarter, type, frame, account).
-        
-        Args:
-            df (pd.DataFrame): DataFrame containing the financial statements data.
-
-        Returns:
-            pd.DataFrame: Filtered DataFrame with only the latest versions for each group.
-            pd.DataFrame: DataFrame containing duplicates that were not kept.
-        """
-        group_columns = ['company_name', 'quarter', 'type', 'frame', 'account']
-        version_column = 'version'
-
-        try:
-            # Sort and drop duplicates to keep the latest versions
-            df_sorted = df.sort_values(by=group_columns + [version_column], ascending=[True] * len(group_columns) + [False])
-            df_filtered = df_sorted.drop_duplicates(subset=group_columns, keep='first')
-
-            # Also return duplicates as an optional output
-            df_duplicates = df_sorted[df_sorted.duplicated(subset=group_columns, keep=False) & (df_sorted.duplicated(subset=group_columns + [version_column], keep=False) == False)]
-
-            return df_filtered, df_duplicates
-
-        except Exception as e:
-            system.log_error(f"Error during filtering newer versions: {e}")
-            return pd.DataFrame(columns=settings.statements_columns), pd.DataFrame(columns=settings.statements_columns)
-
-    def apply_criteria(self, df, criteria, sector, section_name, parent_mask=None, output_file='output.txt', parent_criteria_info=None):
+    def apply_criteria(self, df, criteria, sector, section_name, engine=None):
         """
         Applies a criterion and its sub-criteria to the DataFrame.
 
         Parameters:
             df (pd.DataFrame): The DataFrame to be modified.
             criteria (dict): A dictionary containing 'target', 'filter', and 'sub_criteria'.
-            parent_mask (pd.Series): Optional parent level mask to apply.
-            output_file (str): Path to the output file.
-            parent_criteria_info (list): List to keep track of parent criteria for output purposes.
+            engine (criteria_engine.CriteriaEngine): Optional engine already built for df, to reuse its cached filters.
 
         Returns:
             pd.DataFrame: The modified DataFrame.
         """
-        target = criteria['target']
-        filters = criteria['filter']
-        sub_criteria = criteria.get('sub_criteria', [])
-        
-        # Initialize the parent criteria info list if not provided
-        if parent_criteria_info is None:
-            parent_criteria_info = []
-
-        # Initialize the mask for the entire DataFrame or use the parent mask
-        base_mask = pd.Series([True] * len(df)) if parent_mask is None else parent_mask.copy()
-        mask = base_mask.copy()
-
-        # Append the current criteria to the parent criteria info
-        parent_criteria_info.append({'target': target, 'filters': filters})
-
-        crits = []
-
-        # Define a dictionary to map filter conditions to functions
-        condition_map = {
-            'equals': lambda col, val: col == val.lower(),
-            'not_equals': lambda col, val: col != val.lower(),
-            # 'startswith': lambda col, val: col.str.startswith(tuple(map(str.lower, val))),
-            'startswith': lambda col, val: col.astype(str).str.startswith(val),
-            'not_startswith': lambda col, val: ~col.str.startswith(tuple(map(str.lower, val))),
-            'endswith': lambda col, val: col.str.endswith(tuple(map(str.lower, val))),
-            'not_endswith': lambda col, val: ~col.str.endswith(tuple(map(str.lower, val))),
-            'contains_all': lambda col, val: col.apply(lambda x: all(term in x.lower() for term in val) if pd.notna(x) else False),
-            'contains_any': lambda col, val: col.str.contains('|'.join(map(re.escape, val)), case=False, na=False),
-            'contains_none': lambda col, val: ~col.str.contains('|'.join(map(re.escape, val)), case=False, na=False),
-            'not_contains': lambda col, val: col.apply(lambda x: not all(term in x.lower() for term in val) if pd.notna(x) else True),
-            'not_contains_any': lambda col, val: col.apply(lambda x: all(term not in x.lower() for term in val) if pd.notna(x) else True),
-            'level': lambda col, val: (col.str.count(r'\.') + 1) == int(val)  # Merged level filter for exact levels
-        }
-
-        # Apply each filter to the mask
-        for filter_column, filter_condition, filter_value in filters:
-            crits.append([filter_column, filter_condition, filter_value])
-
-            # Convert filter values to lists for conditions that need lists
-            if filter_condition in ['contains_any', 'contains_none', 'contains_all', 'not_contains_all']:
-                if not isinstance(filter_value, list):
-                    filter_value = [filter_value]
-
-            # df_column_lower = df[filter_column].str.lower() if df[filter_column].dtype == 'O' else df[filter_column]
-            df_column_lower = df[filter_column].str.lower().str.strip() if df[filter_column].dtype == 'O' else df[filter_column]
-
-            # Apply the filter condition using the mapping
-            if filter_condition in condition_map:
-                condition_mask = condition_map[filter_condition](df_column_lower, filter_value)
-                mask &= condition_mask
-            else:
-                raise ValueError(f"Unknown filter condition: {filter_condition}")
-
-        # Ensure 'account_standard', 'description_standard', 'standard_criteria', and 'items_match' columns exist
-        if 'account_standard' not in df.columns:
-            df['account_standard'] = ''
-        if 'description_standard' not in df.columns:
-            df['description_standard'] = ''
-        if 'standard_criteria' not in df.columns:
-            df['standard_criteria'] = ''
-        if 'items_match' not in df.columns:
-            df['items_match'] = ''
-
-        # Apply the target modifications to the DataFrame for the current mask
-        account, description = target.split(' - ')
-        df.loc[mask, 'account_standard'] = account
-        df.loc[mask, 'description_standard'] = description
-        df.loc[mask, 'standard_criteria'] = ' | '.join([f"{c[0]} {c[1]} {c[2]}" for c in crits])  # Add criteria details
-        
-        # Capture "contém itens como" (items that match the mask)
-        items_example = df.loc[mask, ['account', 'description']].drop_duplicates().apply(lambda row: f"{row['account']} - {row['description']}", axis=1).tolist()
-        df.loc[mask, 'items_match'] = ', '.join(items_example)
-
-        print(sector, section_name, f"{account} - {description}")
-        # print('Criteria Path:')
-        # for parent in parent_criteria_info:
-
-        #     print(f"  {parent['target']}")
-        #     for filt in parent['filters']:
-        #         print(f"    {filt}")
-            
-        # print('Contém itens como:')
-        # for item in items_example:
-        #     print(f"    {item}")
-
-        # print('\n\n')
-
-        # Recursively apply subcriteria using a new refined mask
-        for sub in sub_criteria:
-            # Create a new mask for sub-criteria by filtering the df with 'startswith' of the current filtered results
-            sub_accounts = df.loc[mask, 'account'].unique()
-            sub_mask = df['account'].apply(lambda x: any(x.startswith(acct) for acct in sub_accounts))
-            
-            self.apply_criteria(df, sub, sector, section_name, parent_mask=sub_mask, output_file=output_file, parent_criteria_info=parent_criteria_info.copy())
+        return self.apply_criteria_tree(df, [criteria], sector, section_name, engine=engine)
 
-        return df
-
-    def apply_criteria_tree(self, df, criteria_tree, sector, section_name, output_file='output.txt'):
+    def apply_criteria_tree(self, df, criteria_tree, sector, section_name, engine=None):
         """
-        Main function to apply a criteria tree to the DataFrame.
+        Main function to apply a criteria tree to the DataFrame, through the compiled criteria engine.
 
         Parameters:
             df (pd.DataFrame): The DataFrame to be modified.
             criteria_tree (list): List of criteria in a tree format.
-            output_file (str): Path to the output file.
+            engine (criteria_engine.CriteriaEngine): Optional engine already built for df, to reuse its cached filters.
 
         Returns:
             pd.DataFrame: The modified DataFrame after applying all criteria.
         """
-        for criteria in criteria_tree:
-            df = self.apply_criteria(df, criteria, sector, section_name, output_file=output_file)
-        return df
+        engine = engine or criteria_engine.CriteriaEngine(df)
+        return engine.apply_tree(criteria_tree, sector, section_name)
 
+    def get_standardization_sections(self):
+        """
+        Return the criteria trees of each section of the standard financial statements.
+
+        Returns:
+            dict: Criteria trees keyed by section name, in the order they are applied.
+        """
+        return {
+            'Composição do Capital': intel.section_0_criteria, 
+            'Balanço Patrimonial Ativo': intel.section_1_criteria,
+            'Balanço Patrimonial Passivo': intel.section_2_criteria,
+            'Demonstração do Resultado': intel.section_3_criteria,
+            'Demonstração de Fluxo de Caixa': intel.section_6_criteria,
+            'Demonstração de Valor Adiconado': intel.section_7_criteria,
+        }
 
     def generate_standard_financial_statements(self, df):
         """
@@ -265,14 +152,10 @@ class StandardizedReport:
         try:
             sector = df.iloc[0]['sector']
 
-            standardization_sections = {
-                'Composição do Capital': intel.section_0_criteria, 
-                'Balanço Patrimonial Ativo': intel.section_1_criteria,
-                'Balanço Patrimonial Passivo': intel.section_2_criteria,
-                'Demonstração do Resultado': intel.section_3_criteria,
-                'Demonstração de Fluxo de Caixa': intel.section_6_criteria,
-                'Demonstração de Valor Adiconado': intel.section_7_criteria,
-            }
+            standardization_sections = self.get_standardization_sections()
+
+            # One engine per sector, so every section shares the factorized columns and cached filters
+            engine = criteria_engine.CriteriaEngine(df, settings.standard_scope, audit=settings.standard_audit)
 
             start_time = time.time()
             total_sections = len(standardization_sections)
@@ -283,7 +166,10 @@ class StandardizedReport:
                 system.print_info(i, extra_info, start_time, total_sections)
 
                 # Call the apply_criteria_to_dataframe method for each section
-                df = self.apply_criteria_tree(df, criteria_tree, sector, section_name)
+                df = self.apply_criteria_tree(df, criteria_tree, sector, section_name, engine=engine)
+
+            if engine.audit:
+                self.save_audit(sector, engine.audit_records)
 
         except Exception as e:
             system.log_error(f"Error during generate_standard_financial_statements: {e}")
@@ -291,6 +177,42 @@ class StandardizedReport:
 
         return df
 
+    def save_audit(self, sector, records):
+        """
+        Save the provenance of a sector's standardization to the audit table of the main database, replacing
+        the records of its previous run.
+
+        Args:
+            sector (str): The sector.
+            records (list): The audit records of the criteria engine, one per node.
+
+        Returns:
+            int: The number of records saved.
+        """
+        try:
+            with sqlite3.connect(settings.db_path) as conn:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {settings.standard_audit_table} (
+                        sector TEXT,
+                        section TEXT,
+                        node INTEGER,
+                        account TEXT,
+                        description TEXT,
+                        criteria TEXT,
+                        rows INTEGER,
+                        items TEXT,
+                        PRIMARY KEY (sector, section, node)
+                    )
+                """)
+                conn.execute(f"DELETE FROM {settings.standard_audit_table} WHERE sector = ?", (sector,))
+                conn.executemany(f"INSERT INTO {settings.standard_audit_table} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 [(sector, r['section'], r['node'], r['account'], r['description'], r['criteria'], r['rows'], r['items']) for r in records])
+            return len(records)
+
+        except sqlite3.Error as e:
+            system.log_error(f"Error saving the standardization audit of {sector}: {e}")
+            return 0
+
     def standardize_data(self, dict_df):
         """
         Standardize data for all sectors in the provided dictionary of DataFrames.
@@ -308,6 +230,7 @@ class StandardizedReport:
             start_time = time.time()
             total = len(dict_df)
 
+            standardized = {}
             for i, (sector, df) in enumerate(dict_df.items()):
 
                 extra_info = [f'{sector}']
@@ -315,11 +238,71 @@ class StandardizedReport:
 
                 df = self.generate_standard_financial_statements(df)
 
+                # Sectors that failed come back without the standard columns and are left out
+                if 'account_standard' in df.columns:
+                    standardized[sector] = df
+
         except Exception as e:
             system.log_error(f"Error in standardize_data: {e}")
             return {}
 
-        return dict_df
+        return standardized
+
+    def criteria_fingerprint(self):
+        """
+        Hash the definition of every criteria tree, so a change to intel re-standardizes every filing.
+
+        Returns:
+            int: A signed 64-bit hash of the trees.
+        """
+        definition = json.dumps(self.get_standardization_sections(), sort_keys=True, ensure_ascii=False)
+        return int.from_bytes(hashlib.sha256(definition.encode('utf-8')).digest()[:8], 'little', signed=True)
+
+    def filing_fingerprints(self, df):
+        """
+        Fingerprint each filing of a sector from its math rows and the criteria, with ChangeDetector.group_fingerprints.
+
+        Args:
+            df (pd.DataFrame): The math statements of a sector.
+
+        Returns:
+            tuple: (filings, codes) where filings holds the scope columns and the 'fingerprint' of each filing,
+                   and codes gives the filing of each row.
+        """
+        columns = [column for column in settings.statements_columns if column in df.columns]
+        return change_detection.ChangeDetector.group_fingerprints(df, settings.standard_scope, columns, self.criteria_fingerprint())
+
+    def filter_changed_filings(self, dict_df, detector):
+        """
+        Keep only the filings whose fingerprint changed since they were last standardized. With settings.standard_audit
+        every filing is kept, since save_audit replaces the audit of the whole sector with the records of this run.
+
+        Args:
+            dict_df (dict): Math statements keyed by sector.
+            detector (change_detection.ChangeDetector): The detector holding the standardized filing fingerprints.
+
+        Returns:
+            tuple: (rows of the changed filings keyed by sector, the changed filings with their fingerprints keyed by sector)
+        """
+        dict_changed, dict_filings = {}, {}
+        try:
+            start_time = time.time()
+            for i, (sector, df) in enumerate(dict_df.items()):
+                filings, codes = self.filing_fingerprints(df)
+                is_new, is_changed = detector.detect(filings, scope=sector)
+                changed = np.arange(len(filings)) if settings.standard_audit else np.flatnonzero(is_new | is_changed)
+
+                if len(changed):
+                    dict_changed[sector] = df[np.isin(codes, changed)].reset_index(drop=True)
+                    dict_filings[sector] = filings.iloc[changed].reset_index(drop=True)
+
+                extra_info = [f'{sector}: {len(changed)} of {len(filings)} filings to standardize']
+                system.print_info(i, extra_info, start_time, len(dict_df))
+
+        except Exception as e:
+            system.log_error(f"Error filtering changed filings: {e}")
+
+        return dict_changed, dict_filings
 
     def sanitize_db(self, dict_df):
         """
@@ -345,7 +328,7 @@ class StandardizedReport:
                 df = df[df['account_standard'].str.strip() != '']
 
                 # Step 2: Drop the unnecessary columns
-                df = df.drop(columns=['account', 'description', 'standard_criteria', 'items_match'])
+                df = df.drop(columns=['account', 'description', 'standard_criteria', 'items_match'], errors='ignore')
 
                 # Step 3: Rename 'account_standard' to 'account' and 'description_standard' to 'description'
                 df = df.rename(columns={'account_standard': 'account', 'description_standard': 'description'})
@@ -365,13 +348,15 @@ class StandardizedReport:
             system.log_error(f"Error during DataFrame sanitization: {e}")
             return {}
 
-    def save_to_db(self, data_dict):
+    def save_to_db(self, data_dict, filings=None):
         """
         Save the transformed and sanitized data to the SQLite database, creating or replacing tables as necessary.
         Updates existing data and inserts new data.
 
         Args:
             data_dict (dict): Dictionary containing DataFrames of transformed data for each sector.
+            filings (dict): Optional filings re-standardized per sector; their previous rows are deleted first,
+                            so accounts they no longer map to do not linger.
         """
         try:
             # Construct the database path
@@ -408,6 +393,13 @@ class StandardizedReport:
                     """
                     cursor.execute(create_table_sql)
 
+                    # Drop the previous standardization of the filings being replaced
+                    if filings is not None and sector in filings:
+                        replaced = filings[sector][settings.standard_scope].copy()
+                        replaced['quarter'] = pd.to_datetime(replaced['quarter']).dt.strftime('%Y-%m-%d')
+                        cursor.executemany(f"DELETE FROM {table_name} WHERE company_name = ? AND quarter = ?",
+                                           list(replaced.itertuples(index=False, name=None)))
+
                     # Step 2: Insert or update data
                     insert_sql = f"""
                     INSERT INTO {table_name} 
@@ -435,8 +427,6 @@ class StandardizedReport:
                     extra_info = [f'{sector}: {len(df)}, {total_lines} lines']
                     system.print_info(i, extra_info, start_time, len(data_dict))
 
-                    df.to_csv(f'df_{sector}_standard.csv', index=False)
-
                 cursor.close()
 
             return data_dict
@@ -454,12 +444,25 @@ class StandardizedReport:
         """
         try:
             dict_df = self.load_data(settings.statements_file_math)
+
+            # Only the filings whose math rows or criteria changed are standardized again in incremental mode
+            detector, dict_filings = None, None
+            if settings.standard_incremental:
+                detector = change_detection.ChangeDetector(settings.statements_standard, settings.standard_scope, ['fingerprint'])
+                dict_df, dict_filings = self.filter_changed_filings(dict_df, detector)
+
             standardized_data = self.standardize_data(dict_df)
 
             standardized_data = self.sanitize_db(standardized_data)
 
             # Save standardized data to the database
-            standardized_data = self.save_to_db(standardized_data)
+            standardized_data = self.save_to_db(standardized_data, dict_filings)
+
+            # Remember the fingerprints only once the filings are safely stored
+            if detector is not None and standardized_data:
+                for sector in standardized_data:
+                    detector.remember(dict_filings[sector], scope=sector)
+                print(f"Standardized filings: {detector.stats()}")
 
             return standardized_data
 
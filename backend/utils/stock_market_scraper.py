@@ -7,6 +7,7 @@ import time
 from datetime import datetime
 from utils import system
 from utils import settings
+from utils import storage
 
 class StockMarketScraper:
     def __init__(self):
@@ -19,24 +20,21 @@ class StockMarketScraper:
         except Exception as e:
             system.log_error(f"Error initializing StockMarketScraper: {e}")
 
-    def load_data(self, files):
+    def load_data(self, files, columns=None, years=None):
         """
-        Load financial data from the SQLite database for a given file.
+        Load financial data for a given file from the storage of its stage.
         
         Args:
             files (str): The name part of the database file to load.
+            columns (list): The columns to read. None reads all of them.
+            years (list): The quarter years to read. None reads every year.
 
         Returns:
             dict: A dictionary where keys are sectors and values are DataFrames containing the NSD data.
         """
         try:
-            db_file = os.path.join(self.db_folder, f"{settings.db_name.split('.')[0]} {files}.db")
-            conn = sqlite3.connect(db_file)
-            cursor = conn.cursor()
-
-            # Fetch all table names, ignoring internal SQLite tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-            tables = cursor.fetchall()
+            store = storage.get_store(files)
+            tables = store.sectors()  # Sector table names
 
             dfs = {}
             total_lines = 0
@@ -45,10 +43,9 @@ class StockMarketScraper:
             print(files)  # Output the current file being processed
 
             # Iterate over each table and process the data
-            for i, table in enumerate(tables):
+            for i, sector in enumerate(tables):
                 try:
-                    sector = table[0]  # Get the sector name
-                    df = pd.read_sql_query(f"SELECT * FROM {sector}", conn)  # Load the table into a DataFrame
+                    df = store.read(sector, columns, years)  # Load only the requested columns and years
 
                     # Clean and normalize the data
                     df['quarter'] = pd.to_datetime(df['quarter'], errors='coerce')  # Normalize date columns
@@ -67,9 +64,9 @@ class StockMarketScraper:
                     system.print_info(i, extra_info, start_time, len(tables))
 
                 except Exception as e:
-                    system.log_error(f"Error processing table {table}: {e}")
+                    system.log_error(f"Error processing table {sector}: {e}")
 
-            conn.close()  # Close the connection
+            store.close()  # Close the connection
             return dfs  # Return the dictionary of DataFrames
 
         except Exception as e:
@@ -0,0 +1,504 @@
+import os
+import time
+import shutil
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from utils import system
+from utils import settings
+from utils import watermark
+from utils import categories
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Raised when the 'is_current' rule or the layout of the Parquet copy changes, so copies made before are rebuilt
+copy_version = 2
+
+
+def typed(df, categorical=False):
+    """
+    Give the statements columns their types: datetime quarters, float values and, optionally, categorical text.
+
+    Parameters:
+    - df (DataFrame): The rows read from a sector.
+    - categorical (bool): Encode the text columns with the shared category registry.
+
+    Returns:
+    DataFrame: The same rows with typed 'quarter' and 'value' columns, when present.
+    """
+    if 'quarter' in df.columns:
+        df['quarter'] = pd.to_datetime(df['quarter'], errors='coerce')
+    if 'value' in df.columns:
+        df['value'] = pd.to_numeric(df['value'], errors='coerce').astype(float)
+    if categorical:
+        categories.registry.encode(df)
+    return df
+
+def is_current(df):
+    """
+    Flag the rows of an in-memory frame that no newer version of the same statement line replaces,
+    the same rule as the current-version view.
+
+    Versions compare as integers, with a missing version older than any other, and blank accounts belong to
+    the '0' line. Of the rows tied at the newest version, the last one in frame order, the highest rowid for
+    frames read from SQLite, is the current one.
+
+    Parameters:
+    - df (DataFrame): Statements with the settings.version_columns and 'version' columns.
+
+    Returns:
+    ndarray: True for exactly one row of each (company_name, quarter, type, frame, account).
+    """
+    if df.empty:
+        return np.zeros(0, dtype=bool)
+
+    # The same version rank as CAST(version AS INTEGER) in SQLite, with -1 for a missing version
+    version = df['version'].astype(object)
+    number = pd.to_numeric(version, errors='coerce').to_numpy(dtype=float)
+    rank = np.where(version.isna().to_numpy(), -1, np.trunc(np.nan_to_num(number, nan=0.0)))
+
+    lines = df[settings.version_columns].copy()
+    account = lines['account'].astype(object)
+    lines['account'] = account.where(~(account.isna() | account.astype(str).str.strip().eq('')), '0')
+    groups = lines.groupby(settings.version_columns, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+
+    # Sort by line, then version, then position: the last row of each line is its current one
+    order = np.lexsort((np.arange(len(df)), rank, groups))
+    is_last = np.ones(len(df), dtype=bool)
+    is_last[:-1] = groups[order][1:] != groups[order][:-1]
+
+    current = np.zeros(len(df), dtype=bool)
+    current[order[is_last]] = True
+    return current
+
+def latest_versions(df):
+    """
+    Keep the newest version of each statement line of an in-memory frame, for rows that did not come
+    through the current-version view.
+
+    Parameters:
+    - df (DataFrame): Statements with the settings.version_columns and 'version' columns.
+
+    Returns:
+    DataFrame: The rows no newer version replaces.
+    """
+    return df[is_current(df)]
+
+class SqliteStore:
+    """
+    Reads the sector tables of one of the per-stage SQLite files, for example 'b3 statements.db'.
+
+    Each sector table gets a '<sector>_current' view that drops the rows of a statement line with a newer version,
+    backed by an index on the version columns, so readers never sort whole tables in pandas to drop old versions.
+    """
+
+    def __init__(self, files):
+        """
+        Open the database file of a stage.
+
+        Parameters:
+        - files (str): The name part of the database file, for example settings.statements_file.
+        """
+        self.files = files
+        self.db_path = os.path.join(settings.db_folder, f"{settings.db_name.split('.')[0]} {files}.db")
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.views = set()
+
+    def sectors(self):
+        """
+        List the sector tables.
+
+        Returns:
+        list: The table names, excluding internal SQLite tables.
+        """
+        rows = self.conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name != ?;", (settings.change_table,)).fetchall()
+        return [row[0] for row in rows]
+
+    def mark(self, sector):
+        """
+        Return the (max rowid, row count, rewrites) of a sector table, which changes whenever rows are added,
+        deleted or rewritten in place.
+
+        Parameters:
+        - sector (str): The sector table name.
+
+        Returns:
+        tuple: (max rowid, row count, rewrites)
+        """
+        return watermark.table_mark(self.conn, sector)
+
+    def table_columns(self, sector):
+        """
+        List the columns of a sector table.
+
+        Parameters:
+        - sector (str): The sector table name.
+
+        Returns:
+        list: The column names, in table order.
+        """
+        return [row[1] for row in self.conn.execute(f"PRAGMA table_info({sector})").fetchall()]
+
+    @staticmethod
+    def line_column(alias, column):
+        """
+        Return the SQL expression of a statement line column, with blank accounts read as the '0' account.
+
+        Parameters:
+        - alias (str): The table alias, or '' for none.
+        - column (str): The column name.
+
+        Returns:
+        str: The expression.
+        """
+        name = f"{alias}.{column}" if alias else column
+        if column == 'account':
+            return f"(CASE WHEN TRIM(COALESCE({name}, '')) = '' THEN '0' ELSE {name} END)"
+        return name
+
+    @staticmethod
+    def version_rank(alias):
+        """
+        Return the SQL expression ranking the versions as integers, with a missing version older than any other.
+
+        Parameters:
+        - alias (str): The table alias, or '' for none.
+
+        Returns:
+        str: The expression.
+        """
+        name = f"{alias}.version" if alias else 'version'
+        return f"COALESCE(CAST({name} AS INTEGER), -1)"
+
+    def newer_version_condition(self, sector):
+        """
+        Build the condition that holds when a row of a sector has a newer version.
+
+        Versions are compared as numbers, so version 10 is newer than version 9, and of the rows tied at the same
+        version the one with the highest rowid wins, so exactly one row of each statement line is current. Blank
+        accounts are the same line as the '0' account. The condition is answered from the version index without
+        touching the table rows.
+
+        Parameters:
+        - sector (str): The sector table name.
+
+        Returns:
+        str: An EXISTS condition on the row aliased 't'.
+        """
+        same_line = ' AND '.join(f"{self.line_column('n', column)} IS {self.line_column('t', column)}" for column in settings.version_columns)
+        newer = f"({self.version_rank('n')} > {self.version_rank('t')} OR ({self.version_rank('n')} = {self.version_rank('t')} AND n.rowid > t.rowid))"
+        return f"EXISTS (SELECT 1 FROM {sector} n WHERE {same_line} AND {newer})"
+
+    def current_view(self, sector):
+        """
+        Create the current-version view of a sector and its supporting index, if they do not exist yet.
+
+        Views and indexes made by an older rule are dropped and made again.
+
+        Parameters:
+        - sector (str): The sector table name.
+
+        Returns:
+        str: The view name.
+        """
+        view = f"{sector}{settings.current_view_suffix}"
+        if view not in self.views:
+            columns = ', '.join(self.table_columns(sector))
+            index_sql = (f"CREATE INDEX IF NOT EXISTS {sector}_version_lines ON {sector} "
+                         f"({', '.join(self.line_column('', column) for column in settings.version_columns)}, {self.version_rank('')})")
+            view_sql = f"CREATE VIEW {view} AS SELECT {columns} FROM {sector} t WHERE NOT {self.newer_version_condition(sector)}"
+
+            stored = self.conn.execute("SELECT sql FROM sqlite_master WHERE type='view' AND name = ?", (view,)).fetchone()
+            with self.conn:
+                self.conn.execute(f"DROP INDEX IF EXISTS {sector}_versions")  # Index of the rule before ties and blank accounts
+                self.conn.execute(index_sql)
+                if stored is None or stored[0] != view_sql:
+                    self.conn.execute(f"DROP VIEW IF EXISTS {view}")
+                    self.conn.execute(view_sql)
+            self.views.add(view)
+        return view
+
+    def read(self, sector, columns=None, years=None, categorical=False, versions='all'):
+        """
+        Read a sector table.
+
+        Parameters:
+        - sector (str): The sector table name.
+        - columns (list): The columns to read. None reads all of them.
+        - years (list): The quarter years to read. None reads every year.
+        - categorical (bool): Encode the text columns with the shared category registry.
+        - versions (str): 'all' rows, only the 'current' version of each statement line, or only the 'superseded' ones.
+
+        Returns:
+        DataFrame: The rows, with typed 'quarter' and 'value' columns.
+        """
+        select = ', '.join(columns) if columns else ', '.join(self.table_columns(sector))
+        conditions, params = [], []
+
+        if versions == 'current':
+            source = self.current_view(sector)
+        elif versions == 'superseded':
+            self.current_view(sector)  # Creates the version index
+            source = f"{sector} t"
+            conditions.append(self.newer_version_condition(sector))
+        else:
+            source = sector
+
+        if years is not None:
+            conditions.append(f"substr(quarter, 1, 4) IN ({', '.join('?' for _ in years)})")
+            params = [str(year) for year in years]
+
+        query = f"SELECT {select} FROM {source}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return typed(pd.read_sql_query(query, self.conn, params=params), categorical)
+
+    def superseded(self, sector, columns=None, years=None, categorical=False):
+        """
+        Read the rows replaced by a newer version of the same statement line. Only computed when asked for.
+
+        Parameters:
+        - sector (str): The sector table name.
+        - columns (list): The columns to read. None reads all of them.
+        - years (list): The quarter years to read. None reads every year.
+        - categorical (bool): Encode the text columns with the shared category registry.
+
+        Returns:
+        DataFrame: The superseded rows.
+        """
+        return self.read(sector, columns, years, categorical, versions='superseded')
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        self.conn.close()
+
+class ParquetStore:
+    """
+    Reads a columnar copy of the sector tables of a stage, stored as Parquet files partitioned by sector and year.
+
+    Meant for readers that load a stage many times without writing it, such as the plots: the stages read the
+    tables they just wrote through SqliteStore, since any change rebuilds the whole copy of a sector.
+
+    The SQLite files stay the place every stage writes to; the copy of a sector is rebuilt from its table when
+    the table changed since the copy was made, which is tracked with the watermarks of the 'parquet <files> v<copy_version>' stage.
+    The watermark counts the rows rewritten in place, so upserts that correct a value also refresh the copy.
+    Quarters are stored as timestamps and values as floats, and a read only touches the columns and the year
+    partitions it asks for. Every row carries an 'is_current' flag, so current and superseded rows are a filter away.
+    """
+
+    def __init__(self, files):
+        """
+        Open the copy of a stage and its SQLite source.
+
+        Parameters:
+        - files (str): The name part of the database file, for example settings.statements_file.
+        """
+        self.files = files
+        self.folder = os.path.join(settings.storage_folder, files)
+        self.stage = f"parquet {files} v{copy_version}"
+        self.source = SqliteStore(files)
+        self.marks = watermark.load_watermarks(self.stage)
+
+    def sectors(self):
+        """
+        List the sector tables of the SQLite source.
+
+        Returns:
+        list: The sector table names.
+        """
+        return self.source.sectors()
+
+    def sector_folder(self, sector):
+        """
+        Return the folder holding the year partitions of a sector.
+
+        Parameters:
+        - sector (str): The sector table name.
+
+        Returns:
+        str: The folder path.
+        """
+        return os.path.join(self.folder, sector)
+
+    def export(self, sector, mark):
+        """
+        Rebuild the copy of a sector from its SQLite table, one Parquet file per quarter year.
+
+        The new copy is written next to the old one and swapped in once complete, so an interrupted export
+        leaves the previous copy readable.
+
+        Parameters:
+        - sector (str): The sector table name.
+        - mark (tuple): The (max rowid, row count, rewrites) of the table being exported.
+
+        Returns:
+        int: The number of rows exported.
+        """
+        df = self.source.read(sector)
+        df['year'] = df['quarter'].dt.year.fillna(0).astype(int)
+        df['is_current'] = is_current(df)
+
+        # Text columns are stored as strings even when SQLite handed back mixed types
+        for column in df.columns:
+            if df[column].dtype == object:
+                df[column] = df[column].astype('string')
+
+        folder = self.sector_folder(sector)
+        temp_folder = f"{folder}.tmp"
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        os.makedirs(temp_folder, exist_ok=True)
+
+        # Without the pandas metadata the strings read back as plain object columns, as from SQLite
+        table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+        pq.write_to_dataset(table, root_path=temp_folder, partition_cols=['year'])
+
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(temp_folder, folder)
+
+        self.marks[sector] = tuple(mark)
+        watermark.save_watermarks(self.stage, {sector: tuple(mark)})
+        return len(df)
+
+    def refresh(self, sector):
+        """
+        Rebuild the copy of a sector if its SQLite table changed since the last export.
+
+        Parameters:
+        - sector (str): The sector table name.
+
+        Returns:
+        bool: True if the copy was rebuilt.
+        """
+        mark = tuple(self.source.mark(sector))
+        if self.marks.get(sector) == mark and os.path.isdir(self.sector_folder(sector)):
+            return False
+
+        start_time = time.time()
+        rows = self.export(sector, mark)
+        print(f"{sector}: exported {rows} rows of {self.files} to Parquet in {time.time() - start_time:.1f}s")
+        return True
+
+    def read(self, sector, columns=None, years=None, categorical=False, versions='all'):
+        """
+        Read a sector from its columnar copy, refreshing the copy first if needed.
+
+        Parameters:
+        - sector (str): The sector table name.
+        - columns (list): The columns to read. None reads all of them.
+        - years (list): The quarter years to read; the other year partitions are skipped. None reads every year.
+        - categorical (bool): Encode the text columns with the shared category registry.
+        - versions (str): 'all' rows, only the 'current' version of each statement line, or only the 'superseded' ones.
+
+        Returns:
+        DataFrame: The rows, with typed 'quarter' and 'value' columns.
+        """
+        self.refresh(sector)
+
+        dataset = ds.dataset(self.sector_folder(sector), format='parquet', partitioning='hive')
+        if 'is_current' not in dataset.schema.names:
+            # Copy made before the current versions were marked
+            self.export(sector, self.source.mark(sector))
+            dataset = ds.dataset(self.sector_folder(sector), format='parquet', partitioning='hive')
+        names = [name for name in dataset.schema.names if name not in ('year', 'is_current')]
+
+        expression = None
+        if years is not None:
+            expression = ds.field('year').isin([int(year) for year in years])
+        if versions in ('current', 'superseded'):
+            version_expression = ds.field('is_current') if versions == 'current' else ~ds.field('is_current')
+            expression = version_expression if expression is None else expression & version_expression
+
+        table = dataset.to_table(columns=list(columns) if columns else names, filter=expression)
+        return typed(table.to_pandas(), categorical)
+
+    def superseded(self, sector, columns=None, years=None, categorical=False):
+        """
+        Read the rows replaced by a newer version of the same statement line. Only computed when asked for.
+
+        Parameters:
+        - sector (str): The sector table name.
+        - columns (list): The columns to read. None reads all of them.
+        - years (list): The quarter years to read. None reads every year.
+        - categorical (bool): Encode the text columns with the shared category registry.
+
+        Returns:
+        DataFrame: The superseded rows.
+        """
+        return self.read(sector, columns, years, categorical, versions='superseded')
+
+    def close(self):
+        """
+        Close the SQLite source.
+        """
+        self.source.close()
+
+def get_store(files, backend=None):
+    """
+    Open the storage of a stage.
+
+    Parameters:
+    - files (str): The name part of the database file, for example settings.statements_file.
+    - backend (str): 'parquet' or 'sqlite'. Defaults to settings.storage_backend.
+
+    Returns:
+    SqliteStore or ParquetStore: The store. Falls back to SQLite when pyarrow is not installed.
+    """
+    backend = backend or settings.storage_backend
+    if backend == 'parquet':
+        if pa is not None:
+            return ParquetStore(files)
+        system.log_error("pyarrow is not installed, reading the SQLite files instead of the Parquet copy")
+    return SqliteStore(files)
+
+def load_frames(files, columns=None, years=None, categorical=True, backend=None, versions='all'):
+    """
+    Load every sector of a stage with typed columns, the shared loader for readers that need the whole stage.
+
+    With categorical text columns each sector is encoded as soon as it is read, so only one sector is ever held
+    as Python strings, and all sectors end up with the same dictionaries.
+
+    Parameters:
+    - files (str): The name part of the database file, for example settings.statements_standard.
+    - columns (list): The columns to read. None reads all of them.
+    - years (list): The quarter years to read. None reads every year.
+    - categorical (bool): Encode the text columns with the shared category registry.
+    - backend (str): 'parquet' or 'sqlite'. Defaults to settings.storage_backend.
+    - versions (str): 'all' rows, only the 'current' version of each statement line, or only the 'superseded' ones.
+
+    Returns:
+    dict: DataFrames keyed by sector.
+    """
+    dfs = {}
+    try:
+        store = get_store(files, backend)
+        sectors = store.sectors()
+        total_lines = 0
+        start_time = time.time()
+
+        for i, sector in enumerate(sectors):
+            try:
+                dfs[sector] = store.read(sector, columns, years, categorical, versions)
+                total_lines += len(dfs[sector])
+
+                extra_info = [f'Loaded {len(dfs[sector])} items from {sector} in {files}, total {total_lines}']
+                system.print_info(i, extra_info, start_time, len(sectors))
+            except Exception as e:
+                system.log_error(f"Error loading {sector} from {files}: {e}")
+
+        store.close()
+
+    except Exception as e:
+        system.log_error(f"Error loading {files}: {e}")
+
+    if categorical:
+        categories.registry.align(dfs)
+    return dfs
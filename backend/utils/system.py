@@ -15,6 +15,7 @@ import pyautogui
 import time
 import random
 import sqlite3
+import os
 
 from utils import settings
 
@@ -371,3 +372,68 @@ def db_optimize(db_path=settings.db_path):
 
     except sqlite3.Error as e:
         print(f"An error occurred during database optimization: {e}")
+
+def db_connect(db_path, timeout=30):
+    """
+    Open an SQLite connection tuned for bulk writes: WAL journaling and synchronous=NORMAL.
+
+    Parameters:
+    db_path (str): The file path to the SQLite database.
+    timeout (float): Seconds to wait for a lock held by another connection.
+
+    Returns:
+    sqlite3.Connection: The open connection.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+last_backup = {}  # Time of the last backup per database path
+backup_lock = threading.Lock()
+
+def db_backup(db_path, backup_path=None, interval=None):
+    """
+    Snapshot an SQLite database with the online backup API, at most once per interval.
+
+    Unlike a file copy, the backup is consistent while other connections keep writing,
+    and callers can ask for it on every save without paying for a full copy each time.
+
+    Parameters:
+    db_path (str): The file path to the SQLite database.
+    backup_path (str): The file path of the snapshot. Defaults to '<name> backup.db' next to the database.
+    interval (float): Minimum seconds between two snapshots of the same database. 0 always snapshots.
+                      Defaults to settings.backup_interval.
+
+    Returns:
+    str: The backup path if a snapshot was taken, None otherwise.
+    """
+    if not os.path.exists(db_path):
+        return None
+
+    interval = settings.backup_interval if interval is None else interval
+    if backup_path is None:
+        base, extension = os.path.splitext(db_path)
+        backup_path = f"{base} {settings.backup_name}{extension}"
+
+    # Skip the snapshot if the last one is recent enough
+    with backup_lock:
+        now = time.time()
+        if now - last_backup.get(db_path, 0) < interval:
+            return None
+        last_backup[db_path] = now
+
+    try:
+        source = sqlite3.connect(db_path, timeout=30)
+        target = sqlite3.connect(backup_path)
+        try:
+            # One step reads a consistent snapshot; with WAL journaling writers are not blocked meanwhile
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return backup_path
+
+    except sqlite3.Error as e:
+        log_error(f"Error backing up {db_path}: {e}")
+        return None
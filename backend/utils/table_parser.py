@@ -0,0 +1,83 @@
+import re
+
+import pandas as pd
+from lxml import html as lxml_html
+
+from utils import settings
+
+# Same whitespace cleanup pd.read_html applies, so descriptions keep matching the stored keys
+whitespace_pattern = re.compile(r"[\r\n]+|\s{2,}")
+
+
+def parse_br_numbers(values):
+    """
+    Convert Brazilian formatted numbers ('1.234.567,89') into floats in one vectorized pass.
+
+    Parameters:
+    - values (list or Series): The raw cell texts.
+
+    Returns:
+    numpy.ndarray: The values as floats. Empty cells become 0 and unparseable cells NaN.
+    """
+    col = pd.Series(values, dtype=object).astype(str).str.strip()
+    col = col.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    col = col.mask(col == '', '0')
+    return pd.to_numeric(col, errors='coerce').to_numpy(dtype=float)
+
+def read_table_rows(html_content, table_xpath=None, columns=3):
+    """
+    Walk the data table once and collect the whitespace-cleaned text of its first cells.
+
+    Parameters:
+    - html_content (str): The HTML source of the frame.
+    - table_xpath (str): XPath of the data table, settings.financial_table_xpath by default. The first table of the page is used if it is absent.
+    - columns (int): Number of leading cells kept from each row.
+
+    Returns:
+    tuple: (tree, rows) where rows is a list of cell text lists, header row included.
+    """
+    tree = lxml_html.fromstring(html_content)
+    tables = tree.xpath(table_xpath or settings.financial_table_xpath) or tree.xpath('(//table)[1]')
+    if not tables:
+        return tree, []
+
+    rows = []
+    for tr in tables[0].iter('tr'):
+        cells = [whitespace_pattern.sub(' ', cell.text_content()).strip() for cell in tr if cell.tag in ('td', 'th')][:columns]
+        if cells:
+            rows.append(cells + [''] * (columns - len(cells)))
+
+    return tree, rows
+
+def parse_financial_table(html_content, thousand_word='Mil', drop_items='3.99'):
+    """
+    Parse a financial statement frame in a single pass into typed account, description and value columns.
+
+    Parameters:
+    - html_content (str): The HTML source of the frame.
+    - thousand_word (str): Word in the table title that marks values in thousands.
+    - drop_items (str): Account prefix of the rows to drop.
+
+    Returns:
+    DataFrame: The account and description as strings and the value as float, or None if the frame has no title.
+    """
+    tree, rows = read_table_rows(html_content)
+
+    # Step 1: Read the thousands multiplier from the table title
+    title = tree.xpath(settings.financial_title_xpath)
+    if not title:
+        return None
+    thousand = 1000 if thousand_word in title[0].text_content() else 1
+
+    # Step 2: Build the columns from the rows below the header, keeping the accounts as text even when there are none
+    account, description, value = (list(col) for col in zip(*rows[1:])) if len(rows) > 1 else ([], [], [])
+    df = pd.DataFrame({
+        settings.financial_statements_columns[0]: pd.Series(account, dtype=object),
+        settings.financial_statements_columns[1]: pd.Series(description, dtype=object),
+        settings.financial_statements_columns[2]: parse_br_numbers(value) * thousand,
+    })
+
+    # Step 3: Drop the unwanted accounts
+    df = df[~df[settings.financial_statements_columns[0]].str.startswith(drop_items)]
+
+    return df.reset_index(drop=True)
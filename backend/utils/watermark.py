@@ -0,0 +1,122 @@
+import sqlite3
+from datetime import datetime
+
+from utils import system
+from utils import settings
+
+
+def track_changes(conn, table):
+    """
+    Make sure the rows of a table rewritten in place are counted in the change table.
+
+    An upsert that updates an existing row keeps its rowid and the row count, so a trigger counts every update
+    that changes a value; upserts writing the same values again are not counted. When the trigger is missing,
+    for a new table or one that was rebuilt, it is created and the counter bumped, since changes made before
+    it existed were not seen.
+
+    Parameters:
+    conn (sqlite3.Connection): The connection to the database holding the table.
+    table (str): The table name.
+    """
+    trigger = f"{table}_rewrites"
+    with conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {settings.change_table} (table_name TEXT PRIMARY KEY, rewrites INTEGER)")
+        conn.execute(f"INSERT OR IGNORE INTO {settings.change_table} (table_name, rewrites) VALUES (?, 0)", (table,))
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name = ?", (trigger,)).fetchone():
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+            changed = ' OR '.join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+            conn.execute(f"""
+                CREATE TRIGGER {trigger} AFTER UPDATE ON {table} WHEN {changed}
+                BEGIN
+                    UPDATE {settings.change_table} SET rewrites = rewrites + 1 WHERE table_name = '{table}';
+                END
+            """)
+            conn.execute(f"UPDATE {settings.change_table} SET rewrites = rewrites + 1 WHERE table_name = ?", (table,))
+
+def table_mark(conn, table):
+    """
+    Return the watermark of a table as it is now, starting to track its rewrites if needed.
+
+    Parameters:
+    conn (sqlite3.Connection): The connection to the database holding the table.
+    table (str): The table name.
+
+    Returns:
+    tuple: (max rowid, row count, rewrites)
+    """
+    track_changes(conn, table)
+    max_rowid, row_count = conn.execute(f"SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM {table}").fetchone()
+    rewrites = conn.execute(f"SELECT rewrites FROM {settings.change_table} WHERE table_name = ?", (table,)).fetchone()[0]
+    return max_rowid, row_count, rewrites
+
+def load_watermarks(stage, db_path=None):
+    """
+    Load the watermarks a processing stage saved for each sector table.
+
+    A watermark is the highest rowid of the source table that the stage has processed, together with
+    the row count of the table at that time, used to detect renumbered or deleted rows, and the number
+    of rows rewritten in place, used to detect corrected values.
+
+    Parameters:
+    stage (str): The processing stage, for example 'math'.
+    db_path (str): The database holding the watermarks table. Defaults to settings.db_path.
+
+    Returns:
+    dict: (row_id, row_count, rewrites) keyed by sector table name. Rewrites is None for watermarks saved before they were counted.
+    """
+    db_path = db_path or settings.db_path
+    try:
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {settings.watermark_table} (
+                    stage TEXT,
+                    sector TEXT,
+                    row_id INTEGER,
+                    row_count INTEGER,
+                    updated_at TEXT,
+                    rewrites INTEGER,
+                    PRIMARY KEY (stage, sector)
+                )
+            """)
+            # Watermarks tables made before the rewrites were counted
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({settings.watermark_table})").fetchall()]
+            if 'rewrites' not in columns:
+                conn.execute(f"ALTER TABLE {settings.watermark_table} ADD COLUMN rewrites INTEGER")
+            rows = conn.execute(f"SELECT sector, row_id, row_count, rewrites FROM {settings.watermark_table} WHERE stage = ?", (stage,)).fetchall()
+        return {sector: (row_id, row_count, rewrites) for sector, row_id, row_count, rewrites in rows}
+
+    except sqlite3.Error as e:
+        system.log_error(f"Error loading {stage} watermarks: {e}")
+        return {}
+
+def save_watermarks(stage, marks, db_path=None):
+    """
+    Save the watermarks of a processing stage once its output is safely stored.
+
+    Parameters:
+    stage (str): The processing stage, for example 'math'.
+    marks (dict): (row_id, row_count, rewrites) keyed by sector table name.
+    db_path (str): The database holding the watermarks table. Defaults to settings.db_path.
+
+    Returns:
+    dict: The saved watermarks.
+    """
+    db_path = db_path or settings.db_path
+    try:
+        load_watermarks(stage, db_path)  # Creates or upgrades the table
+        updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with sqlite3.connect(db_path) as conn:
+            conn.executemany(f"""
+                INSERT INTO {settings.watermark_table} (stage, sector, row_id, row_count, rewrites, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(stage, sector) DO UPDATE SET
+                row_id=excluded.row_id,
+                row_count=excluded.row_count,
+                rewrites=excluded.rewrites,
+                updated_at=excluded.updated_at
+            """, [(stage, sector, row_id, row_count, rewrites, updated_at) for sector, (row_id, row_count, rewrites) in marks.items()])
+        return marks
+
+    except sqlite3.Error as e:
+        system.log_error(f"Error saving {stage} watermarks: {e}")
+        return {}